@@ -0,0 +1,68 @@
+'''
+Compara a decodificação de datas/idades antiga (pd.to_datetime em todas as linhas) com a atual
+(transformations.parse_date e calculate_age, que convertem cada data distinta uma única vez).
+
+    python -m benchmarks.dates --rows 5000000
+'''
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from dataset_reader import transformations
+from dataset_reader.transformations import DATE_FORMAT
+
+
+def old_parse_date(values: pd.Series) -> pd.Series:
+    return pd.to_datetime(values.str.zfill(8), errors='coerce', format=DATE_FORMAT)
+
+
+def old_calculate_age(birthdate: pd.Series, relative_to: pd.Timestamp) -> pd.Series:
+    birthdate = birthdate.str.zfill(8)
+    birth = pd.to_datetime(birthdate, errors='coerce', format=DATE_FORMAT)
+    birth = birth.fillna(
+        pd.to_datetime('01' + birthdate.str[2:], format=DATE_FORMAT, errors='coerce') + pd.offsets.MonthEnd(0)
+    )
+
+    has_had_birthday = (relative_to.month > birth.dt.month) | ((relative_to.month == birth.dt.month) & (relative_to.day >= birth.dt.day))
+    return relative_to.year - birth.dt.year - (~has_had_birthday)
+
+
+def random_dates(rows: int, seed: int = 0) -> pd.Series:
+    '''Datas DDMMAAAA como na RAIS: sem o zero à esquerda do dia e com alguns dias inválidos (ex.: 31/02)'''
+    rng = np.random.default_rng(seed)
+    days = rng.integers(1, 32, rows)
+    months = rng.integers(1, 13, rows)
+    years = rng.integers(1940, 2005, rows)
+    return pd.Series([f'{d}{m:02d}{y}' for d, m, y in zip(days, months, years)])
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da decodificação de datas e idades')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    dates = random_dates(args.rows)
+    relative_to = pd.Timestamp(year=2019, month=12, day=31, hour=23, minute=59, second=59)
+    print(f'{args.rows} linhas, {dates.nunique()} datas distintas')
+
+    for name, old, new, extra in [
+        ('data', old_parse_date, transformations.parse_date, ()),
+        ('idade', old_calculate_age, transformations.calculate_age, (relative_to,)),
+    ]:
+        expected, old_time = timed(old, dates, *extra)
+        result, new_time = timed(new, dates, *extra)
+        pd.testing.assert_series_equal(expected, result, check_dtype=False)
+        print(f'{name}: antigo {old_time:.2f}s, atual {new_time:.2f}s ({old_time / new_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+'''
+Benchmark de ponta a ponta com arquivos sintéticos (ver synthetic.py): DatasetReader.read,
+read_and_save_chunks (e a versão paralela), os scripts de filtragem (um estado de um .7z, como em
+filtering.py, e uma região dividida por estado, como em filtering_2018up.py) e load_dataset.
+
+Cada caso roda em um processo novo, para que o pico de memória (RSS) seja só dele. Para cada caso são
+informados linhas/s, MB/s (do CSV descompactado), pico de RSS e tamanho da saída. Com --json os resultados
+são acrescentados a um arquivo JSON lines, e com --baseline são comparados com os de uma execução anterior.
+
+    python -m benchmarks.end_to_end --rows 1000000 --json resultados.jsonl
+    python -m benchmarks.end_to_end --rows 1000000 --baseline resultados.jsonl --cases read read_and_save_chunks
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import synthetic
+
+FILTERING_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'filtering')
+MB = 1 << 20
+
+ENGINE_CASES = ('read', 'read_and_save_chunks', 'read_and_save_chunks_parallel')
+CASES = (*ENGINE_CASES, 'filtering', 'filtering_2018up', 'load_dataset')
+
+
+class Inputs:
+    '''Arquivos sintéticos usados pelos casos, reaproveitados entre execuções com os mesmos parâmetros'''
+
+    def __init__(self, workdir: str, rows: int, state: str, state_year: int, region_states: list[str],
+                 region_year: int, seed: int):
+        self.workdir = workdir
+        self.rows = rows
+        self.state_year = state_year
+        self.region_year = region_year
+        self.region_states = region_states
+
+        prefix = os.path.join(workdir, f'{rows}_{seed}')
+        os.makedirs(prefix, exist_ok=True)
+        self.state_file = os.path.join(prefix, f'{state}{state_year}ID.txt')
+        self.region_file = os.path.join(prefix, f'REGIAO{region_year}ID.txt')
+
+        for path, year, states in [(self.state_file, state_year, [state]), (self.region_file, region_year, region_states)]:
+            if not os.path.exists(path):
+                print(f'gerando {os.path.basename(path)} ({rows} linhas)...')
+                synthetic.generate(path + '.tmp', rows, year, states, seed=seed)
+                os.replace(path + '.tmp', path)
+            if not os.path.exists(self.archive(path)):
+                synthetic.write_archive(path, self.archive(path) + '.tmp')
+                os.replace(self.archive(path) + '.tmp', self.archive(path))
+
+    @staticmethod
+    def archive(path: str) -> str:
+        return os.path.splitext(path)[0] + '.7z'
+
+
+def run_case(case: str, engine: str, inputs: Inputs, output_dir: str, chunk_size: int, workers: int,
+             memory_budget: int = None, pipelined: bool = False) -> dict:
+    '''Executado em um processo novo. Retorna linhas, bytes lidos, tempo, tamanho da saída e pico de RSS.'''
+    sys.path.insert(0, FILTERING_DIR)
+    from dataset_reader import DatasetReader, manifest
+
+    if case != 'load_dataset':
+        shutil.rmtree(output_dir, ignore_errors=True)
+    reader = DatasetReader()
+    input_bytes = os.path.getsize(inputs.state_file)
+    output_bytes = None
+    start = time.perf_counter()
+
+    if case == 'read':
+        df = reader.read(inputs.state_file, engine=engine)
+        rows, output_bytes = len(df), int(df.memory_usage(deep=True).sum())
+
+    elif case == 'read_and_save_chunks':
+        reader.read_and_save_chunks(inputs.state_file, output_dir, chunk_size=chunk_size, engine=engine,
+                                    memory_budget=memory_budget, pipelined=pipelined)
+        rows = manifest.Manifest.load(output_dir).rows
+
+    elif case == 'read_and_save_chunks_parallel':
+        reader.read_and_save_chunks_parallel(inputs.state_file, output_dir, chunk_size=chunk_size,
+                                             workers=workers, range_size=max(input_bytes // workers, 1), engine=engine)
+        rows = manifest.Manifest.load(output_dir).rows
+
+    elif case == 'filtering':
+        from helpers import open_inner_file
+
+        archive = inputs.archive(inputs.state_file)
+        inner_file = os.path.basename(inputs.state_file)
+        with open_inner_file(archive, inner_file) as inner_file_stream:
+            reader.read_and_save_chunks(inner_file_stream, output_dir, chunk_size=chunk_size, year=inputs.state_year,
+                                        source_info=manifest.describe_source(inner_file, archive=archive),
+                                        memory_budget=memory_budget, pipelined=pipelined)
+        rows = manifest.Manifest.load(output_dir).rows
+
+    elif case == 'filtering_2018up':
+        from helpers import open_inner_file
+        import filtering_2018up
+
+        archive = inputs.archive(inputs.region_file)
+        inner_file = os.path.basename(inputs.region_file)
+        input_bytes = os.path.getsize(inputs.region_file)
+        with open_inner_file(archive, inner_file) as inner_file_stream:
+            states = filtering_2018up.split_states(reader, inner_file_stream, output_dir, inputs.region_year,
+                                                   synthetic.city_codes(inputs.region_states), set(),
+                                                   source_info=manifest.describe_source(inner_file, archive=archive),
+                                                   memory_budget=memory_budget, pipelined=pipelined)
+        rows = sum(manifest.Manifest.load(os.path.join(output_dir, state)).rows for state in states)
+
+    elif case == 'load_dataset':
+        from pathlib import Path
+        import load_dataset_sample
+
+        # a árvore <ano>/<UF> é preparada fora da medição (ver prepare_load_dataset)
+        load_dataset_sample.FILTERED_DATA_DIR = Path(output_dir)
+        input_bytes = _directory_size(output_dir)
+        start = time.perf_counter()
+        df = load_dataset_sample.load_dataset(year=inputs.region_year)
+        rows, output_bytes = len(df), int(df.memory_usage(deep=True).sum())
+
+    else:
+        raise ValueError(f'Unknown case {case}')
+
+    seconds = time.perf_counter() - start
+    # maior processo: este ou um dos workers (read_and_save_chunks_parallel); ru_maxrss em KB no Linux
+    peak_rss = max(_peak_rss(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes if output_bytes is not None else _directory_size(output_dir),
+        'peak_rss': peak_rss,
+    }
+
+
+def prepare_load_dataset(inputs: Inputs, output_dir: str, chunk_size: int) -> None:
+    '''Gera filtrados/<ano>/<UF> a partir do arquivo da região, se ainda não existir'''
+    year_dir = os.path.join(output_dir, str(inputs.region_year))
+    if os.path.isdir(year_dir):
+        return
+
+    from dataset_reader import DatasetReader
+
+    city_to_state = synthetic.city_codes(inputs.region_states)
+    DatasetReader().read_and_save_split_chunks(inputs.region_file, year_dir + '.tmp',
+                                               lambda df: df['Municipio'].astype(str).map(city_to_state),
+                                               chunk_size=chunk_size, year=inputs.region_year)
+    os.replace(year_dir + '.tmp', year_dir)
+
+
+def measure(case: str, engine: str, inputs: Inputs, output_dir: str, chunk_size: int, workers: int,
+            memory_budget: int = None, pipelined: bool = False) -> dict:
+    # spawn: o processo não herda a memória já usada por este
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        result = executor.submit(run_case, case, engine, inputs, output_dir, chunk_size, workers,
+                                 memory_budget, pipelined).result()
+
+    return {
+        'case': case,
+        'engine': engine,
+        'chunk_size': chunk_size,
+        'memory_budget': memory_budget,
+        'pipelined': pipelined,
+        **result,
+        'rows_per_second': result['rows'] / result['seconds'],
+        'mb_per_second': result['input_bytes'] / MB / result['seconds'],
+    }
+
+
+def load_baseline(path: str) -> dict:
+    '''Último resultado de cada (caso, engine, linhas) em um arquivo gerado com --json'''
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            baseline[(result['case'], result['engine'], result['rows'])] = result
+    return baseline
+
+
+def print_result(result: dict, baseline: dict) -> None:
+    line = (f'{result["case"]:<30} {result["engine"]:<8} {result["rows"]:>10} {result["seconds"]:>8.2f}s '
+            f'{result["rows_per_second"]:>12,.0f} {result["mb_per_second"]:>8.1f} '
+            f'{result["peak_rss"] / MB:>10.0f} {result["output_bytes"] / MB:>9.1f}')
+
+    previous = baseline.get((result['case'], result['engine'], result['rows']))
+    if previous:
+        line += f'   {result["rows_per_second"] / previous["rows_per_second"]:.2f}x linhas/s, ' \
+                f'{result["peak_rss"] / previous["peak_rss"]:.2f}x RSS'
+    print(line)
+
+
+def _peak_rss() -> int:
+    '''
+    Pico de RSS deste processo. O ru_maxrss de RUSAGE_SELF não serve: no Linux ele é herdado através do exec,
+    então incluiria a memória do processo que iniciou este. O VmHWM do /proc começa do zero no exec.
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(FILTERING_DIR)).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ponta a ponta com arquivos sintéticos da RAIS')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('--engines', nargs='+', choices=['pandas', 'pyarrow'], default=['pandas', 'pyarrow'],
+                        help=f'engines de {", ".join(ENGINE_CASES)} (os scripts de filtragem usam pandas)')
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='memória de leitura em MB (memory_budget de read_and_save_chunks e da filtragem)')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='parse, transformação e escrita em threads separadas (pipelined de read_and_save_chunks)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--state', default='SP', choices=sorted(synthetic.UF_CODES))
+    parser.add_argument('--state-year', type=int, default=2010)
+    parser.add_argument('--region-states', nargs='+', default=['BA', 'PE', 'CE'], choices=sorted(synthetic.UF_CODES))
+    parser.add_argument('--region-year', type=int, default=2019)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'rais_benchmark'),
+                        help='onde ficam os arquivos sintéticos (reaproveitados) e as saídas')
+    parser.add_argument('--json', help='acrescenta os resultados a este arquivo (JSON lines)')
+    parser.add_argument('--baseline', help='arquivo gerado com --json para comparar')
+    args = parser.parse_args()
+
+    inputs = Inputs(args.workdir, args.rows, args.state, args.state_year, args.region_states, args.region_year, args.seed)
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    revision = _git_revision()
+
+    print(f'{"caso":<30} {"engine":<8} {"linhas":>10} {"tempo":>9} {"linhas/s":>12} {"MB/s":>8} '
+          f'{"RSS (MB)":>10} {"saída (MB)":>9}')
+
+    for case in args.cases:
+        engines = args.engines if case in ENGINE_CASES else ['pandas']
+        output_dir = os.path.join(args.workdir, 'saida', case)
+
+        if case == 'load_dataset':
+            prepare_load_dataset(inputs, output_dir, args.chunk_size)
+
+        for engine in engines:
+            memory_budget = int(args.memory_budget * MB) if args.memory_budget else None
+            result = measure(case, engine, inputs, output_dir, args.chunk_size, args.workers, memory_budget,
+                             args.pipelined)
+            result.update(revision=revision, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            print_result(result, baseline)
+
+            if args.json:
+                with open(args.json, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+
+        if case != 'load_dataset':
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+'''
+Compara a decodificação dos salários em float (transformations.parse_money, com precisão de float32)
+com a em centavos int64 (parse_money_cents), nas versões pandas e Arrow, e o erro das somas em float.
+
+    python -m benchmarks.money --rows 5000000
+'''
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dataset_reader import arrow_engine, transformations
+
+from .synthetic import _money
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da decodificação de salários')
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    salaries = rng.lognormal(7.5, 0.8, args.rows)
+    for zero_padded in (False, True):
+        values = pd.Series(_money(rng, salaries, zero_padded))
+        array = pa.array(values.to_numpy(), pa.string())
+        print(f'{args.rows} linhas{", com zeros à esquerda" if zero_padded else ""}')
+
+        floats, float_time = timed(transformations.parse_money, values)
+        cents, cents_time = timed(transformations.parse_money_cents, values)
+        _, arrow_float_time = timed(arrow_engine.parse_money, array)
+        arrow_cents, arrow_cents_time = timed(transformations.parse_money_cents, array)
+        assert (arrow_cents.to_numpy() == cents.to_numpy()).all()
+
+        valid = ~transformations.is_invalid_money(cents)
+        exact = int(cents[valid].sum())
+        error = abs(floats[valid].sum() * 100 - exact)
+        print(f'  pandas: float {float_time:.2f}s, centavos {cents_time:.2f}s ({float_time / cents_time:.1f}x)')
+        print(f'  Arrow:  float {arrow_float_time:.2f}s, centavos {arrow_cents_time:.2f}s '
+              f'({arrow_float_time / arrow_cents_time:.1f}x)')
+        print(f'  soma: {exact / 100:.2f}, erro em float {error:.0f} centavos')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+'''
+Gerador de arquivos falsos no formato da RAIS, para medir o desempenho sem os dados reais (que não são públicos).
+
+Escreve o .txt (CSV separado por ";" em latin-1) com os nomes de colunas de um dos layouts do
+DatasetReader.MAPPING_DATA e com os problemas de formatação dos arquivos reais: CPFs e CNPJs sem os zeros
+à esquerda, datas DDMMAAAA sem o zero do dia (e algumas com dia inválido), valores com vírgula e
+preenchidos com zeros, CNAEs e CBOs às vezes com pontuação. As cardinalidades imitam as reais: ~1300
+subclasses CNAE, ~2600 CBOs, os municípios de cada UF (com a capital concentrando os vínculos), um
+estabelecimento para cada ~15 vínculos e trabalhadores que aparecem em mais de um vínculo.
+
+    python -m benchmarks.synthetic --rows 1000000 --year 2010 --states SP --output SP2010ID.txt --archive
+    python -m benchmarks.synthetic --rows 1000000 --year 2019 --states BA PE CE --output NORDESTE2019ID.txt
+'''
+
+import os
+import argparse
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import py7zr
+
+from dataset_reader import DatasetReader
+
+# Código IBGE e número (aproximado) de municípios de cada UF
+UF_CODES = {
+    'RO': 11, 'AC': 12, 'AM': 13, 'RR': 14, 'PA': 15, 'AP': 16, 'TO': 17, 'MA': 21, 'PI': 22, 'CE': 23,
+    'RN': 24, 'PB': 25, 'PE': 26, 'AL': 27, 'SE': 28, 'BA': 29, 'MG': 31, 'ES': 32, 'RJ': 33, 'SP': 35,
+    'PR': 41, 'SC': 42, 'RS': 43, 'MS': 50, 'MT': 51, 'GO': 52, 'DF': 53,
+}
+CITIES_PER_UF = {
+    'RO': 52, 'AC': 22, 'AM': 62, 'RR': 15, 'PA': 144, 'AP': 16, 'TO': 139, 'MA': 217, 'PI': 224, 'CE': 184,
+    'RN': 167, 'PB': 223, 'PE': 185, 'AL': 102, 'SE': 75, 'BA': 417, 'MG': 853, 'ES': 78, 'RJ': 92, 'SP': 645,
+    'PR': 399, 'SC': 295, 'RS': 497, 'MS': 79, 'MT': 141, 'GO': 246, 'DF': 1,
+}
+
+CNAE_SUBCLASSES = 1300
+CBO_OCCUPATIONS = 2600
+ROWS_PER_ESTABLISHMENT = 15
+ROWS_PER_WORKER = 1.2
+BLOCK_SIZE = 200_000  # linhas geradas e escritas por vez
+
+# Nome da coluna no arquivo para cada coluna do DatasetReader, por layout. Colunas que não são lidas
+# (None na chave) existem nos arquivos reais e são descartadas pelo usecols.
+LAYOUTS = {
+    # até 2017, um arquivo por estado
+    'antigo': {
+        'Cpf': 'CPF', 'Nome': 'NOME', 'VinculoAtivo31/12': 'EMP EM 31/12', 'CnaeSubclasse20': 'SB CLAS 20',
+        'CboOcupacao2002': 'OCUP 2002', 'GrauInstrucao': 'GR INSTRUCAO', 'IsHomem': 'GENERO', 'RacaCor': 'RACA_COR',
+        'DataAdmissao': 'DT ADMISSAO', 'HorasContrato': 'HORAS CONTR', 'Idade': 'DT NASCIMENT',
+        'Municipio': 'MUNICIPIO', 'CNPJ': 'IDENTIFICAD', 'Tipodeficiencia': 'TP DEFIC',
+        'Nacionalidade': 'NACIONALIDAD', 'Afastamentocausa1': 'CAUS AFAST 1', 'Afastamentocausa2': 'CAUS AFAST 2',
+        'Afastamentocausa3': 'CAUS AFAST 3', 'Diasafastado': 'QT DIAS AFAS', 'Tiposalario': 'TIPO SAL',
+        'Tipovinculo': 'TP VINCULO', 'RemuneracaoDezembroR$': 'REM DEZ (R$)', 'RemuneracaoDezembro': 'REM DEZEMBRO',
+        'RemuneracaoMediaR$': 'REM MED (R$)', 'RemuneracaoMedia': 'REM MEDIA', 'SalarioContratual': 'SAL CONTR',
+        None: ['MES DESLIG', 'TIPO ADM', 'TAMESTAB', 'IBGE SUBSETOR', 'CLAS CNAE 95'],
+    },
+    # de 2018 em diante, um arquivo por região
+    'novo': {
+        'Cpf': 'CPF', 'Nome': 'Nome Trabalhador', 'VinculoAtivo31/12': 'Vínculo Ativo 31/12',
+        'CnaeSubclasse20': 'CNAE 2.0 Subclasse', 'CboOcupacao2002': 'CBO Ocupação 2002',
+        'GrauInstrucao': 'Escolaridade após 2005', 'IsHomem': 'Sexo Trabalhador', 'RacaCor': 'Raça Cor',
+        'DataAdmissao': 'Data Admissão Declarada', 'HorasContrato': 'Qtd Hora Contr', 'Idade': 'Data de Nascimento',
+        'Municipio': 'Município', 'CNPJ': 'CNPJ / CEI', 'Tipodeficiencia': 'Tipo Defic',
+        'Nacionalidade': 'Nacionalidade', 'Afastamentocausa1': 'Causa Afastamento 1',
+        'Afastamentocausa2': 'Causa Afastamento 2', 'Afastamentocausa3': 'Causa Afastamento 3',
+        'Diasafastado': 'Qtd Dias Afastamento', 'Tiposalario': 'Tipo Salário', 'Tipovinculo': 'Tipo Vínculo',
+        'RemuneracaoDezembroR$': 'Vl Remun Dezembro Nom', 'RemuneracaoDezembro': 'Vl Remun Dezembro (SM)',
+        'RemuneracaoMediaR$': 'Vl Remun Média Nom', 'RemuneracaoMedia': 'Vl Remun Média (SM)',
+        'SalarioContratual': 'Vl Salário Contratual',
+        None: ['Bairros SP', 'Faixa Etária', 'Mês Desligamento', 'Tipo Admissão', 'Tamanho Estabelecimento'],
+    },
+}
+
+FIRST_NAMES = ['MARIA', 'JOSÉ', 'ANA', 'JOÃO', 'ANTÔNIO', 'FRANCISCA', 'CARLOS', 'PAULO', 'LUCAS', 'JULIANA',
+               'MÁRCIA', 'LUÍS', 'FERNANDA', 'RAIMUNDO', 'SEBASTIÃO', 'CONCEIÇÃO', 'PEDRO', 'ADRIANA']
+LAST_NAMES = ['SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA', 'LIMA',
+              'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO', 'ARAÚJO', 'MELO', 'BARBOSA', 'CONCEIÇÃO']
+
+
+def layout_for_year(year: int) -> str:
+    return 'novo' if int(year) >= 2018 else 'antigo'
+
+
+def city_codes(states: Iterable[str]) -> dict[str, str]:
+    '''Código de município (6 dígitos, como na RAIS) -> UF, para os municípios gerados nas UFs states'''
+    return {code: state for state in states for code in _state_cities(state)}
+
+
+def generate(path: str, rows: int, year: int, states: Iterable[str] = ('AC',), layout: Optional[str] = None,
+             seed: int = 0) -> str:
+    '''Escreve rows linhas em path. layout é uma chave de LAYOUTS (padrão: o do ano). Retorna path.'''
+    layout = LAYOUTS[layout or layout_for_year(year)]
+    states = list(states)
+    header = [name for key, name in layout.items() if key is not None] + layout[None]
+
+    # o cabeçalho tem que ser reconhecido pelo DatasetReader
+    DatasetReader().column_mappings.get_column_rename_map(header)
+
+    rng = np.random.default_rng(seed)
+    pools = _Pools(rng, rows, states)
+
+    with open(path, 'w', encoding='latin-1', newline='') as f:
+        f.write(';'.join(header) + '\n')
+        for start in range(0, rows, BLOCK_SIZE):
+            block = _generate_block(rng, pools, min(BLOCK_SIZE, rows - start), int(year), layout)
+            block.to_csv(f, sep=';', header=False, index=False)
+
+    return path
+
+
+def write_archive(path: str, archive_path: str) -> str:
+    '''Compacta path em archive_path (.7z), como os arquivos originais (com o LZMA2 no nível mais rápido)'''
+    with py7zr.SevenZipFile(archive_path, 'w', filters=[{'id': py7zr.FILTER_LZMA2, 'preset': 1}]) as archive:
+        archive.write(path, os.path.basename(path))
+    return archive_path
+
+
+class _Pools:
+    '''Valores com a cardinalidade dos dados reais, sorteados com pesos desiguais (poucos valores concentram as linhas)'''
+
+    def __init__(self, rng: np.random.Generator, rows: int, states: list[str]):
+        self.cnaes = np.sort(rng.choice(np.arange(111301, 9900800), CNAE_SUBCLASSES, replace=False))
+        self.cbos = np.sort(rng.choice(np.arange(10105, 992225), CBO_OCCUPATIONS, replace=False))
+        self.cnae_weights = _zipf_weights(CNAE_SUBCLASSES, rng)
+        self.cbo_weights = _zipf_weights(CBO_OCCUPATIONS, rng)
+
+        self.cities = np.array([code for state in states for code in _state_cities(state)])
+        state_weights = np.array([CITIES_PER_UF[state] for state in states], np.float64)
+        self.city_weights = np.concatenate([
+            _zipf_weights(CITIES_PER_UF[state]) * weight for state, weight in zip(states, state_weights / state_weights.sum())
+        ])
+
+        self.cpfs = rng.integers(1, 10**11, max(int(rows / ROWS_PER_WORKER), 1))
+        self.cnpjs = rng.integers(10**11, 10**14, max(rows // ROWS_PER_ESTABLISHMENT, 1))
+
+
+def _generate_block(rng: np.random.Generator, pools: _Pools, n: int, year: int, layout: dict) -> pd.DataFrame:
+    old = layout is LAYOUTS['antigo']
+    columns = {
+        'Cpf': rng.choice(pools.cpfs, n).astype(str),
+        'Nome': _join(rng.choice(FIRST_NAMES, n), ' ', rng.choice(LAST_NAMES, n), ' ', rng.choice(LAST_NAMES, n)),
+        'VinculoAtivo31/12': (rng.random(n) < 0.75).astype(np.int8).astype(str),
+        'CnaeSubclasse20': _dirty_codes(rng, rng.choice(pools.cnaes, n, p=pools.cnae_weights), 7, '{0}{1}{2}{3}-{4}/{5}{6}'),
+        'CboOcupacao2002': _dirty_codes(rng, rng.choice(pools.cbos, n, p=pools.cbo_weights), 6, '{0}{1}{2}{3}-{4}{5}'),
+        'GrauInstrucao': rng.integers(1, 12, n).astype(str),
+        'IsHomem': (rng.choice(['MASCULINO', 'FEMININO'], n) if old else rng.choice(['1', '2', '01', '02'], n)),
+        'RacaCor': rng.choice(['1', '2', '4', '6', '8', '9'], n),
+        'DataAdmissao': _dates(rng, n, year - 40, year, invalid=0.001),
+        'HorasContrato': rng.choice(['20', '30', '36', '40', '44'], n, p=[0.05, 0.1, 0.05, 0.2, 0.6]),
+        'Idade': _dates(rng, n, year - 70, year - 14, invalid=0.01),
+        'Municipio': rng.choice(pools.cities, n, p=pools.city_weights),
+        'CNPJ': rng.choice(pools.cnpjs, n).astype(str),
+        'Tipodeficiencia': np.where(rng.random(n) < 0.98, '0', rng.integers(1, 7, n).astype(str)),
+        'Nacionalidade': np.where(rng.random(n) < 0.99, '10', rng.choice(['20', '23', '35', '45'], n)),
+        'Afastamentocausa1': np.where(rng.random(n) < 0.9, '99', rng.choice(['10', '20', '40', '50', '60', '70'], n)),
+        'Afastamentocausa2': np.where(rng.random(n) < 0.97, '99', rng.choice(['10', '20', '40'], n)),
+        'Afastamentocausa3': np.where(rng.random(n) < 0.99, '99', rng.choice(['10', '20'], n)),
+        'Diasafastado': np.where(rng.random(n) < 0.9, '0', rng.integers(1, 121, n).astype(str)),
+        'Tiposalario': rng.choice(['1', '2', '3', '4', '5', '6', '7'], n, p=[0.9, 0.02, 0.02, 0.02, 0.02, 0.01, 0.01]),
+        'Tipovinculo': rng.choice(['10', '15', '20', '25', '30', '35', '40', '50', '55', '60'], n),
+    }
+
+    salary = np.round(rng.lognormal(7.6, 0.7, n), 2)
+    minimum_wage = 998.0 if year >= 2019 else 510.0
+    columns['SalarioContratual'] = _money(rng, salary, old)
+    columns['RemuneracaoMediaR$'] = _money(rng, salary * rng.uniform(0.9, 1.3, n), old)
+    columns['RemuneracaoMedia'] = _money(rng, salary / minimum_wage, old)
+    december = np.where(columns['VinculoAtivo31/12'] == '1', salary * rng.uniform(0.95, 1.2, n), 0)
+    columns['RemuneracaoDezembroR$'] = _money(rng, december, old)
+    columns['RemuneracaoDezembro'] = _money(rng, december / minimum_wage, old)
+
+    for name in layout[None]:
+        columns[name] = rng.integers(0, 10, n).astype(str)
+
+    return pd.DataFrame({key: columns[key] for key in [*(k for k in layout if k is not None), *layout[None]]})
+
+
+def _state_cities(state: str) -> list[str]:
+    return [f'{UF_CODES[state]}{i:04d}' for i in range(1, CITIES_PER_UF[state] + 1)]
+
+
+def _zipf_weights(count: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    '''Pesos proporcionais a 1/posição. Com rng, as posições são embaralhadas.'''
+    weights = 1 / np.arange(1, count + 1)
+    if rng is not None:
+        weights = rng.permutation(weights)
+    return weights / weights.sum()
+
+
+def _join(*parts) -> np.ndarray:
+    result = parts[0].astype(object)
+    for part in parts[1:]:
+        result = result + part
+    return result
+
+
+def _dirty_codes(rng: np.random.Generator, codes: np.ndarray, digits: int, punctuated: str,
+                 dirty: float = 0.02) -> np.ndarray:
+    '''Códigos com zeros à esquerda; uma fração dirty vem com pontuação (ex.: "4711-3/02")'''
+    codes = pd.Series(codes.astype(str)).str.zfill(digits).to_numpy(object)
+    mask = rng.random(len(codes)) < dirty
+    codes[mask] = [punctuated.format(*code) for code in codes[mask]]
+    return codes
+
+
+def _dates(rng: np.random.Generator, n: int, first_year: int, last_year: int, invalid: float) -> np.ndarray:
+    '''DDMMAAAA sem o zero à esquerda do dia. Uma fração invalid tem um dia que não existe no mês (ex.: 31022011).'''
+    days = rng.integers(1, 29, n)
+    days = np.where(rng.random(n) < invalid, 31, days)
+    months = np.where(days == 31, rng.choice([2, 4, 6, 9, 11], n), rng.integers(1, 13, n))
+    years = rng.integers(first_year, last_year + 1, n)
+    return (days * 1_000_000 + months * 10_000 + years).astype(str)
+
+
+def _money(rng: np.random.Generator, values: np.ndarray, zero_padded: bool, empty: float = 0.005) -> np.ndarray:
+    '''Valores com vírgula decimal ("1234,56"); no layout antigo preenchidos com zeros ("0000001234,56")'''
+    cents = np.round(values * 100).astype(np.int64)
+    text = pd.Series(cents // 100).astype(str)
+    if zero_padded:
+        text = text.str.zfill(10)
+    text = (text + ',' + pd.Series(cents % 100).astype(str).str.zfill(2)).to_numpy(object)
+    text[rng.random(len(text)) < empty] = ''
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera um arquivo falso no formato da RAIS')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--year', type=int, default=2019)
+    parser.add_argument('--states', nargs='+', default=['AC'], choices=sorted(UF_CODES))
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default=None, help='padrão: o layout do ano')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='ex.: AC2019ID.txt (o ano é lido do nome do arquivo)')
+    parser.add_argument('--archive', action='store_true', help='também cria o .7z, como os arquivos originais')
+    args = parser.parse_args()
+
+    generate(args.output, args.rows, args.year, args.states, args.layout, args.seed)
+    print(f'{args.output}: {args.rows} linhas, {os.path.getsize(args.output) / 2**20:.1f} MB')
+
+    if args.archive:
+        archive_path = write_archive(args.output, os.path.splitext(args.output)[0] + '.7z')
+        print(f'{archive_path}: {os.path.getsize(archive_path) / 2**20:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
+from . import categories, compaction, cpf_index, cubes, manifest, panel, quality, sectors
 from .dataset_reader import DatasetReader
+from .chunk_writer import SplitChunkWriter
+from .instrumentation import Instrumentation
+from .read_plan import ReadPlan
+from .transformations import format_cnpj, format_cpf
 
 
-__all__ = ["DatasetReader"]
\ No newline at end of file
+__all__ = ["DatasetReader", "Instrumentation", "categories", "compaction", "cpf_index", "cubes", "manifest", "panel", "quality", "sectors", "ReadPlan", "SplitChunkWriter", "format_cnpj", "format_cpf"]
\ No newline at end of file
@@ -0,0 +1,239 @@
+'''
+Backend de leitura baseado no leitor de CSV em streaming (multithread) do pyarrow.
+
+Os batches ficam em Arrow do CSV até o Parquet: as transformações de transformations.py
+têm aqui equivalentes escritos com kernels do pyarrow.compute.
+'''
+
+from typing import Callable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from . import quality, transformations
+from .read_plan import NA_VALUES
+
+ARROW_BLOCK_SIZE = 64 << 20  # bytes por batch lido do CSV
+
+_NA_VALUES = pa.array(sorted(NA_VALUES))
+
+
+def open_csv(file_path, columns: list[str], column_types: dict[str, pa.DataType],
+             block_size: int = ARROW_BLOCK_SIZE, column_names: Optional[list[str]] = None) -> pacsv.CSVStreamingReader:
+    '''
+    Abre o CSV (separado por ";" e em latin-1) lendo apenas as colunas informadas, na ordem em que aparecem.
+    Se column_names for passado, o arquivo não tem cabeçalho.
+    '''
+    return pacsv.open_csv(
+        file_path,
+        read_options=pacsv.ReadOptions(encoding='latin-1', block_size=block_size, use_threads=True,
+                                       column_names=column_names),
+        parse_options=pacsv.ParseOptions(delimiter=';'),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types=column_types,
+            strings_can_be_null=False,  # valores nulos das colunas de texto são tratados em post_process
+        ),
+    )
+
+
+def arrow_type(dtype) -> pa.DataType:
+    '''Tipo Arrow usado para ler uma coluna com o dtype do MAPPING_DATA'''
+    if dtype is str or isinstance(dtype, pd.CategoricalDtype):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def iter_tables(reader: pacsv.CSVStreamingReader) -> Iterator[pa.Table]:
+    for batch in reader:
+        yield pa.Table.from_batches([batch])
+
+
+def post_process(table: pa.Table, rename_map: dict[str, str], transformation_map: dict[str, Callable],
+                 categorical_columns: set[str], year: int, has_age: bool,
+                 dictionaries: Optional[dict[str, pa.Array]] = None, flags: bool = False) -> pa.Table:
+    '''
+    Equivalente de DatasetReader._post_process_dataframe para tabelas Arrow.
+    As colunas em dictionaries são codificadas com esse dicionário fixo em vez de um por batch.
+    Com flags, adiciona quality.FLAGS_COLUMN (ver quality.arrow_row_flags).
+    '''
+    dictionaries = dictionaries or {}
+    table = table.rename_columns([rename_map[name] for name in table.column_names])
+
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if name in transformation_map:
+            column = to_arrow_transformation(transformation_map[name])(column)
+        elif pa.types.is_string(column.type):
+            column = _string_nulls(column)
+        columns[name] = column
+
+    if has_age:
+        columns['Idade'] = pc.cast(columns['Idade'], pa.int8(), safe=False)
+    else:
+        columns['Idade'] = map_unique(columns['Idade'], lambda dates: calculate_age(pc.utf8_lpad(dates, 8, '0'), int(year)))
+
+    for name in categorical_columns:
+        if name in dictionaries:
+            columns[name] = encode_with_dictionary(columns[name], dictionaries[name], name)
+        else:
+            columns[name] = dictionary_encode(columns[name])
+
+    raw_cpf = table.column('Cpf') if 'Cpf' in table.column_names else None
+    raw_date = columns['DataAdmissao']
+
+    columns['IsHomem'] = pc.cast(columns['IsHomem'], pa.int8(), safe=False)
+    columns['DataAdmissao'] = pc.cast(map_unique(columns['DataAdmissao'], lambda dates: parse_date(pc.utf8_lpad(dates, 8, '0'))),
+                                      pa.timestamp('ns'))
+
+    if flags:
+        columns[quality.FLAGS_COLUMN] = quality.arrow_row_flags(raw_cpf, raw_date, columns['DataAdmissao'])
+
+    return pa.table(columns)
+
+
+def encode_with_dictionary(values: pa.ChunkedArray, dictionary: pa.Array, name: str = '') -> pa.ChunkedArray:
+    '''Codifica values com um dicionário fixo. Valores fora do dicionário são um erro.'''
+    values = values.combine_chunks()
+    indices = pc.index_in(values, value_set=dictionary)
+
+    unknown = pc.and_(pc.is_null(indices), pc.is_valid(values))
+    if pc.any(unknown).as_py():
+        examples = sorted(pc.unique(pc.filter(values, unknown)).to_pylist())[:10]
+        raise Exception(f'{pc.sum(unknown).as_py()} value(s) of {name} not in the fixed categories, e.g. {examples}. '
+                        'Add them with categories.scan/merge.')
+
+    return pa.chunked_array([pa.DictionaryArray.from_arrays(pc.cast(indices, index_type(len(dictionary))), dictionary)])
+
+
+def dictionary_encode(values: Union[pa.Array, pa.ChunkedArray]) -> pa.ChunkedArray:
+    '''
+    Codifica values com um dicionário dos valores presentes, ordenado, como as categorias que o
+    pd.read_csv infere para dtype category (o pc.dictionary_encode usa a ordem em que os valores aparecem)
+    '''
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    dictionary = pc.unique(values.drop_null())
+    dictionary = dictionary.take(pc.sort_indices(dictionary))
+    indices = pc.cast(pc.index_in(values, value_set=dictionary), index_type(len(dictionary)))
+    return pa.chunked_array([pa.DictionaryArray.from_arrays(indices, dictionary)])
+
+
+def index_type(size: int) -> pa.DataType:
+    '''Tipo dos índices de um dicionário com size valores: o menor inteiro, como os códigos de um pd.Categorical'''
+    for dtype in (pa.int8(), pa.int16(), pa.int32()):
+        if size < np.iinfo(dtype.to_pandas_dtype()).max:
+            return dtype
+    return pa.int64()
+
+
+def map_unique(values: Union[pa.Array, pa.ChunkedArray], function: Callable) -> pa.ChunkedArray:
+    '''Aplica function apenas aos valores distintos de cada chunk e distribui o resultado (ver transformations.map_unique)'''
+    if isinstance(values, pa.Array):
+        values = pa.chunked_array([values])
+
+    chunks = []
+    for chunk in values.chunks:
+        encoded = pc.dictionary_encode(chunk)
+        result = function(encoded.dictionary)
+        if isinstance(result, pa.ChunkedArray):
+            result = result.combine_chunks()
+        chunks.append(pc.take(result, encoded.indices))
+    return pa.chunked_array(chunks, type=chunks[0].type if chunks else None)
+
+
+def calculate_age(birthdate: Union[pa.Array, pa.ChunkedArray], year: int) -> pa.ChunkedArray:
+    '''
+    Idade em 31/12 de year. Datas com dia inválido usam o último dia do mês, como em
+    DatasetReader._calculate_age. Como a referência é o último dia do ano, o aniversário
+    sempre já passou e basta o ano de nascimento.
+    '''
+    birth = parse_date(birthdate)
+    first_of_month = parse_date(pc.binary_join_element_wise('01', pc.utf8_slice_codeunits(birthdate, 2), ''))
+    birth_year = pc.year(pc.coalesce(birth, first_of_month))
+    return pc.cast(pc.subtract(year, birth_year), pa.int8(), safe=False)
+
+
+def parse_date(values: Union[pa.Array, pa.ChunkedArray]) -> pa.ChunkedArray:
+    '''
+    Converte datas DDMMAAAA. O strptime do Arrow normaliza datas inválidas (31/02 -> 03/03),
+    então só são aceitas as datas que voltam ao mesmo texto, como no pd.to_datetime com format.
+    '''
+    parsed = pc.strptime(values, format=transformations.DATE_FORMAT, unit='s', error_is_null=True)
+    years = pc.year(parsed)
+    valid = pc.and_(pc.equal(pc.strftime(parsed, format=transformations.DATE_FORMAT), values),
+                    pc.and_(pc.greater(years, 1677), pc.less(years, 2262)))  # limites de datetime64[ns]
+    return pc.if_else(valid, parsed, pa.scalar(None, parsed.type))
+
+
+def parse_money(values):
+    values = pc.utf8_trim_whitespace(pc.replace_substring(values, ',', '.', max_replacements=1))
+    is_number = pc.match_substring_regex(values, r'(?i)^[+-]?((\d+\.?\d*|\.\d+)(e[+-]?\d+)?|inf(inity)?|nan)$')
+
+    parsed = pc.cast(pc.if_else(is_number, values, str(transformations.INVALID_MONEY)), pa.float64())
+    parsed = pc.cast(parsed, pa.float32(), safe=False)
+    parsed = pc.if_else(pc.equal(parsed, np.inf), pa.scalar(transformations.INVALID_MONEY, pa.float32()), parsed)
+
+    return pc.cast(parsed, pa.float64())
+
+
+def only_digits(values):
+    return pc.replace_substring_regex(values, r'\D', '')
+
+
+def parse_cpf(values):
+    return pc.utf8_lpad(only_digits(values), 11, '0')
+
+
+def _parse_id(values, max_digits: int):
+    digits = only_digits(values)
+    length = pc.utf8_length(digits)
+    valid = pc.and_(pc.greater(length, 0), pc.less_equal(length, max_digits))
+    return pc.cast(pc.if_else(valid, digits, str(transformations.INVALID_ID)), pa.int64())
+
+
+def parse_cpf_int(values):
+    return _parse_id(values, transformations.CPF_DIGITS)
+
+
+def parse_cnpj_int(values):
+    return _parse_id(values, transformations.CNPJ_DIGITS)
+
+
+def parse_is_homem_numeric(values):
+    values = pc.cast(pc.utf8_trim_whitespace(values), pa.int64())
+    return pc.if_else(pc.equal(values, 2), 0, values)
+
+
+def parse_is_homem_text(values):
+    first_letter = pc.utf8_upper(pc.utf8_slice_codeunits(pc.utf8_trim_whitespace(values), 0, 1))
+    return pc.if_else(pc.equal(first_letter, 'M'), 1, pc.if_else(pc.equal(first_letter, 'F'), 0, -1))
+
+
+_ARROW_TRANSFORMATIONS = {
+    transformations.parse_money: parse_money,
+    transformations.parse_money_cents: transformations.parse_money_cents,  # já é escrita em Arrow
+    transformations.only_digits: only_digits,
+    transformations.parse_cpf: parse_cpf,
+    transformations.parse_cpf_int: parse_cpf_int,
+    transformations.parse_cnpj_int: parse_cnpj_int,
+    transformations.parse_is_homem_numeric: parse_is_homem_numeric,
+    transformations.parse_is_homem_text: parse_is_homem_text,
+}
+
+
+def to_arrow_transformation(transformation: Callable) -> Callable:
+    '''Retorna o equivalente em Arrow de uma transformação de transformations.py'''
+    try:
+        return _ARROW_TRANSFORMATIONS[transformation]
+    except KeyError:
+        raise Exception(f'No pyarrow equivalent for transformation {transformation.__name__}')
+
+
+def _string_nulls(values):
+    '''Valores como "", "NA" e "NULL" viram nulos, como no pd.read_csv'''
+    return pc.if_else(pc.is_in(values, value_set=_NA_VALUES), pa.scalar(None, pa.string()), values)
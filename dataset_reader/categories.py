@@ -0,0 +1,77 @@
+'''
+Dicionários fixos para as colunas categóricas (Municipio, CnaeSubclasse20, CboOcupacao2002).
+
+Com as mesmas categorias, na mesma ordem, em todos os chunks de todos os anos, os códigos inteiros
+são idênticos em toda a árvore de filtrados e os chunks podem ser concatenados sem recodificação.
+As categorias podem vir das tabelas de códigos (ver filtering/cnae_and_cbo_manager.py) ou de uma
+varredura prévia dos arquivos. Use sempre o mesmo arquivo de categorias para a árvore inteira.
+'''
+
+import json
+from typing import Iterable
+
+import pandas as pd
+
+from . import streams
+
+Categories = dict[str, list[str]]
+
+SCAN_CHUNK_SIZE = 1_000_000
+
+
+def from_code_tables(cnae_codes: Iterable, cbo_codes: Iterable, city_codes: Iterable) -> Categories:
+    '''Categorias a partir das chaves das tabelas de códigos (ex.: CnaeAndCboManager.cnae_subclass_codes)'''
+    return merge({
+        'CnaeSubclasse20': _digits(cnae_codes),
+        'CboOcupacao2002': _digits(cbo_codes),
+        'Municipio': _digits(city_codes),
+    })
+
+
+def scan(reader, sources: Iterable[streams.Source]) -> Categories:
+    '''
+    Varredura prévia: lê apenas as colunas categóricas de cada arquivo e retorna todos os valores
+    encontrados, já transformados como na leitura normal (ex.: only_digits em CNAE e CBO).
+    '''
+    found: dict[str, set[str]] = {}
+
+    for source in sources:
+        source = streams.peekable(source)
+        plan = reader.get_read_plan(source)
+        columns = {current: new for current, new in plan.rename_map.items() if new in plan.categorical_columns}
+
+        chunk_iterator = pd.read_csv(streams.reader(source), sep=';', encoding='latin-1', usecols=list(columns),
+                                     dtype=str, keep_default_na=False, na_values=plan.get_na_values(),
+                                     chunksize=SCAN_CHUNK_SIZE)
+
+        for chunk in chunk_iterator:
+            for current, new in columns.items():
+                values = chunk[current]
+                if new in plan.transformations:
+                    values = plan.transformations[new](values)
+                found.setdefault(new, set()).update(values.dropna().unique())
+
+    return merge({column: list(values) for column, values in found.items()})
+
+
+def merge(*categories: Categories) -> Categories:
+    '''União de vários dicionários, com as categorias em ordem crescente'''
+    merged: dict[str, set[str]] = {}
+    for item in categories:
+        for column, values in item.items():
+            merged.setdefault(column, set()).update(str(value) for value in values)
+    return {column: sorted(values) for column, values in merged.items()}
+
+
+def save(categories: Categories, path: str) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(merge(categories), f, ensure_ascii=False, indent=0)
+
+
+def load(path: str) -> Categories:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _digits(codes: Iterable) -> list[str]:
+    return [digits for code in codes if (digits := ''.join(c for c in str(code) if c.isdigit()))]
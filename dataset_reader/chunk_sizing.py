@@ -0,0 +1,108 @@
+'''
+Tamanho dos chunks lidos do CSV a partir de um orçamento de memória, em vez de um número fixo de linhas.
+
+O número de linhas por chunk de saída (chunk_size) continua fixo: é ele que define os arquivos, os row groups
+e a retomada pelo manifesto. O que se adapta é quantas linhas o parser lê por vez. Um layout largo (com Nome,
+por exemplo) ocupa bem mais memória por linha do que um estreito, então um número fixo de linhas ou desperdiça
+memória nos estados pequenos ou estoura nos grandes.
+
+Modelo do pico de memória de um chunk lido de n linhas:
+    n * (bytes por linha lida * PARSER_OVERHEAD + bytes por linha processada)    o chunk cru e o processado
+    + chunk_size * bytes por linha processada * WRITER_COPIES * buffers          o buffer do ChunkWriter e a cópia ao salvar
+buffers é o número de ChunkWriters acumulando linhas (um por estado em read_and_save_split_chunks).
+No pipeline (ver pipeline.py), in_flight chunks lidos esperam na fila do parse e in_flight chunks de saída
+esperam a escrita, e ambos entram na conta.
+Os bytes por linha são medidos (memória real, com as strings) no primeiro chunk, lido com PROBE_ROWS linhas,
+e reavaliados a cada chunk, sempre ficando com o maior valor visto. Como o próximo chunk pode ter linhas um pouco
+maiores que as já vistas, só BUDGET_FRACTION do orçamento é usado. O orçamento é só o dos dados: o interpretador
+com pandas e pyarrow carregados já ocupa algumas centenas de MB.
+'''
+
+from typing import Iterator, Union
+
+import pandas as pd
+import pyarrow as pa
+
+PROBE_ROWS = 10_000  # linhas do primeiro chunk, usado para medir os bytes por linha
+MIN_ROWS = 10_000
+MAX_ROWS = 5_000_000
+SAMPLE_ROWS = 10_000  # linhas usadas para medir a memória de cada chunk
+
+PARSER_OVERHEAD = 1.5  # buffers do parser de CSV além do DataFrame lido
+WRITER_COPIES = 2
+BUDGET_FRACTION = 0.9  # folga para chunks com linhas maiores que as medidas
+
+# pyarrow: o tamanho do bloco do leitor de CSV é fixado ao abrir o arquivo, então não é medido e sim estimado.
+# Vários blocos são lidos em paralelo e cada byte de CSV vira uma tabela, a tabela processada e o buffer.
+ARROW_MEMORY_PER_CSV_BYTE = 8
+ARROW_MIN_BLOCK_SIZE = 1 << 20
+ARROW_MAX_BLOCK_SIZE = 64 << 20
+
+Data = Union[pd.DataFrame, pa.Table]
+
+
+class ChunkSizer:
+    '''Escolhe quantas linhas ler por vez para que o pico de memória fique dentro de memory_budget (bytes)'''
+
+    def __init__(self, memory_budget: int, chunk_size: int, buffers: int = 1, in_flight: int = 0):
+        self.memory_budget = memory_budget
+        self.chunk_size = chunk_size
+        self.buffers = buffers
+        self.in_flight = in_flight
+        self.raw_bytes_per_row = 0.0
+        self.processed_bytes_per_row = 0.0
+        self.rows = PROBE_ROWS
+
+    def chunks(self, reader) -> Iterator[pd.DataFrame]:
+        '''Lê do TextFileReader do pd.read_csv (aberto com chunksize) chunks de self.rows linhas'''
+        with reader:
+            while True:
+                try:
+                    yield reader.get_chunk(self.rows)
+                except StopIteration:
+                    return
+
+    def observe(self, raw: Data, processed: Data) -> None:
+        '''Atualiza a estimativa com um chunk (antes e depois do pós-processamento) e recalcula self.rows'''
+        self.raw_bytes_per_row = max(self.raw_bytes_per_row, bytes_per_row(raw))
+        self.processed_bytes_per_row = max(self.processed_bytes_per_row, bytes_per_row(processed))
+
+        per_row = self._per_row()
+        if per_row:
+            budget = self.memory_budget * BUDGET_FRACTION - self._writer_memory()
+            self.rows = int(min(max(budget / per_row, MIN_ROWS), MAX_ROWS))
+
+    @property
+    def estimated_peak(self) -> int:
+        '''Pico de memória estimado com o tamanho de chunk atual'''
+        return int(self.rows * self._per_row() + self._writer_memory())
+
+    def _per_row(self) -> float:
+        return self.raw_bytes_per_row * (PARSER_OVERHEAD + self.in_flight) + self.processed_bytes_per_row
+
+    def _writer_memory(self) -> float:
+        return self.chunk_size * self.processed_bytes_per_row * (WRITER_COPIES + self.in_flight) * self.buffers
+
+
+def arrow_block_size(memory_budget: int) -> int:
+    '''Tamanho do bloco (bytes de CSV) do leitor do pyarrow para memory_budget'''
+    return int(min(max(memory_budget // ARROW_MEMORY_PER_CSV_BYTE, ARROW_MIN_BLOCK_SIZE), ARROW_MAX_BLOCK_SIZE))
+
+
+def bytes_per_row(data: Data) -> float:
+    '''
+    Memória por linha, incluindo as strings, medida nas primeiras SAMPLE_ROWS linhas. As categorias das
+    colunas categóricas são compartilhadas entre os chunks, então só os códigos contam.
+    '''
+    rows = len(data)
+    if rows == 0:
+        return 0.0
+    if isinstance(data, pa.Table):
+        return data.nbytes / rows
+
+    sample = data.iloc[:SAMPLE_ROWS]
+    usage = sample.memory_usage(deep=True, index=False)
+    for column in sample.columns:
+        if isinstance(sample[column].dtype, pd.CategoricalDtype):
+            usage[column] = sample[column].cat.codes.nbytes
+    return usage.sum() / len(sample)
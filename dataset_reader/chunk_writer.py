@@ -0,0 +1,225 @@
+import os
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from . import arrow_engine, quality
+from .cubes import combine_partials, discard_cube, save_partial
+from .instrumentation import Instrumentation
+from .manifest import TMP_SUFFIX, Manifest, discard_stale_chunks
+from .pipeline import PIPELINE_DEPTH
+
+
+class ChunkWriter:
+    '''
+    Acumula linhas e salva em arquivos chunk_N.parquet.zstd com exatamente chunk_size linhas (exceto o último).
+    Com fixed_categories, as colunas categóricas são salvas com o dicionário completo (ver categories.py).
+    Cada chunk é escrito em um temporário e renomeado, então nunca há um chunk pela metade. Com um manifest,
+    a numeração continua dos chunks já registrados nele e cada chunk salvo é registrado.
+    Com instrumentation, a escrita de cada chunk é registrada como a etapa write. Com um executor de uma
+    thread (ver pipeline.writer_executor), os chunks são comprimidos e salvos nela, em ordem, com no máximo
+    PIPELINE_DEPTH chunks esperando; close() espera todos e relança o primeiro erro.
+    Com cubes, cada chunk salvo ganha um agregado parcial e close() junta os do manifesto (ver cubes.py).
+    Com profile, o mesmo para o perfil de qualidade; a coluna quality.FLAGS_COLUMN é retirada antes de salvar.
+    Com row_offset, as linhas escritas começam na linha row_offset de um arquivo maior e os chunks são cortados
+    nos múltiplos de chunk_size desse arquivo: o primeiro e o último podem ser menores e são juntados aos das
+    partes vizinhas (ver DatasetReader.read_and_save_chunks_parallel).
+    '''
+
+    def __init__(self, output_dir: str, chunk_size: int, fixed_categories: bool = False,
+                 manifest: Optional[Manifest] = None, instrumentation: Optional[Instrumentation] = None,
+                 executor: Optional[Executor] = None, cubes: bool = False, profile: bool = False,
+                 row_offset: int = 0):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.fixed_categories = fixed_categories
+        self.manifest = manifest
+        self.instrumentation = instrumentation or Instrumentation()
+        self.executor = executor
+        self.cubes = cubes
+        self.profile = profile
+        self._pending: deque[Future] = deque()
+        self._failed = False
+
+        self._buffer: List[pd.DataFrame] = []
+        self._buffered_rows = 0
+        self._next_row = row_offset
+        self._next_index = len(manifest.chunks) if manifest else 0
+        self._categorical_columns: List[str] = []
+
+        if manifest:
+            discard_stale_chunks(output_dir, manifest)
+            # o diretório vai mudar: o cubo e o perfil são refeitos em close()
+            discard_cube(output_dir)
+            quality.discard_profile(output_dir)
+
+    def write(self, df: pd.DataFrame) -> None:
+        if len(df) == 0:
+            return
+
+        if not self._categorical_columns and not self.fixed_categories and isinstance(df, pd.DataFrame):
+            self._categorical_columns = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+        self._buffer.append(df)
+        self._buffered_rows += len(df)
+
+        while self._buffered_rows >= self._rows_to_boundary():
+            self._flush(self._rows_to_boundary())
+
+    def close(self) -> None:
+        if self._buffered_rows > 0:
+            self._flush(self._buffered_rows)
+        self._wait(0)
+        if self.manifest:
+            self.manifest.finish(self.output_dir)
+            if self.cubes:
+                combine_partials(self.output_dir, self.manifest)
+            if self.profile:
+                quality.combine_partials(self.output_dir, self.manifest)
+
+    def _rows_to_boundary(self) -> int:
+        return self.chunk_size - self._next_row % self.chunk_size
+
+    def _flush(self, n_rows: int) -> None:
+        self._next_row += n_rows
+        df = self._buffer[0] if len(self._buffer) == 1 else self._concat(self._buffer)
+
+        chunk, rest = df[:n_rows], df[n_rows:]
+        self._buffer = [rest] if len(rest) else []
+        self._buffered_rows = len(rest)
+
+        index = self._next_index
+        self._next_index += 1
+
+        if self.executor is None:
+            self._write_chunk(chunk, index)
+            return
+
+        self._wait(PIPELINE_DEPTH - 1)
+        self._pending.append(self.executor.submit(self._write_chunk, chunk, index))
+
+    def _write_chunk(self, chunk, index: int) -> None:
+        if self._failed:
+            return  # um chunk anterior falhou: os seguintes não são salvos, para o manifesto não ter buracos
+
+        try:
+            chunk, flags = quality.split_flags(chunk)
+            os.makedirs(self.output_dir, exist_ok=True)
+            chunk_file = f'chunk_{index}.parquet.zstd'
+            chunk_output_path = os.path.join(self.output_dir, chunk_file)
+            with self.instrumentation.stage('write', output_dir=self.output_dir, chunk=index,
+                                            rows=len(chunk)) as fields:
+                self._save(chunk, chunk_output_path + TMP_SUFFIX)
+                fields['bytes'] = os.path.getsize(chunk_output_path + TMP_SUFFIX)
+            os.replace(chunk_output_path + TMP_SUFFIX, chunk_output_path)
+
+            # antes do manifesto: todo chunk registrado tem os seus parciais
+            if self.cubes:
+                with self.instrumentation.stage('cube', output_dir=self.output_dir, chunk=index, rows=len(chunk)):
+                    save_partial(chunk, self.output_dir, chunk_file)
+            if self.profile:
+                with self.instrumentation.stage('profile', output_dir=self.output_dir, chunk=index, rows=len(chunk)):
+                    quality.save_partial(chunk, flags, self.output_dir, chunk_file)
+
+            if self.manifest:
+                self.manifest.add_chunk(self.output_dir, chunk_file, len(chunk))
+        except BaseException:
+            self._failed = True
+            raise
+
+    def _wait(self, max_pending: int) -> None:
+        '''Espera até restarem no máximo max_pending chunks sendo salvos em segundo plano'''
+        while len(self._pending) > max_pending:
+            self._pending.popleft().result()
+
+    def _concat(self, frames: List[pd.DataFrame]) -> pd.DataFrame:
+        return pd.concat(frames, ignore_index=True)
+
+    def _save(self, chunk: pd.DataFrame, path: str) -> None:
+        chunk = self._fix_categories(chunk.reset_index(drop=True), self._categorical_columns)
+        # um row group por chunk, qualquer que seja o tamanho dos pedaços lidos do CSV
+        chunk.to_parquet(path, index=False, compression='zstd', row_group_size=len(chunk))
+
+    @staticmethod
+    def _fix_categories(df: pd.DataFrame, categorical_columns: List[str]) -> pd.DataFrame:
+        """Cada chunk carrega apenas as categorias presentes nele, como se tivesse sido lido sozinho"""
+        for column in categorical_columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.remove_unused_categories()
+            else:
+                # pd.concat de categóricos com categorias diferentes resulta em object
+                df[column] = df[column].astype(pd.CategoricalDtype())
+        return df
+
+
+class ArrowChunkWriter(ChunkWriter):
+    '''ChunkWriter para tabelas Arrow, que são salvas sem passar pelo pandas'''
+
+    def _concat(self, tables: List[pa.Table]) -> pa.Table:
+        return pa.concat_tables(tables)
+
+    def _save(self, chunk: pa.Table, path: str) -> None:
+        if not self.fixed_categories:
+            chunk = self._fix_dictionaries(chunk)
+        pq.write_table(chunk, path, compression='zstd', row_group_size=len(chunk))
+
+    @staticmethod
+    def _fix_dictionaries(table: pa.Table) -> pa.Table:
+        """
+        Recodifica as colunas de dicionário para que cada chunk tenha um único dicionário só com os valores
+        presentes, ordenado e com índices do menor tipo, como o chunk salvo pelo ChunkWriter a partir do pandas
+        """
+        for i, field in enumerate(table.schema):
+            if pa.types.is_dictionary(field.type):
+                values = pc.cast(table.column(i), field.type.value_type)
+                table = table.set_column(i, field.name, arrow_engine.dictionary_encode(values))
+        return table
+
+
+class SplitChunkWriter:
+    '''
+    Distribui as linhas entre um ChunkWriter por chave, salvando em output_dir/<chave>/chunk_N.parquet.zstd.
+    Com um manifest, cada chave recebe uma cópia vazia dele (as chaves não são retomadas, só refeitas).
+    O executor é compartilhado pelos ChunkWriters das chaves.
+    '''
+
+    def __init__(self, output_dir: str, chunk_size: int, fixed_categories: bool = False,
+                 manifest: Optional[Manifest] = None, instrumentation: Optional[Instrumentation] = None,
+                 executor: Optional[Executor] = None, cubes: bool = False,
+                 profile: bool = False):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.fixed_categories = fixed_categories
+        self.manifest = manifest
+        self.instrumentation = instrumentation
+        self.executor = executor
+        self.cubes = cubes
+        self.profile = profile
+        self._writers: dict[str, ChunkWriter] = {}
+
+    def write(self, df: pd.DataFrame, keys: pd.Series) -> None:
+        for key, group in df.groupby(keys, sort=False, observed=True):
+            self._get_writer(str(key)).write(group)
+
+    def close(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+
+    def keys(self) -> List[str]:
+        return list(self._writers.keys())
+
+    def _get_writer(self, key: str) -> ChunkWriter:
+        if key not in self._writers:
+            manifest = None
+            if self.manifest:
+                manifest = Manifest(self.manifest.source, self.manifest.plan_fingerprint, self.chunk_size,
+                                    options=self.manifest.options)
+            self._writers[key] = ChunkWriter(os.path.join(self.output_dir, key), self.chunk_size,
+                                             self.fixed_categories, manifest, self.instrumentation, self.executor,
+                                             self.cubes, self.profile)
+        return self._writers[key]
@@ -0,0 +1,172 @@
+'''
+Compactação da árvore de filtrados em um dataset particionado no estilo hive.
+
+filtrados/<ano>/<UF>/chunk_N.parquet.zstd vira compactados/year=<ano>/uf=<UF>/part-N.parquet, com arquivos
+e row groups de tamanho alvo: estados pequenos deixam de ser um arquivo minúsculo e SP deixa de ser
+centenas de arquivos. Um _metadata na raiz reúne os rodapés de todos os arquivos, então o dataset inteiro
+é aberto e a varredura é planejada sem listar diretórios nem abrir cada arquivo (ver open_dataset).
+'''
+
+import os
+import shutil
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .manifest import Manifest, is_complete
+
+TARGET_FILE_SIZE = 512 << 20  # bytes por arquivo (estimado pelo tamanho médio das linhas nos chunks)
+TARGET_ROW_GROUP_SIZE = 64 << 20  # bytes por row group
+METADATA_FILE = '_metadata'
+DICTIONARY_INDEX_TYPE = pa.int32()  # os chunks usam o menor tipo que cabe no dicionário (int8 no AC, int16 na BA)
+
+# year=<ano>/uf=<UF>
+HIVE_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('uf', pa.string())]), flavor='hive')
+
+
+def compact(source_root: str, target_root: str, target_file_size: int = TARGET_FILE_SIZE,
+            target_row_group_size: int = TARGET_ROW_GROUP_SIZE) -> list[str]:
+    '''
+    Compacta todos os diretórios <ano>/<UF> de source_root com manifesto completo e reescreve o _metadata.
+    Partições já compactadas a partir dos mesmos chunks são puladas. A ordem das linhas é mantida
+    (inclusive a ordenação por Cpf, ver cpf_index.py). Retorna as partições escritas.
+    '''
+    written = []
+
+    for year in sorted(os.listdir(source_root)):
+        year_dir = os.path.join(source_root, year)
+        if not year.isdigit() or not os.path.isdir(year_dir):
+            continue
+
+        for state in sorted(os.listdir(year_dir)):
+            state_dir = os.path.join(year_dir, state)
+            if not is_complete(state_dir):
+                continue
+
+            partition_dir = os.path.join(target_root, f'year={year}', f'uf={state}')
+            if compact_partition(state_dir, partition_dir, target_file_size, target_row_group_size):
+                written.append(partition_dir)
+
+    write_metadata(target_root)
+    return written
+
+
+def compact_partition(state_dir: str, partition_dir: str, target_file_size: int = TARGET_FILE_SIZE,
+                      target_row_group_size: int = TARGET_ROW_GROUP_SIZE) -> bool:
+    '''
+    Reescreve os chunks de state_dir em partition_dir. A partição é escrita em um diretório temporário
+    e só então substitui a anterior. Retorna False se partition_dir já foi gerado a partir destes chunks.
+    '''
+    source_manifest = Manifest.load(state_dir)
+    source = {
+        'name': state_dir,
+        'size': sum(chunk['size'] for chunk in source_manifest.chunks),
+        'mtime': os.path.getmtime(os.path.join(state_dir, '_manifest.json')),
+    }
+
+    current = Manifest.load(partition_dir)
+    if current is not None and current.complete and current.source == source and is_complete(partition_dir):
+        return False
+
+    rows = max(source_manifest.rows, 1)
+    bytes_per_row = max(source['size'] / rows, 1)
+    rows_per_group = max(int(target_row_group_size / bytes_per_row), 1)
+    rows_per_file = max(int(target_file_size / bytes_per_row), rows_per_group)
+
+    # o prefixo "_" faz o pyarrow.dataset ignorar a partição enquanto ela é escrita
+    tmp_dir = os.path.join(os.path.dirname(partition_dir), '_' + os.path.basename(partition_dir) + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # os dicionários passam a ter índices DICTIONARY_INDEX_TYPE em todas as partições
+    files = [os.path.join(state_dir, chunk['file']) for chunk in source_manifest.chunks]
+    schema = unified_schema(pq.read_schema(path) for path in files)
+    ds.write_dataset(
+        ds.dataset(files, schema=schema, format='parquet'), tmp_dir, format='parquet',
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        basename_template='part-{i}.parquet',
+        max_rows_per_file=rows_per_file, max_rows_per_group=rows_per_group, min_rows_per_group=rows_per_group,
+        preserve_order=True, existing_data_behavior='overwrite_or_ignore',
+    )
+
+    manifest = Manifest(source, source_manifest.plan_fingerprint, rows_per_file, sorted_by=source_manifest.sorted_by,
+                        options=source_manifest.options)
+    parts = sorted(os.listdir(tmp_dir), key=lambda name: int(name.split('-')[1].split('.')[0])) if os.path.exists(tmp_dir) else []
+    for part in parts:
+        manifest.add_chunk(tmp_dir, part, pq.read_metadata(os.path.join(tmp_dir, part)).num_rows, save=False)
+    manifest.finish(tmp_dir)
+
+    shutil.rmtree(partition_dir, ignore_errors=True)
+    os.replace(tmp_dir, partition_dir)
+    return True
+
+
+def write_metadata(root: str) -> Optional[str]:
+    '''
+    Reúne os rodapés de todos os arquivos das partições em root/_metadata. Todos os anos precisam ter
+    o mesmo schema (ex.: não misturar Cpf como texto e como inteiro); os dicionários são unificados
+    (ver unified_schema).
+    '''
+    metadata = None
+    schemas = []
+
+    for partition_dir in sorted(_partition_dirs(root)):
+        manifest = Manifest.load(partition_dir)
+        for chunk in manifest.chunks if manifest else []:
+            path = os.path.join(partition_dir, chunk['file'])
+            file_metadata = pq.read_metadata(path)
+            file_metadata.set_file_path(os.path.relpath(path, root).replace(os.sep, '/'))
+
+            schemas.append(pq.read_schema(path))
+            if metadata is None:
+                metadata = file_metadata
+            else:
+                try:
+                    metadata.append_row_groups(file_metadata)
+                except RuntimeError as e:
+                    raise Exception(f'{path} has a different schema from the rest of the dataset: {e}')
+
+    if metadata is None:
+        return None
+
+    path = os.path.join(root, METADATA_FILE)
+    pq.write_metadata(unified_schema(schemas), path + '.tmp', metadata_collector=[metadata])
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def open_dataset(root: str) -> ds.Dataset:
+    '''Abre a árvore compactada como um único dataset particionado (colunas year e uf)'''
+    metadata_path = os.path.join(root, METADATA_FILE)
+    if os.path.exists(metadata_path):
+        return ds.parquet_dataset(metadata_path, partitioning=HIVE_PARTITIONING)
+    dataset = ds.dataset(root, format='parquet', partitioning=HIVE_PARTITIONING)
+    return ds.dataset(root, schema=unified_schema([dataset.schema]), format='parquet', partitioning=HIVE_PARTITIONING)
+
+
+def unified_schema(schemas: Iterable[pa.Schema]) -> pa.Schema:
+    '''
+    Schema comum a chunks de estados e anos diferentes, para abrir todos em um só dataset: os dicionários
+    passam a usar índices DICTIONARY_INDEX_TYPE e colunas que só existem em alguns layouts são incluídas.
+    '''
+    return pa.unify_schemas([
+        pa.schema([
+            pa.field(field.name, pa.dictionary(DICTIONARY_INDEX_TYPE, field.type.value_type), field.nullable)
+            if pa.types.is_dictionary(field.type) else field
+            for field in schema
+        ], schema.metadata)
+        for schema in schemas
+    ])
+
+
+def is_compacted(root: str) -> bool:
+    return os.path.isdir(root) and any(name.startswith('year=') for name in os.listdir(root))
+
+
+def _partition_dirs(root: str) -> list[str]:
+    return [
+        os.path.join(root, year, state)
+        for year in os.listdir(root) if year.startswith('year=')
+        for state in os.listdir(os.path.join(root, year)) if state.startswith('uf=')
+    ]
@@ -0,0 +1,265 @@
+'''
+Saída ordenada por Cpf e índice de CPFs entre anos.
+
+sort_by_cpf reescreve os chunks de um diretório (um estado de um ano) ordenados por Cpf, em row groups
+com min/max de Cpf estreitos. build_cpf_index junta as estatísticas desses row groups de toda a árvore
+de filtrados em um índice pequeno (root/_cpf_index.parquet), e read_cpfs usa o índice para ler apenas
+os row groups que podem conter os CPFs procurados, em todos os anos de uma vez. Diretórios que o índice
+não cobre (não ordenados ou reescritos depois dele) são varridos inteiros.
+'''
+
+import os
+import shutil
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .chunk_writer import ArrowChunkWriter
+from .compaction import unified_schema
+from .manifest import TMP_SUFFIX, Manifest, chunk_files, discard_stale_chunks
+
+CPF_COLUMN = 'Cpf'
+YEAR_COLUMN = 'year'
+STATE_COLUMN = 'uf'
+INDEX_FILE = '_cpf_index.parquet'
+ROW_GROUP_SIZE = 50_000  # linhas por row group dos arquivos ordenados
+
+_SORT_DIR = '_sort'
+
+
+def sort_by_cpf(output_dir: str, rows_per_file: Optional[int] = None, row_group_size: int = ROW_GROUP_SIZE,
+                fixed_categories: bool = False) -> None:
+    '''
+    Reordena os chunks de output_dir (com manifesto completo) por Cpf, sem carregar o diretório inteiro:
+    os CPFs são divididos em faixas de ~rows_per_file linhas (padrão: o chunk_size do manifesto), as linhas
+    de cada faixa são separadas em uma passada e cada faixa é ordenada e salva em sorted_N.parquet.zstd.
+    O novo manifesto só substitui o antigo quando todos os arquivos ordenados estão salvos.
+    '''
+    manifest = Manifest.load(output_dir)
+    if manifest is None or not manifest.complete:
+        raise Exception(f'{output_dir} has no complete manifest')
+
+    if manifest.sorted_by == CPF_COLUMN:
+        discard_stale_chunks(output_dir, manifest)
+        return
+
+    chunk_paths = [os.path.join(output_dir, chunk['file']) for chunk in manifest.chunks]
+    rows_per_file = rows_per_file or manifest.chunk_size
+    boundaries = _range_boundaries(chunk_paths, rows_per_file)
+
+    sort_dir = os.path.join(output_dir, _SORT_DIR)
+    shutil.rmtree(sort_dir, ignore_errors=True)
+
+    try:
+        # passada 1: separa as linhas de cada chunk pela faixa de CPF
+        for i, path in enumerate(chunk_paths):
+            table = pq.read_table(path)
+            ranges = _range_indices(table.column(CPF_COLUMN), boundaries)
+            for range_index in np.unique(ranges):
+                part_dir = os.path.join(sort_dir, str(range_index))
+                os.makedirs(part_dir, exist_ok=True)
+                pq.write_table(table.filter(pa.array(ranges == range_index)), os.path.join(part_dir, f'{i}.parquet'))
+
+        # passada 2: ordena cada faixa
+        sorted_manifest = Manifest(manifest.source, manifest.plan_fingerprint, manifest.chunk_size,
+                                   sorted_by=CPF_COLUMN, options=manifest.options)
+        range_dirs = sorted(os.listdir(sort_dir), key=int) if os.path.exists(sort_dir) else []
+        for range_dir in range_dirs:
+            part_dir = os.path.join(sort_dir, range_dir)
+            parts = sorted(os.listdir(part_dir), key=lambda name: int(name.split('.')[0]))
+            table = pa.concat_tables([pq.read_table(os.path.join(part_dir, part)) for part in parts])
+            table = table.unify_dictionaries().combine_chunks().sort_by(CPF_COLUMN)
+            if not fixed_categories:
+                table = ArrowChunkWriter._fix_dictionaries(table)
+
+            file_name = f'sorted_{len(sorted_manifest.chunks)}.parquet.zstd'
+            path = os.path.join(output_dir, file_name)
+            pq.write_table(table, path + TMP_SUFFIX, compression='zstd', row_group_size=row_group_size)
+            os.replace(path + TMP_SUFFIX, path)
+            # salvo só no final, para que uma interrupção mantenha o manifesto antigo
+            sorted_manifest.add_chunk(output_dir, file_name, len(table), save=False)
+    finally:
+        shutil.rmtree(sort_dir, ignore_errors=True)
+
+    sorted_manifest.finish(output_dir)
+    discard_stale_chunks(output_dir, sorted_manifest)
+
+
+def build_cpf_index(root: str) -> Optional[pa.Table]:
+    '''
+    Cria root/_cpf_index.parquet com uma linha por row group dos diretórios ordenados por Cpf
+    (root/<ano>/<UF> ou, depois da compactação, root/year=<ano>/uf=<UF>): ano, UF, arquivo (relativo a root),
+    row group, min/max de Cpf e o sha256 do arquivo no manifesto, com o qual read_cpfs reconhece os
+    diretórios reescritos depois do índice. Sem diretórios ordenados, não há índice (um antigo é removido)
+    e retorna None.
+    '''
+    records = {'year': [], 'state': [], 'file': [], 'row_group': [], 'min': [], 'max': [], 'sha256': []}
+
+    for year, state, directory in _state_dirs(root):
+        manifest = Manifest.load(os.path.join(root, directory))
+        if manifest is None or not manifest.complete or manifest.sorted_by != CPF_COLUMN:
+            continue
+
+        for chunk in manifest.chunks:
+            file_name = os.path.join(directory, chunk['file'])
+            metadata = pq.read_metadata(os.path.join(root, file_name))
+            column = metadata.schema.to_arrow_schema().get_field_index(CPF_COLUMN)
+
+            for row_group in range(metadata.num_row_groups):
+                statistics = metadata.row_group(row_group).column(column).statistics
+                records['year'].append(year)
+                records['state'].append(state)
+                records['file'].append(file_name)
+                records['row_group'].append(row_group)
+                records['min'].append(statistics.min)
+                records['max'].append(statistics.max)
+                records['sha256'].append(chunk['sha256'])
+
+    path = os.path.join(root, INDEX_FILE)
+    if not records['file']:
+        # um índice vazio não teria o tipo do Cpf (min e max seriam nulos)
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+
+    index = pa.table({
+        'year': pa.array(records['year'], pa.int16()),
+        'state': pa.array(records['state'], pa.string()).dictionary_encode(),
+        'file': pa.array(records['file'], pa.string()),
+        'row_group': pa.array(records['row_group'], pa.int32()),
+        'min': pa.array(records['min']),
+        'max': pa.array(records['max']),
+        'sha256': pa.array(records['sha256'], pa.string()),
+    })
+
+    pq.write_table(index, path + TMP_SUFFIX, compression='zstd')
+    os.replace(path + TMP_SUFFIX, path)
+    return index
+
+
+def has_cpf_index(root: str) -> bool:
+    return os.path.exists(os.path.join(root, INDEX_FILE))
+
+
+def find_row_groups(index: pa.Table, cpfs: Iterable) -> dict[str, list[int]]:
+    '''Row groups (por arquivo) cujo intervalo [min, max] de Cpf contém algum dos cpfs'''
+    cpfs = np.sort(np.asarray(list(cpfs), dtype=object if pa.types.is_string(index.schema.field('min').type) else np.int64))
+    minimums = index.column('min').to_numpy(zero_copy_only=False)
+    maximums = index.column('max').to_numpy(zero_copy_only=False)
+
+    # há algum cpf em [min, max] se o primeiro cpf >= min vem antes do primeiro cpf > max
+    hits = np.searchsorted(cpfs, minimums, side='left') < np.searchsorted(cpfs, maximums, side='right')
+
+    row_groups: dict[str, list[int]] = {}
+    for file_name, row_group in zip(index.column('file').filter(hits).to_pylist(),
+                                    index.column('row_group').filter(hits).to_pylist()):
+        row_groups.setdefault(file_name, []).append(row_group)
+    return row_groups
+
+
+def read_cpfs(root: str, cpfs: list, years: Optional[Iterable[int]] = None, states: Optional[Iterable[str]] = None,
+              columns: Optional[list[str]] = None) -> pa.Table:
+    '''
+    Lê as linhas dos cpfs em todos os anos (ou só em years/states). Nos diretórios cobertos pelo índice, só os
+    row groups indicados por ele são lidos. Os demais (não ordenados, ou cujo manifesto mudou depois do índice)
+    são varridos inteiros com o filtro de Cpf, então o resultado é o mesmo de uma varredura da árvore.
+    Cada linha traz o ano e a UF de origem (colunas year e uf, que também podem ser pedidas em columns).
+    '''
+    index = pq.read_table(os.path.join(root, INDEX_FILE))
+    cpf_array = pa.array(cpfs, index.schema.field('min').type)
+    read_columns = None if columns is None else list(dict.fromkeys(
+        [*[c for c in columns if c not in (YEAR_COLUMN, STATE_COLUMN)], CPF_COLUMN]))
+
+    indexed: dict[str, dict[str, str]] = {}
+    for file_name, checksum in zip(index.column('file').to_pylist(), index.column('sha256').to_pylist()):
+        indexed.setdefault(os.path.dirname(file_name), {})[file_name] = checksum
+
+    tables = []
+    covered = set()
+    for year, state, directory in _state_dirs(root, years, states):
+        if _is_indexed(root, directory, indexed.get(directory)):
+            covered.add(directory)
+            continue
+
+        files = chunk_files(os.path.join(root, directory))
+        if files:
+            dataset = ds.dataset(files, schema=unified_schema([pq.read_schema(files[0])]), format='parquet')
+            table = dataset.to_table(columns=read_columns, filter=pc.field(CPF_COLUMN).isin(cpf_array))
+            tables.append(_with_origin(table, year, state, columns))
+
+    sources = {}
+    for file_name, year, state in zip(index.column('file').to_pylist(), index.column('year').to_pylist(),
+                                      pc.cast(index.column('state'), pa.string()).to_pylist()):
+        if os.path.dirname(file_name) in covered:
+            sources[file_name] = (year, state)
+    index = index.filter(pa.array([file_name in sources for file_name in index.column('file').to_pylist()]))
+
+    for file_name, row_groups in find_row_groups(index, cpf_array.to_pylist()).items():
+        table = pq.ParquetFile(os.path.join(root, file_name)).read_row_groups(row_groups, columns=read_columns)
+        table = table.filter(pc.is_in(table.column(CPF_COLUMN), cpf_array))
+        tables.append(_with_origin(table, *sources[file_name], columns))
+
+    return pa.concat_tables(tables, promote_options='permissive') if tables else pa.table({})
+
+
+def _with_origin(table: pa.Table, year: int, state: str, columns: Optional[list[str]]) -> pa.Table:
+    table = table.append_column(YEAR_COLUMN, pa.array(np.full(len(table), year, np.int16)))
+    table = table.append_column(STATE_COLUMN, pa.array([state] * len(table), pa.string()))
+    # a largura dos índices dos dicionários muda entre os arquivos
+    table = table.cast(unified_schema([table.schema]))
+    return table if columns is None else table.select(columns)
+
+
+def _is_indexed(root: str, directory: str, checksums: Optional[dict[str, str]]) -> bool:
+    '''True se o índice tem os arquivos atuais do diretório (ordenado e completo), com os mesmos sha256'''
+    if not checksums:
+        return False
+    manifest = Manifest.load(os.path.join(root, directory))
+    return (manifest is not None and manifest.complete and manifest.sorted_by == CPF_COLUMN
+            and {os.path.join(directory, chunk['file']): chunk['sha256'] for chunk in manifest.chunks} == checksums)
+
+
+def _state_dirs(root: str, years: Optional[Iterable[int]] = None,
+                states: Optional[Iterable[str]] = None) -> Iterator[tuple[int, str, str]]:
+    '''(ano, UF, diretório relativo a root) de root/<ano>/<UF> ou, na árvore compactada, root/year=<ano>/uf=<UF>'''
+    years = None if years is None else {int(year) for year in years}
+    states = None if states is None else {str(state).upper() for state in states}
+
+    for year_name in sorted(os.listdir(root)):
+        year = year_name.removeprefix('year=')
+        if not year.isdigit() or not os.path.isdir(os.path.join(root, year_name)):
+            continue
+        if years is not None and int(year) not in years:
+            continue
+
+        for state_name in sorted(os.listdir(os.path.join(root, year_name))):
+            state = state_name.removeprefix('uf=')
+            if state.startswith(('_', '.')) or not os.path.isdir(os.path.join(root, year_name, state_name)):
+                continue
+            if states is None or state in states:
+                yield int(year), state, os.path.join(year_name, state_name)
+
+
+def _range_boundaries(chunk_paths: list[str], rows_per_file: int) -> pa.Array:
+    '''Limites das faixas de CPF: cada faixa tem ~rows_per_file linhas e um CPF nunca fica em duas faixas'''
+    cpfs = pa.chunked_array([pq.read_table(path, columns=[CPF_COLUMN]).column(CPF_COLUMN) for path in chunk_paths])
+    order = pc.sort_indices(cpfs)
+    return pc.unique(cpfs.take(order.take(pa.array(np.arange(rows_per_file, len(cpfs), rows_per_file)))))
+
+
+def _range_indices(cpfs: pa.ChunkedArray, boundaries: pa.Array) -> np.ndarray:
+    '''Faixa de cada Cpf (quantos limites são <= Cpf), comparando só com os limites entre o mínimo e o máximo'''
+    bounds = pc.min_max(cpfs)
+    if not bounds['min'].is_valid:
+        return np.zeros(len(cpfs), np.int64)
+
+    below = pc.less_equal(boundaries, bounds['min'])
+    ranges = np.full(len(cpfs), pc.sum(below).as_py() or 0, np.int64)
+    inside = pc.and_(pc.invert(below), pc.less_equal(boundaries, bounds['max']))
+    for boundary in boundaries.filter(inside):
+        ranges += pc.greater_equal(cpfs, boundary).fill_null(False).to_numpy(zero_copy_only=False)
+    return ranges
@@ -0,0 +1,222 @@
+'''
+Cubos de agregados calculados durante a leitura, para consultas de contagens e salários sem reler os chunks.
+
+Com read_and_save_chunks(cubes=True), cada chunk salvo ganha um agregado parcial (em output_dir/_cube/) por
+DIMENSIONS: linhas, vínculos ativos em 31/12 e, para cada coluna de MEASURES, quantidade de valores, soma e
+soma dos quadrados, sem os valores inválidos (colunas em centavos, de DatasetReader(money_cents=True), são
+convertidas de volta). Todos os campos são somas, então os parciais podem ser juntados em qualquer ordem.
+Ao terminar o diretório, os parciais dos chunks do manifesto viram output_dir/_cube.parquet; como os parciais
+seguem os chunks, uma leitura retomada não conta linhas duas vezes. merge_cubes junta os diretórios de cada
+ano em <cubes_dir>/cube_<ano>.parquet e summarize calcula contagens, médias e desvios de um cubo.
+'''
+
+import os
+import shutil
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .manifest import TMP_SUFFIX, Manifest
+from .transformations import is_invalid_money
+
+DIMENSIONS = {
+    'Municipio': pa.string(),
+    'CnaeSubclasse20': pa.string(),
+    'CboOcupacao2002': pa.string(),
+    'GrauInstrucao': pa.int8(),
+    'IsHomem': pa.int8(),
+    'RacaCor': pa.int8(),
+}
+MEASURES = ['RemuneracaoMedia', 'SalarioContratual']
+ACTIVE_COLUMN = 'VinculoAtivo31/12'
+
+ROWS = 'rows'
+ACTIVE = 'active'
+CUBE_FILE = '_cube.parquet'
+PARTIALS_DIR = '_cube'
+
+Data = Union[pd.DataFrame, pa.Table]
+
+
+def aggregate(data: Data) -> pa.Table:
+    '''Agregado de um DataFrame ou tabela (colunas ausentes no layout viram nulas)'''
+    if isinstance(data, pd.DataFrame):
+        columns = [c for c in [*DIMENSIONS, *MEASURES, ACTIVE_COLUMN] if c in data.columns]
+        data = pa.Table.from_pandas(data[columns], preserve_index=False)
+
+    length = len(data)
+    columns = {}
+    for name, value_type in DIMENSIONS.items():
+        columns[name] = _column(data, name, value_type, length)
+
+    aggregations = [([], 'count_all')]
+    columns[ACTIVE] = pc.cast(_column(data, ACTIVE_COLUMN, pa.bool_(), length), pa.int64())
+    aggregations.append((ACTIVE, 'sum'))
+    for measure in MEASURES:
+        values = _measure(data, measure, length)
+        columns[measure] = values
+        columns[measure + '_sq'] = pc.multiply(values, values)
+        aggregations += [(measure, 'count'), (measure, 'sum'), (measure + '_sq', 'sum')]
+
+    grouped = pa.table(columns).group_by(list(DIMENSIONS)).aggregate(aggregations)
+    names = [*DIMENSIONS, ROWS, ACTIVE, *[f'{m}_{s}' for m in MEASURES for s in ('count', 'sum', 'sumsq')]]
+    return _fill_sums(grouped.select([*DIMENSIONS, 'count_all', f'{ACTIVE}_sum',
+                                      *[f'{m}{s}' for m in MEASURES for s in ('_count', '_sum', '_sq_sum')]])
+                      .rename_columns(names))
+
+
+def merge(cubes: list[pa.Table]) -> pa.Table:
+    '''Junta agregados (de aggregate ou merge) somando os campos de cada combinação de DIMENSIONS'''
+    cubes = [cube for cube in cubes if cube.num_rows]
+    if not cubes:
+        return _empty()
+    table = pa.concat_tables(cubes)
+    sums = [name for name in table.schema.names if name not in DIMENSIONS]
+    grouped = table.group_by(list(DIMENSIONS)).aggregate([(name, 'sum') for name in sums])
+    return _fill_sums(grouped.select([*DIMENSIONS, *[name + '_sum' for name in sums]])
+                      .rename_columns([*DIMENSIONS, *sums]))
+
+
+def save_partial(chunk: Data, output_dir: str, chunk_file: str) -> None:
+    '''Salva o agregado de um chunk em output_dir/_cube/<chunk_file>.parquet (ver ChunkWriter)'''
+    path = _partial_path(output_dir, chunk_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(aggregate(chunk), path + TMP_SUFFIX, compression='zstd')
+    os.replace(path + TMP_SUFFIX, path)
+
+
+def combine_partials(output_dir: str, manifest: Manifest) -> pa.Table:
+    '''
+    Junta os parciais dos chunks do manifesto em output_dir/_cube.parquet. Chunks sem parcial (salvos antes
+    dos cubos serem ligados) são lidos e agregados. Parciais de chunks descartados são ignorados.
+    '''
+    cube = merge([_chunk_cube(output_dir, chunk['file']) for chunk in manifest.chunks])
+    path = os.path.join(output_dir, CUBE_FILE)
+    pq.write_table(cube, path + TMP_SUFFIX, compression='zstd')
+    os.replace(path + TMP_SUFFIX, path)
+    shutil.rmtree(os.path.join(output_dir, PARTIALS_DIR), ignore_errors=True)
+    return cube
+
+
+def discard_cube(output_dir: str) -> None:
+    '''Remove output_dir/_cube.parquet, que deixa de valer quando os chunks do diretório mudam'''
+    path = os.path.join(output_dir, CUBE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def merge_cubes(root: str, cubes_dir: str, years: Optional[list[int]] = None) -> list[str]:
+    '''
+    Junta os cubos dos diretórios <ano>/<UF> (ou year=<ano>/uf=<UF>) com manifesto completo em
+    cubes_dir/cube_<ano>.parquet. Diretórios sem _cube.parquet têm os chunks lidos e agregados.
+    Retorna os arquivos escritos.
+    '''
+    os.makedirs(cubes_dir, exist_ok=True)
+    written = []
+
+    for year_name in sorted(os.listdir(root)):
+        year = year_name.removeprefix('year=')
+        if not year.isdigit() or not os.path.isdir(os.path.join(root, year_name)):
+            continue
+        if years is not None and int(year) not in {int(y) for y in years}:
+            continue
+
+        state_cubes = []
+        for state_name in sorted(os.listdir(os.path.join(root, year_name))):
+            state_dir = os.path.join(root, year_name, state_name)
+            manifest = Manifest.load(state_dir)
+            if manifest is None or not manifest.complete:
+                continue
+
+            cube_path = os.path.join(state_dir, CUBE_FILE)
+            if os.path.exists(cube_path):
+                state_cubes.append(pq.read_table(cube_path))
+            else:
+                state_cubes.append(combine_partials(state_dir, manifest))
+
+        if not state_cubes:
+            continue
+
+        path = os.path.join(cubes_dir, f'cube_{year}.parquet')
+        pq.write_table(merge(state_cubes), path + TMP_SUFFIX, compression='zstd')
+        os.replace(path + TMP_SUFFIX, path)
+        written.append(path)
+
+    return written
+
+
+def summarize(cube: pa.Table, by: list[str], filters: Optional[dict] = None) -> pd.DataFrame:
+    '''
+    Agrega o cubo pelas dimensões em by (após filtrar com {dimensão: valor ou lista}) e calcula,
+    para cada medida, a média e o desvio padrão amostral a partir das somas.
+    '''
+    for column, values in (filters or {}).items():
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        cube = cube.filter(pc.is_in(cube.column(column), pa.array(list(values), cube.schema.field(column).type)))
+
+    sums = [name for name in cube.schema.names if name not in DIMENSIONS]
+    df = cube.group_by(by).aggregate([(name, 'sum') for name in sums]).to_pandas()
+    df = df.rename(columns={name + '_sum': name for name in sums})
+
+    for measure in MEASURES:
+        n, total, squares = (df[f'{measure}_{s}'].astype(np.float64) for s in ('count', 'sum', 'sumsq'))
+        df[f'{measure}_mean'] = total / n.where(n > 0)
+        variance = (squares - total * total / n.where(n > 0)) / (n - 1).where(n > 1)
+        df[f'{measure}_std'] = np.sqrt(variance.clip(lower=0))
+
+    return df.sort_values(by).reset_index(drop=True) if by else df
+
+
+def _chunk_cube(output_dir: str, chunk_file: str) -> pa.Table:
+    path = _partial_path(output_dir, chunk_file)
+    if os.path.exists(path):
+        return pq.read_table(path)
+
+    chunk_path = os.path.join(output_dir, chunk_file)
+    names = set(pq.read_schema(chunk_path).names)
+    columns = [c for c in [*DIMENSIONS, *MEASURES, ACTIVE_COLUMN] if c in names]
+    return aggregate(pq.read_table(chunk_path, columns=columns))
+
+
+def _partial_path(output_dir: str, chunk_file: str) -> str:
+    return os.path.join(output_dir, PARTIALS_DIR, chunk_file.split('.')[0] + '.parquet')
+
+
+def _column(table: pa.Table, name: str, value_type: pa.DataType, length: int) -> pa.Array:
+    if name not in table.schema.names:
+        return pa.nulls(length, value_type)
+    column = table.column(name).combine_chunks()
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    return pc.cast(column, value_type)
+
+
+def _measure(table: pa.Table, name: str, length: int) -> pa.Array:
+    '''Valores da medida como float64, nulos se inválidos. Colunas em centavos são divididas por 100.'''
+    if name not in table.schema.names:
+        return pa.nulls(length, pa.float64())
+    column = table.column(name).combine_chunks()
+    values = pc.cast(column, pa.float64())
+    if pa.types.is_integer(column.type):
+        values = pc.divide(values, 100)
+    return pc.if_else(is_invalid_money(column), pa.scalar(None, pa.float64()), values)
+
+
+def _fill_sums(table: pa.Table) -> pa.Table:
+    '''Somas de grupos sem valores vêm nulas: viram 0, com tipos fixos (int64 para contagens)'''
+    columns = []
+    for name in table.schema.names:
+        column = table.column(name)
+        if name not in DIMENSIONS:
+            value_type = pa.float64() if name.endswith(('_sum', '_sumsq')) else pa.int64()
+            column = pc.fill_null(pc.cast(column, value_type), 0)
+        columns.append(column)
+    return pa.table(columns, names=table.schema.names)
+
+
+def _empty() -> pa.Table:
+    return aggregate(pa.table({}))
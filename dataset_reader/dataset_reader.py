@@ -1,14 +1,32 @@
 import os
 import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from threading import Lock
 from typing import Callable, Optional
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from . import arrow_engine, pipeline, quality, streams, transformations
+from .categories import Categories
+from .chunk_sizing import ChunkSizer, arrow_block_size
+from .instrumentation import Instrumentation
+from .compaction import unified_schema
+from .manifest import TMP_SUFFIX, Manifest, describe_source, discard_stale_chunks
 from .column_mapping import ColumnMappingList
+from .read_plan import ReadPlan
+from .chunk_writer import ArrowChunkWriter, ChunkWriter, SplitChunkWriter
+
+RANGE_SIZE = 256 << 20  # bytes por faixa em read_and_save_chunks_parallel
 
 
 class DatasetReader:
+    ENGINES = ('pandas', 'pyarrow')
+
     MAPPING_DATA = [
         # Possible names, New Name, Type
         ({'CPF'}, 'Cpf', str),
@@ -33,7 +51,7 @@ class DatasetReader:
         ({'TIPO SAL', 'Tipo Salário'}, 'Tiposalario', np.int8),
         ({'TP VINCULO', 'Tipo Vínculo'}, 'Tipovinculo', np.int8),
 
-        # dtype ignored for these. see _populate_transformations
+        # dtype ignored for these. see _get_transformations
         ({'REM DEZ (R$)', 'Vl Remun Dezembro Nom'}, 'RemuneracaoDezembroR$', np.float128),
         ({'REM DEZEMBRO', 'REM DEZ', 'Vl Remun Dezembro (SM)'}, 'RemuneracaoDezembro', np.float64),
         ({'REM MED (R$)', 'Vl Remun Média Nom'}, 'RemuneracaoMediaR$', np.float128),
@@ -41,86 +59,399 @@ class DatasetReader:
         ({'SAL CONTR', 'Vl Salário Contratual'}, 'SalarioContratual', np.float128),
     ]
 
-    def __init__(self):
-        self.column_mappings = ColumnMappingList.from_tuples(self.MAPPING_DATA) 
-    
-    def _read_csv(self, file_path: str, chunk_size: Optional[int] = None, skiprows: Optional[list[int]] = None):
-        column_mappings = self.column_mappings
-        
-        csv_cols = self._get_csv_columns(file_path)
-        column_mappings.update_current_names(csv_cols)
-        
-        columns_rename_map = column_mappings.get_column_rename_map()
-        current_columns = set(columns_rename_map.keys())
-        
-        transformation_map = self._populate_transformations(file_path, current_columns)
-        dtype_map = column_mappings.get_dtype_map()
-        dtype_map = {k: v for k, v in dtype_map.items() if k not in transformation_map}
-        
-        has_age = 'Idade' in current_columns
-        
-        pd_return = pd.read_csv(file_path, sep=';', encoding='latin-1', usecols=current_columns,
-                            converters=transformation_map, dtype=dtype_map, chunksize=chunk_size, skiprows=skiprows)
+    def __init__(self, integer_ids: bool = False, categories: Optional[Categories] = None,
+                 money_cents: bool = False):
+        """
+        integer_ids: salva Cpf e CNPJ como int64 em vez de texto (ver transformations.format_cpf
+        e format_cnpj para voltar ao texto com zeros à esquerda).
+        money_cents: salva os salários e remunerações como centavos em int64, exatos, em vez de float
+        com precisão de float32 (ver transformations.parse_money_cents e money_to_reais). Valores
+        vazios ou inválidos viram transformations.INVALID_CENTS.
+        categories: categorias fixas das colunas categóricas (ver categories.py). Todos os chunks usam o
+        mesmo dicionário e valores fora dele são um erro. Sem elas, cada chunk tem o seu próprio dicionário.
+        """
+        self.column_mappings = ColumnMappingList.from_tuples(self.MAPPING_DATA)
+        self.integer_ids = integer_ids
+        self.money_cents = money_cents
+        self.categories = categories or {}
+        self._read_plans: dict[tuple[tuple[str, ...], Callable], ReadPlan] = {}
+        self._read_plans_lock = Lock()
+
+    @property
+    def output_options(self) -> dict:
+        '''Opções que mudam o schema dos chunks salvos, registradas no manifesto (ver manifest.is_complete)'''
+        return {'integer_ids': self.integer_ids, 'money_cents': self.money_cents}
+
+    def __getstate__(self):
+        # o leitor é enviado aos workers de read_and_save_chunks_parallel; o lock não é serializável
+        state = self.__dict__.copy()
+        del state['_read_plans_lock']
+        return state
 
-        return pd_return, columns_rename_map, has_age
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._read_plans_lock = Lock()
+
+    def get_read_plan(self, file_path: streams.Source) -> ReadPlan:
+        """
+        Retorna o plano de leitura do layout do arquivo. Os planos são guardados por cabeçalho e formato de
+        IsHomem (detectado na primeira linha de cada arquivo, já que arquivos com o mesmo cabeçalho podem
+        usar formatos diferentes), então o resto do plano é resolvido uma única vez por layout.
+        """
+        header = tuple(self._get_csv_columns(file_path))
+        key = (header, self._get_is_homem_transformation(file_path, set(header)))
+
+        with self._read_plans_lock:
+            if key not in self._read_plans:
+                self._read_plans[key] = self._create_read_plan(header, key[1])
+            return self._read_plans[key]
+
+    def _create_read_plan(self, header: tuple[str, ...], is_homem_transformation: Callable) -> ReadPlan:
+        rename_map = self.column_mappings.get_column_rename_map(list(header))
+        current_columns = set(rename_map.keys())
+        categorical_columns = tuple(m.new_name for m in self.column_mappings if isinstance(m.dtype, pd.CategoricalDtype))
+
+        return ReadPlan(
+            header=header,
+            rename_map=rename_map,
+            dtypes=self.column_mappings.get_dtype_map(rename_map),
+            transformations=self._get_transformations(is_homem_transformation),
+            categorical_columns=categorical_columns,
+            category_dtypes={column: self._get_category_dtype(column) for column in categorical_columns},
+            has_age='Idade' in current_columns,
+        )
+
+    def _read_csv(self, file_path: streams.Source, plan: ReadPlan, chunk_size: Optional[int] = None,
+                  skiprows: Optional[list[int]] = None, has_header: bool = True):
+        """Com has_header=False, o arquivo não tem cabeçalho (ex.: uma faixa de bytes) e as colunas vêm do plano"""
+        return pd.read_csv(streams.reader(file_path), sep=';', encoding='latin-1', usecols=plan.current_columns,
+                           dtype=plan.get_dtype_map(), keep_default_na=False, na_values=plan.get_na_values(),
+                           chunksize=chunk_size, skiprows=skiprows,
+                           header='infer' if has_header else None, names=None if has_header else list(plan.header))
+
+    def _read_csv_arrow(self, file_path: streams.Source, plan: ReadPlan, has_header: bool = True,
+                        block_size: int = arrow_engine.ARROW_BLOCK_SIZE):
+        """Como _read_csv, mas retorna um leitor em streaming do pyarrow (batches Arrow)"""
+        column_types = {k: arrow_engine.arrow_type(v) for k, v in plan.get_dtype_map().items()}
+
+        reader = arrow_engine.open_csv(streams.reader(file_path), plan.current_columns, column_types, block_size,
+                                       column_names=None if has_header else list(plan.header))
+        return arrow_engine.iter_tables(reader)
+
+    def read(self, file_path: streams.Source, year: Optional[int] = None, skiprows: Optional[list[int]] = None,
+             engine: str = 'pandas'):
+        self._check_engine(engine, skiprows)
+        file_path = streams.peekable(file_path)
 
-    def read(self, file_path: str, year: Optional[int] = None, skiprows: Optional[list[int]] = None):
         if year is None:
             year = self._extract_year_from_filename(file_path)
+
+        plan = self.get_read_plan(file_path)
+
+        if engine == 'pyarrow':
+            tables = [self._post_process_table(table, plan, year) for table in self._read_csv_arrow(file_path, plan)]
+            return pa.concat_tables(tables).to_pandas()
         
-        df, columns_rename_map, has_age = self._read_csv(file_path, skiprows=skiprows)
-        df = self._post_process_dataframe(df, columns_rename_map, year, has_age)
+        df = self._read_csv(file_path, plan, skiprows=skiprows)
+        df = self._post_process_dataframe(df, plan, year)
         
         return df
 
-    def read_and_save_chunks(self, file_path: str, output_dir: str, chunk_size: int = 10000,
-                             year: Optional[int] = None, skiprows: Optional[list[int]] = None):
+    def read_and_save_chunks(self, file_path: streams.Source, output_dir: str, chunk_size: int = 10000,
+                             year: Optional[int] = None, skiprows: Optional[list[int]] = None,
+                             engine: str = 'pandas', source_info: Optional[dict] = None,
+                             instrumentation: Optional[Instrumentation] = None,
+                             memory_budget: Optional[int] = None, pipelined: bool = False,
+                             cubes: bool = False, profile: bool = False) -> bool:
+        """
+        Salva o arquivo em output_dir/chunk_N.parquet.zstd com chunk_size linhas por chunk.
+        file_path pode ser um caminho ou um stream binário (ex.: open_inner_file em filtering/helpers.py).
+        Com engine='pyarrow', o CSV é lido em paralelo e os dados ficam em Arrow até a escrita do Parquet.
+
+        O progresso fica em output_dir/_manifest.json (ver manifest.py). Se o manifesto for da mesma origem,
+        plano e chunk_size, a leitura é retomada após o último chunk válido, ou nada é feito se já estiver
+        completo. source_info identifica a origem (ver manifest.describe_source; para streams de um .7z,
+        passe o .7z em archive). Retorna False se não havia nada a fazer.
+        instrumentation registra o tempo de cada etapa por chunk e o progresso (ver instrumentation.py).
+
+        Com memory_budget (bytes), o número de linhas lidas do CSV por vez é ajustado para que o pico de
+        memória fique dentro do orçamento (ver chunk_sizing.py). Os chunks salvos continuam com chunk_size
+        linhas (um row group cada), qualquer que seja o tamanho lido.
+
+        Com pipelined, o parse, a transformação e a escrita dos chunks rodam em threads separadas, ligadas
+        por filas limitadas (ver pipeline.py). A saída é a mesma da leitura sequencial.
+
+        Com cubes, contagens e somas de salários por município, CNAE, CBO, instrução, sexo e raça/cor de cada
+        chunk salvo são juntadas em output_dir/_cube.parquet ao final (ver cubes.py).
+
+        Com profile, nulos, distintos aproximados, mínimos, máximos e problemas conhecidos (Cpf sem zeros à
+        esquerda, salários inválidos, datas não convertidas, idades fora da faixa) de cada coluna são juntados
+        em output_dir/_profile.json ao final (ver quality.py).
+        """
+        self._check_engine(engine, skiprows)
+        file_path = streams.peekable(file_path)
         os.makedirs(output_dir, exist_ok=True)
         
         if year is None:
             year = self._extract_year_from_filename(file_path)
+
+        plan = self.get_read_plan(file_path)
+        source_info = source_info or describe_source(file_path)
+        manifest = Manifest.load(output_dir)
+
+        if manifest and skiprows is None and manifest.matches(source_info, plan.fingerprint, chunk_size):
+            if manifest.complete and manifest.valid_chunks(output_dir) == len(manifest.chunks):
+                return False
+            manifest.truncate(output_dir)
+        else:
+            manifest = Manifest(source_info, plan.fingerprint, chunk_size, options=self.output_options)
+
+        instrumentation = instrumentation or Instrumentation()
+        with instrumentation.count(file_path) as source:
+            if not manifest.rows:
+                self._save_chunks(source, plan, output_dir, chunk_size, year, engine, skiprows=skiprows,
+                                  manifest=manifest, instrumentation=instrumentation, memory_budget=memory_budget,
+                                  pipelined=pipelined, cubes=cubes, profile=profile)
+            else:
+                # retoma após as linhas já salvas (cabeçalho + manifest.rows linhas não vazias, ver streams.skip_lines)
+                with streams.skip_lines(source, manifest.rows + 1) as remainder:
+                    self._save_chunks(remainder, plan, output_dir, chunk_size, year, engine, has_header=False,
+                                      manifest=manifest, instrumentation=instrumentation,
+                                      memory_budget=memory_budget, pipelined=pipelined, cubes=cubes,
+                                      profile=profile)
+
+        instrumentation.finish()
+        return True
+
+    def read_and_save_chunks_parallel(self, file_path: str, output_dir: str, chunk_size: int = 10000,
+                                      year: Optional[int] = None, workers: Optional[int] = None,
+                                      range_size: int = RANGE_SIZE, engine: str = 'pandas'):
+        """
+        Como read_and_save_chunks, mas divide o CSV (descompactado) em faixas de range_size bytes alinhadas
+        em quebras de linha e processa as faixas em paralelo. O cabeçalho e o formato de IsHomem são
+        detectados uma única vez e o plano de leitura é enviado aos workers. As linhas de cada faixa são
+        contadas antes, para que cada worker corte os chunks nos múltiplos de chunk_size do arquivo inteiro;
+        os pedaços das pontas de faixas vizinhas são juntados em um chunk. Assim os chunks são os mesmos da
+        leitura sequencial, com chunk_size linhas (exceto o último), e não dependem da ordem dos workers.
+        Não suporta campos entre aspas com quebras de linha (a RAIS não os tem). O manifesto é escrito
+        ao final, mas uma execução interrompida não é retomada.
+        """
+        if streams.is_stream(file_path):
+            raise ValueError('Parallel reading needs a file path, not a stream')
+
+        self._check_engine(engine, None)
+        os.makedirs(output_dir, exist_ok=True)
+
+        if year is None:
+            year = self._extract_year_from_filename(file_path)
+
+        plan = self.get_read_plan(file_path)
+        ranges = streams.split_byte_ranges(file_path, range_size)
+        range_dirs = [os.path.join(output_dir, f'_range_{i}') for i in range(len(ranges))]
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                counts = list(executor.map(streams.count_lines, [file_path] * len(ranges), *zip(*ranges)))
+                row_offsets = np.cumsum([0, *counts[:-1]]).tolist()
+                futures = [
+                    executor.submit(_save_range_chunks, self, plan, file_path, start, end,
+                                    range_dir, chunk_size, year, engine, row_offset)
+                    for (start, end), range_dir, row_offset in zip(ranges, range_dirs, row_offsets)
+                ]
+                for future in futures:
+                    future.result()
+
+            pieces = []
+            for range_dir, count in zip(range_dirs, counts):
+                range_manifest = Manifest.load(range_dir)
+                range_chunks = range_manifest.chunks if range_manifest else []
+                if sum(chunk['rows'] for chunk in range_chunks) != count:
+                    raise Exception(f'{file_path}: {range_dir} has a different number of rows than the lines counted')
+                pieces += [(os.path.join(range_dir, chunk['file']), chunk['rows']) for chunk in range_chunks]
+
+            manifest = Manifest(describe_source(file_path), plan.fingerprint, chunk_size, options=self.output_options)
+            group, group_rows = [], 0
+            for i, (path, rows) in enumerate(pieces):
+                group.append(path)
+                group_rows += rows
+                if group_rows < chunk_size and i < len(pieces) - 1:
+                    continue
+                chunk_file = f'chunk_{len(manifest.chunks)}.parquet.zstd'
+                _join_chunks(group, os.path.join(output_dir, chunk_file), plan.fixed_categories, engine)
+                manifest.add_chunk(output_dir, chunk_file, group_rows, save=False)
+                group, group_rows = [], 0
+        finally:
+            for range_dir in range_dirs:
+                shutil.rmtree(range_dir, ignore_errors=True)
+
+        manifest.finish(output_dir)
+        discard_stale_chunks(output_dir, manifest)
+
+    def _save_chunks(self, file_path: streams.Source, plan: ReadPlan, output_dir: str, chunk_size: int, year: int,
+                     engine: str, skiprows: Optional[list[int]] = None, has_header: bool = True,
+                     manifest: Optional[Manifest] = None, instrumentation: Optional[Instrumentation] = None,
+                     memory_budget: Optional[int] = None, pipelined: bool = False, cubes: bool = False,
+                     profile: bool = False, row_offset: int = 0):
+        instrumentation = instrumentation or Instrumentation()
+        depth = pipeline.in_flight(pipelined)
+
+        if engine == 'pyarrow':
+            block_size = arrow_block_size(memory_budget) if memory_budget else arrow_engine.ARROW_BLOCK_SIZE
+
+            with instrumentation.stage('parse'):
+                # o leitor do pyarrow já lê e converte o primeiro bloco ao ser aberto
+                tables = self._read_csv_arrow(file_path, plan, has_header=has_header, block_size=block_size)
+
+            with pipeline.writer_executor(pipelined) as executor, \
+                    closing(pipeline.prefetch(instrumentation.iterate('parse', tables), depth)) as tables:
+                writer = ArrowChunkWriter(output_dir, chunk_size, plan.fixed_categories, manifest, instrumentation,
+                                          executor, cubes, profile, row_offset)
+                for table in tables:
+                    with instrumentation.stage('post_process', rows=len(table)):
+                        table = self._post_process_table(table, plan, year, profile)
+                    writer.write(table)
+                    instrumentation.progress(len(table))
+
+                writer.close()
+            return
         
-        chunk_iterator, columns_rename_map, has_age = self._read_csv(file_path, chunk_size, skiprows=skiprows)
-        
-        for i, chunk in enumerate(chunk_iterator):
-            chunk = self._post_process_dataframe(chunk, columns_rename_map, year, has_age)
-            chunk_output_path = os.path.join(output_dir, f'chunk_{i}.parquet.zstd')
-            chunk.to_parquet(chunk_output_path, index=False, compression='zstd')
+        sizer = ChunkSizer(memory_budget, chunk_size, in_flight=depth) if memory_budget else None
+        chunk_iterator = self._read_csv(file_path, plan, sizer.rows if sizer else chunk_size, skiprows=skiprows,
+                                        has_header=has_header)
+        if sizer:
+            chunk_iterator = sizer.chunks(chunk_iterator)
+
+        with pipeline.writer_executor(pipelined) as executor, \
+                closing(pipeline.prefetch(instrumentation.iterate('parse', chunk_iterator), depth)) as chunks:
+            writer = ChunkWriter(output_dir, chunk_size, plan.fixed_categories, manifest, instrumentation, executor,
+                                 cubes, profile, row_offset)
+
+            for chunk in chunks:
+                with instrumentation.stage('post_process', rows=len(chunk)):
+                    processed = self._post_process_dataframe(chunk, plan, year, profile)
+                if sizer:
+                    sizer.observe(chunk, processed)
+                writer.write(processed)
+                instrumentation.progress(len(processed))
+
+            writer.close()
+
+    def read_and_save_split_chunks(self, file_path: streams.Source, output_dir: str, split_by: Callable[[pd.DataFrame], pd.Series],
+                                   chunk_size: int = 10000, year: Optional[int] = None,
+                                   skip_keys: Optional[set[str]] = None,
+                                   writer: Optional[SplitChunkWriter] = None,
+                                   source_info: Optional[dict] = None,
+                                   instrumentation: Optional[Instrumentation] = None,
+                                   memory_budget: Optional[int] = None, pipelined: bool = False,
+                                   cubes: bool = False, profile: bool = False) -> list[str]:
+        """
+        Lê o arquivo uma única vez e salva as linhas de cada chave retornada por split_by (ex.: o estado)
+        em output_dir/<chave>/chunk_N.parquet.zstd. Linhas com chave nula ou em skip_keys são descartadas.
+        Retorna as chaves salvas. Um writer pode ser passado para que o chamador saiba quais chaves
+        já foram escritas mesmo se a leitura falhar no meio. Cada chave recebe um manifesto próprio e
+        só é marcada como completa ao final (ver manifest.is_complete); chaves incompletas são refeitas.
+        memory_budget funciona como em read_and_save_chunks, contando o buffer de cada chave, assim como pipelined
+        e cubes e profile (um cubo e um perfil por chave).
+        """
+        file_path = streams.peekable(file_path)
+
+        if year is None:
+            year = self._extract_year_from_filename(file_path)
+
+        skip_keys = skip_keys or set()
+
+        plan = self.get_read_plan(file_path)
+        writer = writer or SplitChunkWriter(output_dir, chunk_size, plan.fixed_categories)
+        if writer.manifest is None:
+            writer.manifest = Manifest(source_info or describe_source(file_path), plan.fingerprint, writer.chunk_size,
+                                       options=self.output_options)
+        if instrumentation is not None:
+            writer.instrumentation = instrumentation
+        if cubes:
+            writer.cubes = True
+        if profile:
+            writer.profile = True
+        instrumentation = instrumentation or Instrumentation()
+
+        depth = pipeline.in_flight(pipelined)
+        sizer = ChunkSizer(memory_budget, writer.chunk_size, in_flight=depth) if memory_budget else None
+
+        with instrumentation.count(file_path) as source, pipeline.writer_executor(pipelined) as executor:
+            writer.executor = executor
+            chunk_iterator = self._read_csv(source, plan, sizer.rows if sizer else chunk_size)
+            if sizer:
+                chunk_iterator = sizer.chunks(chunk_iterator)
+
+            with closing(pipeline.prefetch(instrumentation.iterate('parse', chunk_iterator), depth)) as chunks:
+                for chunk in chunks:
+                    with instrumentation.stage('post_process', rows=len(chunk)):
+                        processed = self._post_process_dataframe(chunk, plan, year, profile)
+                    with instrumentation.stage('split', rows=len(processed)):
+                        keys = split_by(processed)
+                        keys = keys.where(~keys.isin(skip_keys))
+                    writer.write(processed, keys)
+                    if sizer:
+                        sizer.buffers = max(len(writer.keys()), 1)
+                        sizer.observe(chunk, processed)
+                    instrumentation.progress(len(processed))
+
+            writer.close()
+
+        instrumentation.finish()
+        return writer.keys()
     
-    def _post_process_dataframe(self, df: pd.DataFrame, rename_map: dict[str, str], year: int, has_age: bool) -> pd.DataFrame:
-        df = df.rename(columns=rename_map)
+    def _post_process_dataframe(self, df: pd.DataFrame, plan: ReadPlan, year: int,
+                                profile: bool = False) -> pd.DataFrame:
+        """Com profile, marca em quality.FLAGS_COLUMN os problemas que só aparecem no texto original"""
+        df = df.rename(columns=plan.rename_map)
+        raw_cpf, raw_date = df.get('Cpf'), df.get('DataAdmissao')
+
+        for column, transformation in plan.transformations.items():
+            df[column] = transformation(df[column])
 
         age_relative_to = pd.Timestamp(year=int(year), month=12, day=31, hour=23, minute=59, second=59)
-        if not has_age:
-            df['Idade'] = self._calculate_age(df['Idade'].str.zfill(8), age_relative_to)
+        if not plan.has_age:
+            df['Idade'] = self._calculate_age(df['Idade'], age_relative_to)
         
-        for mapping in self.column_mappings:
-            if isinstance(mapping.dtype, pd.CategoricalDtype):
-                df[mapping.new_name] = df[mapping.new_name].astype(mapping.dtype)
+        for column, dtype in plan.category_dtypes.items():
+            values = df[column]
+            df[column] = values.astype(dtype)
+            if dtype.categories is not None:
+                _check_unknown_categories(column, values, df[column].isna() & values.notna())
 
         df['Idade'] = df['Idade'].astype(np.int8)
         df['IsHomem'] = df['IsHomem'].astype(np.int8)
-        df['DataAdmissao'] = pd.to_datetime(df['DataAdmissao'].str.zfill(8), errors='coerce', format='%d%m%Y')
+        df['DataAdmissao'] = transformations.parse_date(df['DataAdmissao'])
+
+        if profile:
+            df[quality.FLAGS_COLUMN] = quality.row_flags(raw_cpf, raw_date, df['DataAdmissao'])
 
         return df
 
-    def _calculate_age(self, birthdate: pd.Series, relative_to: pd.Timestamp):
-        date_format = '%d%m%Y'
+    def _post_process_table(self, table: pa.Table, plan: ReadPlan, year: int, profile: bool = False) -> pa.Table:
+        dictionaries = {column: pa.array(dtype.categories, pa.string())
+                        for column, dtype in plan.category_dtypes.items() if dtype.categories is not None}
+        return arrow_engine.post_process(table, plan.rename_map, plan.transformations, plan.categorical_columns,
+                                         year, plan.has_age, dictionaries, profile)
 
-        birth = pd.to_datetime(birthdate, errors='coerce', format=date_format)
-        birth = birth.fillna(
-            pd.to_datetime('01' + birthdate.str[2:], format=date_format, errors='coerce') + pd.offsets.MonthEnd(0)
-        )
+    def _check_engine(self, engine: str, skiprows: Optional[list[int]]):
+        if engine not in self.ENGINES:
+            raise ValueError(f'Unknown engine {engine}. Expected one of: {", ".join(self.ENGINES)}')
+        if engine == 'pyarrow' and skiprows is not None:
+            raise ValueError('skiprows is not supported with the pyarrow engine')
 
-        has_had_birthday = (relative_to.month > birth.dt.month) | ((relative_to.month == birth.dt.month) & (relative_to.day >= birth.dt.day))
-        age = relative_to.year - birth.dt.year - (~has_had_birthday)
+    def _get_category_dtype(self, column: str) -> pd.CategoricalDtype:
+        if column in self.categories:
+            return pd.CategoricalDtype(self.categories[column])
+        return self.column_mappings[column].dtype
 
-        return age.astype(np.int8)
+    def _calculate_age(self, birthdate: pd.Series, relative_to: pd.Timestamp):
+        return transformations.calculate_age(birthdate, relative_to).astype(np.int8)
 
     def _extract_year_from_filename(self, filename: str) -> int:
         """Extrai o ano do nome do arquivo. Exemplo: 'AL2014ID.csv' -> 2014"""
 
-        filename = os.path.basename(filename)
+        filename = os.path.basename(str(getattr(filename, 'name', filename)))
         match = re.search(r'(\d+)(?=ID)', filename)
 
         if match is None:
@@ -129,53 +460,80 @@ class DatasetReader:
         return int(match.group(1))
 
     def _get_csv_columns(self, file_path: str):
-        """Obtém todas as colunas do CSV sem carregar os dados"""
-        return set(pd.read_csv(file_path, nrows=0, sep=';', encoding='latin-1').columns)
+        """Obtém todas as colunas do CSV, na ordem do arquivo, sem carregar os dados"""
+        return list(pd.read_csv(streams.head(file_path), nrows=0, sep=';', encoding='latin-1').columns)
     
     def _get_is_homem_transformation(self, file_path: str, current_columns: set[str]):
         """Retorna uma função que transforma a coluna IsHomem"""
 
         column = set(current_columns).intersection({'GENERO', 'SEXO TRABALHADOR', 'Sexo Trabalhador'})
-        sample_value = pd.read_csv(file_path, sep=';', encoding='latin-1', usecols=column, nrows=1).iloc[0, 0]
+        sample_value = pd.read_csv(streams.head(file_path), sep=';', encoding='latin-1', usecols=column, nrows=1).iloc[0, 0]
         if str(sample_value).strip().isdigit():
-            return lambda x: 0 if int(x) == 2 else int(x) # they use 1 for male, 2 for female, -1 for unidentified
-
-        def transform(val):
-            val = val.strip()[0].upper()
-            if val == 'M':
-                return 1
-            if val == 'F':
-                return 0
-            return -1
+            return transformations.parse_is_homem_numeric # they use 1 for male, 2 for female, -1 for unidentified
 
-        return transform
+        return transformations.parse_is_homem_text
     
-    def _populate_transformations(self, file_path: str, current_columns: set[str]) -> dict[str, Callable]:
-        """Define transformações para algumas colunas"""
-
-        def parse_money(x):
-            x = x.replace(',', '.', 1)
-            try:
-                x = np.float32(x)
-            except (ValueError, OverflowError):
-                x = -1
-
-            if x == np.inf:
-                x = -1
-            
-            return x
+    def _get_transformations(self, is_homem_transformation: Callable) -> dict[str, Callable]:
+        """Define transformações vetorizadas (aplicadas por chunk em _post_process_dataframe) para algumas colunas"""
 
         transformation_map = {
-            'Cpf': lambda x: re.sub(r'\D', '', str(x)).zfill(11),
-            'IsHomem': self._get_is_homem_transformation(file_path, current_columns),
-            'SalarioContratual': lambda x: parse_money(x),
-            'RemuneracaoMediaR$': lambda x: parse_money(x),
-            'RemuneracaoMedia': lambda x: parse_money(x),
-            'RemuneracaoDezembroR$': lambda x: parse_money(x),
-            'RemuneracaoDezembro': lambda x: parse_money(x),
-            'CboOcupacao2002': lambda x: re.sub(r'\D', '', str(x)),
-            'CnaeSubclasse20': lambda x: re.sub(r'\D', '', str(x)),
+            'Cpf': transformations.parse_cpf,
+            'IsHomem': is_homem_transformation,
+            **{column: transformations.parse_money for column in transformations.MONEY_COLUMNS},
+            'CboOcupacao2002': transformations.only_digits,
+            'CnaeSubclasse20': transformations.only_digits,
         }
 
-        self.column_mappings.populate_transformations(transformation_map)
-        return self.column_mappings.get_transformation_map()
+        if self.integer_ids:
+            transformation_map['Cpf'] = transformations.parse_cpf_int
+            transformation_map['CNPJ'] = transformations.parse_cnpj_int
+
+        if self.money_cents:
+            transformation_map.update({column: transformations.parse_money_cents for column in transformations.MONEY_COLUMNS})
+
+        return transformation_map
+
+
+def _check_unknown_categories(column: str, values: pd.Series, unknown: pd.Series):
+    if unknown.any():
+        examples = sorted(map(str, values[unknown].unique()))[:10]
+        raise Exception(f'{unknown.sum()} value(s) of {column} not in the fixed categories, e.g. {examples}. '
+                        'Add them with categories.scan/merge.')
+
+
+def _save_range_chunks(reader: DatasetReader, plan: ReadPlan, file_path: str, start: int, end: int,
+                       output_dir: str, chunk_size: int, year: int, engine: str, row_offset: int = 0):
+    """Executado nos workers de read_and_save_chunks_parallel"""
+    with streams.RangeFile(file_path, start, end) as range_file:
+        reader._save_chunks(range_file, plan, output_dir, chunk_size, year, engine, has_header=False,
+                            manifest=Manifest(describe_source(file_path), plan.fingerprint, chunk_size),
+                            row_offset=row_offset)
+
+
+def _join_chunks(paths: list[str], output_path: str, fixed_categories: bool, engine: str) -> None:
+    """Salva os pedaços (salvos pelo ChunkWriter da engine, em ordem) como um único chunk em output_path"""
+    if len(paths) == 1:
+        os.replace(paths[0], output_path)
+        return
+
+    if engine == 'pandas':
+        df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        if not fixed_categories:
+            # categóricos com categorias diferentes viram object no pd.concat
+            schema = pq.read_schema(paths[0])
+            df = ChunkWriter._fix_categories(df, [field.name for field in schema
+                                                  if pa.types.is_dictionary(field.type)])
+        df.to_parquet(output_path + TMP_SUFFIX, index=False, compression='zstd', row_group_size=len(df))
+        os.replace(output_path + TMP_SUFFIX, output_path)
+        return
+
+    # a largura dos índices dos dicionários pode mudar entre os pedaços
+    tables = [pq.read_table(path) for path in paths]
+    schema = unified_schema([table.schema for table in tables])
+    table = pa.concat_tables([table.cast(schema) for table in tables]).unify_dictionaries().combine_chunks()
+    if fixed_categories:
+        table = table.cast(tables[0].schema)  # o dicionário fixo é o mesmo em todos os pedaços
+    else:
+        table = ArrowChunkWriter._fix_dictionaries(table)
+    pq.write_table(table, output_path + TMP_SUFFIX, compression='zstd', row_group_size=len(table))
+    os.replace(output_path + TMP_SUFFIX, output_path)
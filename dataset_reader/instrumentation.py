@@ -0,0 +1,153 @@
+'''
+Instrumentação opcional do pipeline, em JSON lines (um evento por linha, acrescentado ao log_path).
+
+Eventos (todos com time, pid e source):
+    start     início da leitura de um arquivo, com total_bytes (tamanho descompactado)
+    stage     uma etapa de um chunk: extract, parse, post_process, split, write, cube ou profile, com
+              seconds, rows, bytes, rss e peak_rss. Em parse, read_seconds é o tempo esperando a origem
+              (disco ou 7z) e bytes são os bytes consumidos dela
+    progress  após cada chunk: linhas e bytes consumidos, fração de total_bytes, velocidade e ETA
+    end       fim do arquivo, com o total de segundos de cada etapa (para comparar execuções)
+
+Sem log_path nada é medido nem escrito, então Instrumentation() pode ser usado como padrão.
+As etapas podem ser medidas de várias threads (ex.: write, na thread do ChunkWriter, ver pipeline.py).
+'''
+
+import os
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator, Optional
+
+from . import streams
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class Instrumentation:
+    '''
+    Mede um arquivo (source). total_bytes é o tamanho descompactado, usado para a fração e o ETA; para
+    caminhos é obtido do arquivo, para streams de um .7z use helpers.get_inner_file_sizes.
+    '''
+
+    def __init__(self, log_path: Optional[str] = None, source: Optional[str] = None,
+                 total_bytes: Optional[int] = None):
+        self.log_path = log_path
+        self.source = source
+        self.total_bytes = total_bytes
+        self.rows = 0
+        self.totals: dict[str, float] = {}
+        self._lock = threading.Lock()  # totals e o log são atualizados pelas threads do pipeline
+        self._stream: Optional[streams.CountingStream] = None
+        self._start = time.perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.log_path is not None
+
+    def count(self, source: streams.Source):
+        '''
+        Envolve a origem em um streams.CountingStream (a ser usado com with) para medir os bytes consumidos
+        e o tempo esperando a origem. Marca o início da leitura.
+        '''
+        if not self.enabled:
+            return nullcontext(source)
+
+        if self.source is None:
+            self.source = os.path.basename(str(getattr(source, 'name', source)))
+        if self.total_bytes is None and not streams.is_stream(source):
+            self.total_bytes = os.path.getsize(source)
+
+        self._stream = streams.CountingStream(source)
+        self._start = time.perf_counter()
+        self.emit('start', total_bytes=self.total_bytes)
+        return self._stream
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        '''Mede o bloco como uma etapa. Campos podem ser acrescentados ao dicionário retornado (ex.: bytes).'''
+        if not self.enabled:
+            yield fields
+            return
+
+        snapshot = self._snapshot()
+        yield fields
+        self._emit_stage(name, snapshot, fields)
+
+    def iterate(self, name: str, iterable: Iterable) -> Iterable:
+        '''Mede cada next() de iterable (ex.: os chunks do leitor de CSV) como uma etapa, com rows=len(item)'''
+        if not self.enabled:
+            return iterable
+        return self._iterate(name, iterable)
+
+    def progress(self, rows: int) -> None:
+        self.rows += rows
+        if not self.enabled:
+            return
+
+        elapsed = time.perf_counter() - self._start
+        bytes_read = self._stream.bytes_read if self._stream else None
+        fraction = bytes_read / self.total_bytes if bytes_read is not None and self.total_bytes else None
+        eta = elapsed * (1 - fraction) / fraction if fraction else None
+
+        self.emit('progress', rows=self.rows, bytes=bytes_read, total_bytes=self.total_bytes,
+                  fraction=None if fraction is None else min(fraction, 1.0), elapsed=elapsed,
+                  rows_per_second=self.rows / elapsed if elapsed else None,
+                  mb_per_second=bytes_read / (1 << 20) / elapsed if bytes_read is not None and elapsed else None,
+                  eta_seconds=None if eta is None else max(eta, 0.0))
+
+    def finish(self) -> None:
+        if self.enabled:
+            with self._lock:
+                totals = dict(self.totals)
+            self.emit('end', rows=self.rows, bytes=self._stream.bytes_read if self._stream else None,
+                      seconds=time.perf_counter() - self._start, stages=totals, **_memory())
+
+    def emit(self, event: str, **fields) -> None:
+        if not self.enabled:
+            return
+        record = {'time': time.time(), 'event': event, 'pid': os.getpid(), 'source': self.source, **fields}
+        # uma escrita por linha em modo append: vários processos podem usar o mesmo arquivo
+        line = json.dumps(record) + '\n'
+        with self._lock, open(self.log_path, 'a') as f:
+            f.write(line)
+
+    def _iterate(self, name: str, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            snapshot = self._snapshot()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self._emit_stage(name, snapshot, {'rows': len(item)})
+            yield item
+
+    def _snapshot(self) -> tuple[float, int, float]:
+        if self._stream is None:
+            return time.perf_counter(), 0, 0.0
+        return time.perf_counter(), self._stream.bytes_read, self._stream.read_seconds
+
+    def _emit_stage(self, name: str, snapshot: tuple[float, int, float], fields: dict) -> None:
+        start, bytes_read, read_seconds = snapshot
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+        if name == 'parse' and self._stream is not None:
+            fields = {'bytes': self._stream.bytes_read - bytes_read,
+                      'read_seconds': self._stream.read_seconds - read_seconds, **fields}
+        self.emit('stage', stage=name, seconds=seconds, **fields, **_memory())
+
+
+def _memory() -> dict:
+    '''RSS atual (do /proc, no Linux) e pico de RSS do processo, em bytes'''
+    rss = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    return {'rss': rss, 'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
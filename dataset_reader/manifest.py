@@ -0,0 +1,167 @@
+'''
+Manifesto de um diretório de saída (output_dir/_manifest.json).
+
+Registra de onde vieram os chunks (arquivo, tamanho e data de modificação da origem), com qual plano
+de leitura e chunk_size foram gerados e, para cada chunk, a linha da origem onde ele começa, o número
+de linhas, o tamanho e o sha256. É salvo a cada chunk escrito, sempre de forma atômica, então um
+diretório interrompido pode ser retomado do último chunk válido e só diretórios marcados como completos
+(e com os chunks conferidos) são pulados. O prefixo "_" faz o pyarrow.dataset ignorar o arquivo.
+'''
+
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+from . import streams
+
+MANIFEST_FILE = '_manifest.json'
+TMP_SUFFIX = '.tmp'
+
+_CHUNK_FILE = re.compile(r'(chunk|sorted)_\d+\.parquet\.zstd(\.tmp)?$')
+
+
+class Manifest:
+    '''
+    sorted_by: coluna pela qual os chunks foram reordenados (ver cpf_index.sort_by_cpf), ou None.
+    options: opções do leitor que mudam o schema dos chunks (ver DatasetReader.output_options). Opções
+    ausentes (manifestos anteriores a elas) valem False.
+    '''
+
+    def __init__(self, source: dict, plan_fingerprint: str, chunk_size: int,
+                 chunks: Optional[list[dict]] = None, complete: bool = False, sorted_by: Optional[str] = None,
+                 options: Optional[dict] = None):
+        self.source = source
+        self.plan_fingerprint = plan_fingerprint
+        self.chunk_size = chunk_size
+        self.chunks = chunks or []
+        self.complete = complete
+        self.sorted_by = sorted_by
+        self.options = options or {}
+
+    @property
+    def rows(self) -> int:
+        '''Linhas da origem já salvas'''
+        return sum(chunk['rows'] for chunk in self.chunks)
+
+    def matches(self, source: dict, plan_fingerprint: str, chunk_size: int) -> bool:
+        '''True se os chunks foram gerados a partir da mesma origem, com o mesmo plano e chunk_size'''
+        return (self.source == source and None not in source.values()
+                and self.plan_fingerprint == plan_fingerprint and self.chunk_size == chunk_size)
+
+    def has_options(self, options: dict) -> bool:
+        return all(self.options.get(name, False) == value for name, value in options.items())
+
+    def add_chunk(self, output_dir: str, file_name: str, rows: int, save: bool = True) -> None:
+        path = os.path.join(output_dir, file_name)
+        self.chunks.append({
+            'file': file_name,
+            'row_offset': self.rows,
+            'rows': rows,
+            'size': os.path.getsize(path),
+            'sha256': file_checksum(path),
+        })
+        if save:
+            self.save(output_dir)
+
+    def finish(self, output_dir: str) -> None:
+        self.complete = True
+        self.save(output_dir)
+
+    def valid_chunks(self, output_dir: str, checksums: bool = True) -> int:
+        '''Quantos chunks, desde o primeiro, existem e conferem com o manifesto'''
+        for i, chunk in enumerate(self.chunks):
+            path = os.path.join(output_dir, chunk['file'])
+            if not os.path.exists(path) or os.path.getsize(path) != chunk['size']:
+                return i
+            if checksums and file_checksum(path) != chunk['sha256']:
+                return i
+        return len(self.chunks)
+
+    def truncate(self, output_dir: str) -> None:
+        '''
+        Descarta os chunks a partir do primeiro inválido, para retomar a escrita dali. Chunks reordenados
+        não correspondem mais a faixas de linhas da origem, então são todos descartados.
+        '''
+        self.chunks = [] if self.sorted_by else self.chunks[:self.valid_chunks(output_dir)]
+        self.complete = False
+        self.sorted_by = None
+        self.save(output_dir)
+        discard_stale_chunks(output_dir, self)
+
+    def save(self, output_dir: str) -> None:
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, MANIFEST_FILE)
+        with open(path + TMP_SUFFIX, 'w') as f:
+            json.dump(self.__dict__, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + TMP_SUFFIX, path)
+
+    @staticmethod
+    def load(output_dir: str) -> Optional['Manifest']:
+        path = os.path.join(output_dir, MANIFEST_FILE)
+        try:
+            with open(path) as f:
+                return Manifest(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+
+def describe_source(source: streams.Source, archive: Optional[str] = None) -> dict:
+    '''
+    Identifica a origem para o manifesto. Para um arquivo lido de dentro de um .7z, passe o .7z em archive.
+    Streams sem archive não têm tamanho nem data e por isso nunca são retomados.
+    '''
+    name = os.path.basename(str(getattr(source, 'name', source)))
+    stat_path = archive if archive is not None else (None if streams.is_stream(source) else source)
+
+    if stat_path is None:
+        return {'name': name, 'size': None, 'mtime': None}
+
+    stat = os.stat(stat_path)
+    if archive is not None:
+        name = f'{os.path.basename(str(archive))}/{name}'
+    return {'name': name, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def is_complete(output_dir: str, checksums: bool = False, options: Optional[dict] = None) -> bool:
+    '''
+    True se o diretório tem um manifesto completo e todos os chunks existem com o tamanho registrado.
+    Com checksums, também confere o sha256 de cada chunk (lê todos os arquivos). Com options (ver
+    DatasetReader.output_options), um diretório salvo com outras opções não está completo e é refeito,
+    para que a árvore não misture schemas (ex.: salários em float e em centavos).
+    '''
+    manifest = Manifest.load(output_dir)
+    return (manifest is not None and manifest.complete
+            and (options is None or manifest.has_options(options))
+            and manifest.valid_chunks(output_dir, checksums) == len(manifest.chunks))
+
+
+def chunk_files(output_dir: str) -> list[str]:
+    '''Caminhos dos chunks do manifesto ou, sem ele, dos arquivos que o pyarrow.dataset leria do diretório'''
+    manifest = Manifest.load(output_dir)
+    if manifest is not None:
+        return [os.path.join(output_dir, chunk['file']) for chunk in manifest.chunks]
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                  if not name.startswith(('_', '.')) and os.path.isfile(os.path.join(output_dir, name)))
+
+
+def discard_stale_chunks(output_dir: str, manifest: Manifest) -> None:
+    '''Remove chunks (e temporários) que não estão no manifesto, de uma execução interrompida'''
+    if not os.path.isdir(output_dir):
+        return
+
+    known = {chunk['file'] for chunk in manifest.chunks}
+    for file_name in os.listdir(output_dir):
+        if _CHUNK_FILE.match(file_name) and file_name not in known:
+            os.remove(os.path.join(output_dir, file_name))
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(streams.BUFFER_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
@@ -0,0 +1,295 @@
+'''
+Painel longitudinal por Cpf, construído fora da memória.
+
+build_panel lê a árvore de filtrados (original ou compactada) e escreve um painel com uma linha por vínculo
+por ano (as linhas da RAIS, com as colunas year e uf), agrupado por Cpf, em duas passadas:
+
+    1. particiona: as linhas de cada estado/ano vão para num_buckets buckets no disco, pelo hash do Cpf,
+       então todas as linhas de um Cpf (de todos os anos) ficam no mesmo bucket
+    2. junta: cada bucket é lido sozinho, ordenado por Cpf e ano e salvo em bucket=<k>/sorted_0.parquet.zstd
+
+O número de buckets é escolhido para que um bucket caiba na memória de um worker (memory_budget / workers),
+então a memória não depende do tamanho da árvore. As duas passadas rodam em um pool de processos e são
+retomadas: estados já particionados e buckets já salvos (com manifesto completo) são pulados.
+Linhas sem Cpf válido (vazio, zerado ou inválido) são descartadas, porque não há como segui-las.
+'''
+
+import json
+import math
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .chunk_writer import ArrowChunkWriter
+from .cpf_index import CPF_COLUMN, ROW_GROUP_SIZE, STATE_COLUMN, YEAR_COLUMN
+from .manifest import TMP_SUFFIX, Manifest, discard_stale_chunks, is_complete
+from .transformations import INVALID_ID
+
+PANEL_FILE = '_panel.json'
+BUCKETS_DIR = '_buckets'  # passada 1; o prefixo "_" faz o pyarrow.dataset ignorar o diretório
+
+PARTITION_BATCH_ROWS = 500_000  # linhas lidas por vez na passada 1
+# memória para juntar um bucket, por byte descompactado dos row groups de entrada: a tabela lida,
+# a ordenada e as cópias ao recodificar os dicionários e escrever
+JOIN_MEMORY_PER_BYTE = 3
+
+
+def build_panel(root: str, panel_root: str, memory_budget: int, years: Optional[Iterable[int]] = None,
+                columns: Optional[list[str]] = None, workers: Optional[int] = None,
+                fixed_categories: bool = False) -> int:
+    '''
+    Constrói o painel de root (filtrados/<ano>/<UF> ou compactados/year=<ano>/uf=<UF>) em panel_root.
+    memory_budget (bytes) é a memória total dos workers. columns limita as colunas (Cpf sempre é incluído).
+    Se as entradas ou as opções mudaram desde a última execução, o painel é refeito do zero.
+    Os anos precisam ter o Cpf do mesmo tipo (texto ou inteiro). Retorna o número de buckets.
+    '''
+    workers = workers or os.cpu_count() or 1
+    sources = _source_dirs(root, years)
+    if not sources:
+        raise Exception(f'No complete year/state directories in {root}')
+
+    num_buckets = max(math.ceil(sum(_uncompressed_size(s['files']) for s in sources) * JOIN_MEMORY_PER_BYTE
+                                / max(memory_budget // workers, 1)), 1)
+    config = {
+        'sources': [{key: s[key] for key in ('year', 'state', 'source')} for s in sources],
+        'columns': columns,
+        'fixed_categories': fixed_categories,
+    }
+
+    panel = load_panel_info(panel_root)
+    if panel is not None and {key: panel.get(key) for key in config} == config:
+        if panel['complete']:
+            return panel['num_buckets']
+        num_buckets = panel['num_buckets']
+    else:
+        shutil.rmtree(panel_root, ignore_errors=True)
+        os.makedirs(panel_root)
+        _save_panel_info(panel_root, {**config, 'num_buckets': num_buckets, 'complete': False})
+
+    buckets_dir = os.path.join(panel_root, BUCKETS_DIR)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_partition_source, source, buckets_dir, num_buckets, columns)
+                   for source in sources]
+        for future in futures:
+            future.result()
+
+        futures = [executor.submit(_join_bucket, buckets_dir, bucket, _bucket_dir(panel_root, bucket),
+                                   fixed_categories)
+                   for bucket in range(num_buckets)]
+        for future in futures:
+            future.result()
+
+    shutil.rmtree(buckets_dir, ignore_errors=True)
+    _save_panel_info(panel_root, {**config, 'num_buckets': num_buckets, 'complete': True})
+    return num_buckets
+
+
+def read_panel(panel_root: str, cpfs: list, columns: Optional[list[str]] = None) -> pa.Table:
+    '''Lê as linhas dos cpfs (texto ou inteiros) em todos os anos, abrindo só os buckets deles'''
+    num_buckets = load_panel_info(panel_root)['num_buckets']
+    keys = cpf_keys(pa.array([re.sub(r'\D', '', str(cpf)) for cpf in cpfs], pa.string()))
+    keys = keys[keys != INVALID_ID]
+
+    files = []
+    for bucket in np.unique(bucket_ids(keys, num_buckets)):
+        manifest = Manifest.load(_bucket_dir(panel_root, bucket))
+        files += [os.path.join(_bucket_dir(panel_root, bucket), chunk['file']) for chunk in manifest.chunks]
+    if not files:
+        return pa.table({})
+
+    dataset = ds.dataset(files, format='parquet')
+    cpf_type = dataset.schema.field(CPF_COLUMN).type
+    if pa.types.is_integer(cpf_type):
+        cpf_array = pa.array(keys, cpf_type)
+    else:
+        cpf_array = pa.array([str(key).zfill(11) for key in keys], cpf_type)
+    return dataset.to_table(columns=columns, filter=pc.field(CPF_COLUMN).isin(cpf_array))
+
+
+def load_panel_info(panel_root: str) -> Optional[dict]:
+    path = os.path.join(panel_root, PANEL_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def cpf_keys(column) -> np.ndarray:
+    '''Cpf (texto ou inteiro) como int64, com INVALID_ID para nulos, vazios e inválidos'''
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+
+    if pa.types.is_integer(column.type):
+        keys = pc.cast(column, pa.int64())
+    else:
+        valid = pc.match_substring_regex(column, '^[0-9]{1,18}$')
+        keys = pc.cast(pc.if_else(valid, column, str(INVALID_ID)), pa.int64())
+
+    keys = pc.fill_null(keys, INVALID_ID).to_numpy(zero_copy_only=False).copy()
+    keys[keys <= 0] = INVALID_ID  # '00000000000' é um Cpf vazio
+    return keys
+
+
+def bucket_ids(keys: np.ndarray, num_buckets: int) -> np.ndarray:
+    '''Bucket de cada Cpf (ver cpf_keys): splitmix64 do valor, para espalhar CPFs próximos'''
+    x = keys.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x % np.uint64(num_buckets)).astype(np.int32)
+
+
+def _partition_source(source: dict, buckets_dir: str, num_buckets: int, columns: Optional[list[str]]) -> None:
+    '''Passada 1 para um estado/ano: escreve _buckets/<k>/<ano>_<UF>-N.parquet para cada bucket com linhas dele'''
+    name = f'{source["year"]}_{source["state"]}'
+    done_path = os.path.join(buckets_dir, '_done', name)
+    if os.path.exists(done_path):
+        return
+
+    # um arquivo por bucket; se o schema mudar entre os chunks (ex.: uma coluna toda nula em um deles)
+    # e não for possível converter, o bucket ganha outro arquivo
+    writers: dict[int, pq.ParquetWriter] = {}
+    paths: dict[int, list[str]] = {}
+    try:
+        for path in source['files']:
+            parquet_file = pq.ParquetFile(path)
+            read_columns = None
+            if columns is not None:
+                names = parquet_file.schema_arrow.names
+                read_columns = [c for c in dict.fromkeys([CPF_COLUMN, *columns]) if c in names]
+
+            for batch in parquet_file.iter_batches(batch_size=PARTITION_BATCH_ROWS, columns=read_columns):
+                table = _normalize(pa.Table.from_batches([batch]), source)
+                keys = cpf_keys(table.column(CPF_COLUMN))
+                buckets = bucket_ids(keys, num_buckets)
+                buckets[keys == INVALID_ID] = -1
+
+                for bucket in np.unique(buckets[buckets >= 0]):
+                    part = table.filter(pa.array(buckets == bucket))
+                    writer = writers.get(bucket)
+                    if writer is not None and not part.schema.equals(writer.schema):
+                        try:
+                            part = part.cast(writer.schema)
+                        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError):
+                            writer.close()
+                            writer = None
+
+                    if writer is None:
+                        paths.setdefault(bucket, []).append(
+                            os.path.join(buckets_dir, str(bucket), f'{name}-{len(paths.get(bucket, []))}.parquet'))
+                        os.makedirs(os.path.dirname(paths[bucket][-1]), exist_ok=True)
+                        writer = writers[bucket] = pq.ParquetWriter(paths[bucket][-1] + TMP_SUFFIX, part.schema)
+                    writer.write_table(part)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for bucket_paths in paths.values():
+        for bucket_path in bucket_paths:
+            os.replace(bucket_path + TMP_SUFFIX, bucket_path)
+
+    os.makedirs(os.path.dirname(done_path), exist_ok=True)
+    open(done_path, 'w').close()
+
+
+def _join_bucket(buckets_dir: str, bucket: int, output_dir: str, fixed_categories: bool) -> None:
+    '''Passada 2: junta as linhas de todos os anos do bucket, ordenadas por Cpf e ano'''
+    if is_complete(output_dir):
+        return
+
+    part_dir = os.path.join(buckets_dir, str(bucket))
+    parts = sorted(os.listdir(part_dir)) if os.path.exists(part_dir) else []
+    parts = [part for part in parts if part.endswith('.parquet')]
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest({'name': part_dir, 'parts': parts}, '', ROW_GROUP_SIZE, sorted_by=CPF_COLUMN)
+
+    if parts:
+        # o schema varia entre os layouts (anos): colunas ausentes viram nulas
+        table = pa.concat_tables([pq.read_table(os.path.join(part_dir, part)) for part in parts],
+                                 promote_options='permissive')
+        table = table.unify_dictionaries().combine_chunks()
+        table = table.sort_by([(CPF_COLUMN, 'ascending'), (YEAR_COLUMN, 'ascending')])
+        if not fixed_categories:
+            table = ArrowChunkWriter._fix_dictionaries(table)
+
+        file_name = 'sorted_0.parquet.zstd'
+        path = os.path.join(output_dir, file_name)
+        pq.write_table(table, path + TMP_SUFFIX, compression='zstd', row_group_size=ROW_GROUP_SIZE)
+        os.replace(path + TMP_SUFFIX, path)
+        manifest.add_chunk(output_dir, file_name, len(table), save=False)
+
+    manifest.finish(output_dir)
+    discard_stale_chunks(output_dir, manifest)
+
+
+def _normalize(table: pa.Table, source: dict) -> pa.Table:
+    '''Acrescenta year e uf e usa índices int32 nos dicionários, que variam de largura entre os chunks'''
+    fields = [
+        pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ]
+    table = table.cast(pa.schema(fields)).replace_schema_metadata(None)
+    table = table.append_column(YEAR_COLUMN, pa.array(np.full(len(table), source['year'], np.int16)))
+    return table.append_column(STATE_COLUMN, pa.array([source['state']] * len(table), pa.string()))
+
+
+def _source_dirs(root: str, years: Optional[Iterable[int]]) -> list[dict]:
+    '''Diretórios <ano>/<UF> (ou year=<ano>/uf=<UF>) com manifesto completo'''
+    years = None if years is None else {int(year) for year in years}
+    sources = []
+
+    for year_name in sorted(os.listdir(root)):
+        year = year_name.removeprefix('year=')
+        if not year.isdigit() or not os.path.isdir(os.path.join(root, year_name)):
+            continue
+        if years is not None and int(year) not in years:
+            continue
+
+        for state_name in sorted(os.listdir(os.path.join(root, year_name))):
+            state_dir = os.path.join(root, year_name, state_name)
+            manifest = Manifest.load(state_dir)
+            if manifest is None or not manifest.complete:
+                continue
+
+            sources.append({
+                'year': int(year),
+                'state': state_name.removeprefix('uf='),
+                'source': {'name': state_dir, 'size': sum(chunk['size'] for chunk in manifest.chunks),
+                           'mtime': os.path.getmtime(os.path.join(state_dir, '_manifest.json'))},
+                'files': [os.path.join(state_dir, chunk['file']) for chunk in manifest.chunks],
+            })
+
+    return sources
+
+
+def _uncompressed_size(files: list[str]) -> int:
+    size = 0
+    for path in files:
+        metadata = pq.read_metadata(path)
+        size += sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+    return size
+
+
+def _bucket_dir(panel_root: str, bucket: int) -> str:
+    return os.path.join(panel_root, f'bucket={bucket}')
+
+
+def _save_panel_info(panel_root: str, info: dict) -> None:
+    path = os.path.join(panel_root, PANEL_FILE)
+    with open(path + TMP_SUFFIX, 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(path + TMP_SUFFIX, path)
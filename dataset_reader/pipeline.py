@@ -0,0 +1,90 @@
+'''
+Pipeline em threads para sobrepor as etapas de read_and_save_chunks (com pipelined=True):
+
+    descompressão    processo do 7z (ou thread do py7zr) escrevendo no pipe (ver filtering/helpers.py)
+    parse            thread que lê os chunks do CSV (prefetch)
+    transformação    thread principal (_post_process_dataframe)
+    compressão/E/S   thread que comprime e salva os chunks (writer_executor, ver ChunkWriter)
+
+As filas entre as etapas têm no máximo PIPELINE_DEPTH chunks, então uma etapa lenta segura as anteriores
+(o pipe do 7z faz o mesmo com a descompressão) e a memória fica limitada. O parser do pandas e a escrita do
+Parquet (zstd) liberam o GIL durante a maior parte do trabalho, então as threads rodam de fato em paralelo.
+A saída é idêntica à da leitura sequencial: os chunks são salvos em ordem, por uma única thread.
+'''
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+PIPELINE_DEPTH = 2  # chunks em cada fila
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, depth: int = PIPELINE_DEPTH) -> Iterator:
+    '''
+    Consome iterable em uma thread, até depth itens à frente de quem lê. Exceções da thread são relançadas
+    na leitura. Use com contextlib.closing: se quem lê parar antes do fim, a thread para depois do item atual.
+    Com depth=0, apenas repassa os itens, sem thread.
+    '''
+    if depth <= 0:
+        yield from iterable
+        return
+
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, name='prefetch', daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+@contextmanager
+def writer_executor(enabled: bool = True):
+    '''Uma thread para comprimir e salvar os chunks em ordem (ver ChunkWriter), ou None se não enabled'''
+    if not enabled:
+        yield None
+        return
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='chunk_writer') as executor:
+        yield executor
+
+
+def in_flight(enabled: bool) -> int:
+    '''Chunks a mais em memória em cada fila do pipeline (ver chunk_sizing.ChunkSizer)'''
+    return PIPELINE_DEPTH if enabled else 0
@@ -0,0 +1,337 @@
+'''
+Perfil de qualidade dos dados calculado durante a leitura, sem uma segunda passada pelos chunks.
+
+Com read_and_save_chunks(profile=True), cada chunk salvo ganha um perfil parcial (em output_dir/_profile/):
+linhas e, por coluna, nulos, mínimo e máximo (colunas numéricas e datas), uma contagem aproximada de valores
+distintos (HyperLogLog, erro de ~1,6%) e os problemas conhecidos de algumas colunas (ver CHECKS):
+
+    Cpf                 padded: menos de 11 caracteres no arquivo (zeros à esquerda omitidos e recolocados)
+                        invalid: vazio (00000000000) ou com mais de 11 dígitos
+    salários            invalid: valores que parse_money não converteu (INVALID_MONEY, ou INVALID_CENTS)
+    DataAdmissao        unparsed: data preenchida no arquivo que virou NaT
+    Idade               out_of_range: fora de MIN_AGE a MAX_AGE
+    IsHomem             unknown: sexo não identificado (-1)
+
+padded e unparsed dependem do texto original, que não é salvo: o pós-processamento marca as linhas em uma
+coluna FLAGS_COLUMN, que o ChunkWriter retira antes de salvar. Todos os campos podem ser somados (ou, nos
+distintos, juntados pelo máximo dos registradores), então os perfis se juntam em qualquer ordem: ao terminar
+o diretório, os parciais dos chunks do manifesto viram output_dir/_profile.json (uma leitura retomada não
+conta linhas duas vezes) e merge_profiles junta os estados e os anos.
+'''
+
+import base64
+import json
+import os
+import shutil
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .manifest import TMP_SUFFIX, Manifest
+from .transformations import CPF_DIGITS, INVALID_ID, MONEY_COLUMNS, is_invalid_money
+
+PROFILE_FILE = '_profile.json'
+PARTIALS_DIR = '_profile'
+
+FLAGS_COLUMN = '_quality_flags'
+CPF_PADDED = 1
+DATE_UNPARSED = 2
+
+MIN_AGE = 14
+MAX_AGE = 100
+
+SKETCH_BITS = 12  # 2^12 registradores por coluna: erro padrão de 1,04 / 64
+_REGISTERS = 1 << SKETCH_BITS
+
+Data = Union[pd.DataFrame, pa.Table]
+
+
+def _cpf_checks(values: pd.Series, flags: Optional[np.ndarray]) -> dict:
+    if pd.api.types.is_integer_dtype(values.dtype):
+        invalid = values == INVALID_ID
+    else:
+        invalid = (values == '0' * CPF_DIGITS).to_numpy() | (_lengths(values) > CPF_DIGITS)
+    checks = {'invalid': int(np.count_nonzero(invalid))}
+    if flags is not None:
+        checks['padded'] = int(np.count_nonzero(flags & CPF_PADDED))
+    return checks
+
+
+def _date_checks(values: pd.Series, flags: Optional[np.ndarray]) -> dict:
+    return {'unparsed': int(np.count_nonzero(flags & DATE_UNPARSED))} if flags is not None else {}
+
+
+CHECKS = {
+    'Cpf': _cpf_checks,
+    'DataAdmissao': _date_checks,
+    'Idade': lambda values, flags: {'out_of_range': int((~values.between(MIN_AGE, MAX_AGE)).sum())},
+    'IsHomem': lambda values, flags: {'unknown': int((values == -1).sum())},
+    **{column: (lambda values, flags: {'invalid': int(is_invalid_money(values).sum())}) for column in MONEY_COLUMNS},
+}
+
+
+class Profile:
+    '''
+    Perfil de um conjunto de linhas. columns tem, para cada coluna, nulls, min, max, os contadores de CHECKS
+    e o sketch dos valores distintos (registradores do HyperLogLog em base64; ver distinct).
+    raw_rows são as linhas em que padded e unparsed foram verificados (chunks salvos sem perfil não têm o
+    texto original).
+    '''
+
+    def __init__(self, rows: int = 0, raw_rows: int = 0, columns: Optional[dict[str, dict]] = None):
+        self.rows = rows
+        self.raw_rows = raw_rows
+        self.columns = columns or {}
+
+    @staticmethod
+    def of(data: Data, flags: Optional[np.ndarray] = None) -> 'Profile':
+        '''Perfil de um DataFrame ou tabela (sem FLAGS_COLUMN; flags são as marcas de cada linha, se houver)'''
+        profile = Profile(len(data), len(data) if flags is not None else 0)
+        for name in data.columns if isinstance(data, pd.DataFrame) else data.column_names:
+            values = data[name] if isinstance(data, pd.DataFrame) else data.column(name).to_pandas()
+            profile.columns[name] = _column_profile(name, values, flags)
+        return profile
+
+    def merge(self, other: 'Profile') -> 'Profile':
+        '''Junta other a este perfil (e o retorna)'''
+        self.rows += other.rows
+        self.raw_rows += other.raw_rows
+        for name, stats in other.columns.items():
+            current = self.columns.setdefault(name, {})
+            for key, value in stats.items():
+                if key not in current or value is None:
+                    current.setdefault(key, value)
+                elif current[key] is None:
+                    current[key] = value
+                elif key == 'min':
+                    current[key] = min(current[key], value)
+                elif key == 'max':
+                    current[key] = max(current[key], value)
+                elif key == 'sketch':
+                    current[key] = _encode(np.maximum(_decode(current[key]), _decode(value)))
+                else:
+                    current[key] += value
+        return self
+
+    def distinct(self, column: str) -> int:
+        '''Número aproximado de valores distintos (não nulos) da coluna'''
+        return _estimate(_decode(self.columns[column]['sketch']))
+
+    def summary(self) -> pd.DataFrame:
+        '''Uma linha por coluna: nulos, distintos, mínimo, máximo e os contadores de CHECKS'''
+        rows = []
+        for name, stats in self.columns.items():
+            row = {'column': name, 'distinct': self.distinct(name)}
+            row.update({key: value for key, value in stats.items() if key != 'sketch'})
+            rows.append(row)
+        return pd.DataFrame(rows).set_index('column')
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + TMP_SUFFIX, 'w') as f:
+            json.dump(self.__dict__, f)
+        os.replace(path + TMP_SUFFIX, path)
+
+    @staticmethod
+    def load(path: str) -> 'Profile':
+        with open(path) as f:
+            return Profile(**json.load(f))
+
+
+def row_flags(raw_cpf: Optional[pd.Series], raw_date: Optional[pd.Series], parsed_date: pd.Series) -> np.ndarray:
+    '''Marcas de cada linha (CPF_PADDED, DATE_UNPARSED) a partir do texto original de Cpf e DataAdmissao'''
+    flags = np.zeros(len(parsed_date), np.uint8)
+    if raw_cpf is not None:
+        length = _lengths(raw_cpf)
+        flags[(length > 0) & (length < CPF_DIGITS)] |= CPF_PADDED
+    if raw_date is not None:
+        flags[(raw_date.notna() & (raw_date != '') & parsed_date.isna()).to_numpy(bool)] |= DATE_UNPARSED
+    return flags
+
+
+def arrow_row_flags(raw_cpf: Optional[pa.ChunkedArray], raw_date: Optional[pa.ChunkedArray],
+                    parsed_date: pa.ChunkedArray) -> pa.ChunkedArray:
+    '''Como row_flags, para colunas Arrow'''
+    flags = pa.array(np.zeros(len(parsed_date), np.uint8))
+    if raw_cpf is not None:
+        length = pc.utf8_length(raw_cpf)
+        padded = pc.fill_null(pc.and_(pc.greater(length, 0), pc.less(length, CPF_DIGITS)), False)
+        flags = pc.bit_wise_or(flags, pc.if_else(padded, CPF_PADDED, 0).cast(pa.uint8()))
+    if raw_date is not None:
+        unparsed = pc.and_(pc.fill_null(pc.not_equal(raw_date, ''), False), pc.is_null(parsed_date))
+        flags = pc.bit_wise_or(flags, pc.if_else(unparsed, DATE_UNPARSED, 0).cast(pa.uint8()))
+    return flags
+
+
+def split_flags(chunk: Data) -> tuple[Data, Optional[np.ndarray]]:
+    '''Separa FLAGS_COLUMN do chunk (ver ChunkWriter). Retorna o chunk sem ela e as marcas, ou None'''
+    if isinstance(chunk, pd.DataFrame):
+        if FLAGS_COLUMN not in chunk.columns:
+            return chunk, None
+        return chunk.drop(columns=FLAGS_COLUMN), chunk[FLAGS_COLUMN].to_numpy()
+
+    if FLAGS_COLUMN not in chunk.column_names:
+        return chunk, None
+    flags = chunk.column(FLAGS_COLUMN).to_numpy()
+    return chunk.drop_columns(FLAGS_COLUMN), flags
+
+
+def save_partial(chunk: Data, flags: Optional[np.ndarray], output_dir: str, chunk_file: str) -> None:
+    '''Salva o perfil de um chunk em output_dir/_profile/<chunk_file>.json (ver ChunkWriter)'''
+    Profile.of(chunk, flags).save(_partial_path(output_dir, chunk_file))
+
+
+def combine_partials(output_dir: str, manifest: Manifest) -> Profile:
+    '''
+    Junta os parciais dos chunks do manifesto em output_dir/_profile.json. Chunks sem parcial (salvos antes
+    do perfil ser ligado) são lidos, sem padded e unparsed. Parciais de chunks descartados são ignorados.
+    '''
+    profile = Profile()
+    for chunk in manifest.chunks:
+        path = _partial_path(output_dir, chunk['file'])
+        if os.path.exists(path):
+            profile.merge(Profile.load(path))
+        else:
+            profile.merge(Profile.of(pd.read_parquet(os.path.join(output_dir, chunk['file']))))
+
+    profile.save(os.path.join(output_dir, PROFILE_FILE))
+    shutil.rmtree(os.path.join(output_dir, PARTIALS_DIR), ignore_errors=True)
+    return profile
+
+
+def discard_profile(output_dir: str) -> None:
+    '''Remove output_dir/_profile.json, que deixa de valer quando os chunks do diretório mudam'''
+    path = os.path.join(output_dir, PROFILE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def merge_profiles(root: str, profiles_dir: str, years: Optional[list[int]] = None) -> list[str]:
+    '''
+    Junta os perfis dos diretórios <ano>/<UF> (ou year=<ano>/uf=<UF>) com manifesto completo em
+    profiles_dir/profile_<ano>.json e, todos os anos, em profiles_dir/profile.json. Diretórios sem
+    _profile.json têm os chunks lidos. Retorna os arquivos escritos.
+    '''
+    written = []
+    total = Profile()
+
+    for year_name in sorted(os.listdir(root)):
+        year = year_name.removeprefix('year=')
+        if not year.isdigit() or not os.path.isdir(os.path.join(root, year_name)):
+            continue
+        if years is not None and int(year) not in {int(y) for y in years}:
+            continue
+
+        year_profile = Profile()
+        for state_name in sorted(os.listdir(os.path.join(root, year_name))):
+            state_dir = os.path.join(root, year_name, state_name)
+            manifest = Manifest.load(state_dir)
+            if manifest is None or not manifest.complete:
+                continue
+
+            path = os.path.join(state_dir, PROFILE_FILE)
+            year_profile.merge(Profile.load(path) if os.path.exists(path) else combine_partials(state_dir, manifest))
+
+        if not year_profile.rows:
+            continue
+
+        path = os.path.join(profiles_dir, f'profile_{year}.json')
+        year_profile.save(path)
+        written.append(path)
+        total.merge(year_profile)
+
+    if written:
+        path = os.path.join(profiles_dir, 'profile.json')
+        total.save(path)
+        written.append(path)
+
+    return written
+
+
+def _column_profile(name: str, values: pd.Series, flags: Optional[np.ndarray]) -> dict:
+    nulls = int(values.isna().sum())
+    stats = {'nulls': nulls, 'min': None, 'max': None}
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes.to_numpy()
+        present = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories)) > 0
+        hashes = _hash(values.cat.categories.to_numpy()[present])
+    else:
+        present = (values.dropna() if nulls else values).to_numpy()
+        if len(present) and present.dtype.kind in 'biufM':
+            low, high = present.min(), present.max()
+            if present.dtype.kind == 'M':
+                stats['min'], stats['max'] = pd.Timestamp(low).isoformat(), pd.Timestamp(high).isoformat()
+            else:
+                stats['min'], stats['max'] = low.item(), high.item()
+        if len(present) and present.dtype.kind in 'biu' and present.dtype.itemsize <= 2:
+            # poucos valores possíveis: o sketch só depende dos distintos, então basta um hash por valor
+            offset = int(low)
+            present = np.flatnonzero(np.bincount(present.astype(np.int64) - offset)) + offset
+        hashes = _hash(present)
+
+    stats['sketch'] = _encode(_sketch(hashes))
+    if name in CHECKS:
+        stats.update(CHECKS[name](values, flags))
+    return stats
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    '''Hash de 64 bits de cada valor, igual para o mesmo valor em qualquer engine e tipo inteiro'''
+    if values.dtype.kind in 'biu':
+        values = values.astype(np.int64)
+    elif values.dtype.kind == 'f':
+        values = values.astype(np.float64)
+    elif values.dtype.kind == 'M':
+        values = values.astype('datetime64[ns]').view(np.int64)
+    else:
+        values = values.astype(object)
+    # categorize (fatorar antes de calcular os hashes) só compensa com muitas repetições, e as colunas
+    # de texto com poucos valores distintos já são categóricas
+    return pd.util.hash_array(values, categorize=False)
+
+
+def _lengths(values: pd.Series) -> np.ndarray:
+    '''Comprimento de cada texto (0 para nulos). Pelo Arrow: o .str.len() do pandas é bem mais lento'''
+    lengths = pc.utf8_length(pa.array(values.to_numpy(), pa.string(), from_pandas=True))
+    return pc.fill_null(lengths, 0).to_numpy()
+
+
+def _sketch(hashes: np.ndarray) -> np.ndarray:
+    '''Registradores do HyperLogLog: para cada um dos 2^SKETCH_BITS grupos, o maior rank visto'''
+    registers = np.zeros(_REGISTERS, np.uint8)
+    if len(hashes) == 0:
+        return registers
+
+    index = (hashes >> np.uint64(64 - SKETCH_BITS)).astype(np.intp)
+    rest = (hashes << np.uint64(SKETCH_BITS)) | np.uint64(1 << (SKETCH_BITS - 1))  # limita o rank
+    # rank = zeros à esquerda + 1 = 65 - expoente do frexp (o arredondamento para float64 só muda
+    # valores a menos de 2^-52 da próxima potência de 2)
+    rank = (65 - np.frexp(rest.astype(np.float64))[1]).astype(np.uint8)
+
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def _estimate(registers: np.ndarray) -> int:
+    m = len(registers)
+    estimate = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # linear counting para poucos valores
+    return int(round(estimate))
+
+
+def _encode(registers: np.ndarray) -> str:
+    return base64.b64encode(registers.tobytes()).decode('ascii')
+
+
+def _decode(sketch: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(sketch), np.uint8)
+
+
+def _partial_path(output_dir: str, chunk_file: str) -> str:
+    return os.path.join(output_dir, PARTIALS_DIR, chunk_file.split('.')[0] + '.json')
@@ -0,0 +1,89 @@
+import hashlib
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+import pandas as pd
+
+from .column_mapping import PandasDType
+
+# Valores lidos como nulos, os mesmos que o pd.read_csv usa por padrão (keep_default_na)
+NA_VALUES = frozenset({
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+})
+
+
+@dataclass(frozen=True)
+class ReadPlan:
+    '''
+    Tudo o que é preciso para ler um arquivo de um determinado layout: resolvido uma única vez por
+    cabeçalho e compartilhado (sem mutação) entre arquivos, threads e processos.
+
+    Chaves de rename_map e dtypes são os nomes das colunas no CSV; as de transformations são os novos nomes.
+    Os dicionários são guardados como mapeamentos só de leitura.
+    '''
+    header: tuple[str, ...]
+    rename_map: Mapping[str, str]
+    dtypes: Mapping[str, PandasDType]
+    transformations: Mapping[str, Callable]
+    categorical_columns: tuple[str, ...]
+    category_dtypes: Mapping[str, pd.CategoricalDtype]
+    has_age: bool
+
+    def __post_init__(self):
+        for field in fields(self):
+            value = getattr(self, field.name)
+            if isinstance(value, dict):
+                object.__setattr__(self, field.name, MappingProxyType(value.copy()))
+
+    def __reduce__(self):
+        # o plano é enviado aos workers de read_and_save_chunks_parallel; MappingProxyType não é serializável
+        values = [getattr(self, field.name) for field in fields(self)]
+        return ReadPlan, tuple(dict(v) if isinstance(v, MappingProxyType) else v for v in values)
+
+    @property
+    def fixed_categories(self) -> bool:
+        '''True se as colunas categóricas usam dicionários fixos (ver categories.py) em vez de um por chunk'''
+        return any(dtype.categories is not None for dtype in self.category_dtypes.values())
+
+    @property
+    def current_columns(self) -> list[str]:
+        '''Colunas lidas do CSV, na ordem do arquivo'''
+        return [c for c in self.header if c in self.rename_map]
+
+    @property
+    def transformed_columns(self) -> set[str]:
+        '''Nomes no CSV das colunas com transformação. São lidas como texto cru.'''
+        return {current for current, new in self.rename_map.items() if new in self.transformations}
+
+    def get_dtype_map(self) -> dict[str, PandasDType]:
+        transformed = self.transformed_columns
+        return {k: (str if k in transformed else v) for k, v in self.dtypes.items()}
+
+    def get_na_values(self) -> dict[str, frozenset[str]]:
+        '''Colunas transformadas não convertem "", "NA" etc. para NaN, assim como um converter as receberia'''
+        transformed = self.transformed_columns
+        return {k: NA_VALUES for k in self.current_columns if k not in transformed}
+
+    @property
+    def fingerprint(self) -> str:
+        '''Hash estável do plano, para saber se uma saída foi gerada com o mesmo layout e regras'''
+        description = repr((
+            self.header,
+            sorted(self.rename_map.items()),
+            sorted((k, _describe(v)) for k, v in self.dtypes.items()),
+            sorted((k, _describe(v)) for k, v in self.transformations.items()),
+            self.categorical_columns,
+            sorted((k, _describe(v)) for k, v in self.category_dtypes.items()),
+            self.has_age,
+        ))
+        return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+def _describe(value) -> str:
+    if callable(value) and hasattr(value, '__qualname__'):
+        return f'{value.__module__}.{value.__qualname__}'
+    if isinstance(value, pd.CategoricalDtype):
+        return f'category{list(value.categories) if value.categories is not None else ""}'
+    return str(value)
@@ -0,0 +1,104 @@
+'''
+Classificação vetorizada de vínculos em setores definidos por conjuntos de CNAE e CBO.
+
+Cada setor é um bit. Para cada coluna, o teste de pertencimento é feito uma vez por categoria
+(algumas milhares de CNAEs/CBOs distintos) e resulta em uma máscara de bits por categoria; classificar
+as linhas é então só indexar essas máscaras pelos códigos inteiros das categóricas e fazer um AND.
+'''
+
+from typing import Any, Iterable, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+Data = Union[pd.DataFrame, pa.Table, Mapping[str, Any]]
+
+MAX_SECTORS = 64
+NO_SECTOR = -1  # código de SectorClassifier.label para linhas fora de todos os setores (nulo na categórica)
+
+
+class Sector:
+    '''Um vínculo está no setor se o CNAE está em cnaes e o CBO em cbos. None aceita qualquer código.'''
+
+    def __init__(self, name: str, cnaes: Optional[Iterable[str]] = None, cbos: Optional[Iterable[str]] = None):
+        self.name = name
+        self.cnaes = None if cnaes is None else {str(code) for code in cnaes}
+        self.cbos = None if cbos is None else {str(code) for code in cbos}
+
+
+class SectorClassifier:
+    '''
+    Classifica as linhas de um DataFrame (colunas categóricas) ou de uma tabela Arrow (colunas de dicionário)
+    nos setores informados. Colunas que não são categóricas funcionam, mas são fatoradas antes. Um dicionário
+    {coluna: valores} (Series, arrays ou listas) também serve.
+    '''
+
+    def __init__(self, sectors: Iterable[Sector], cnae_column: str = 'CnaeSubclasse20',
+                 cbo_column: str = 'CboOcupacao2002'):
+        self.sectors = list(sectors)
+        self.cnae_column = cnae_column
+        self.cbo_column = cbo_column
+
+        if len(self.sectors) > MAX_SECTORS:
+            raise ValueError(f'At most {MAX_SECTORS} sectors are supported, got {len(self.sectors)}')
+        if len({sector.name for sector in self.sectors}) != len(self.sectors):
+            raise ValueError('Sector names must be unique')
+
+    @property
+    def names(self) -> list[str]:
+        return [sector.name for sector in self.sectors]
+
+    def masks(self, data: Data) -> np.ndarray:
+        '''Máscara de bits por linha: o bit i está ligado se a linha pertence a self.sectors[i]'''
+        cnae_masks = _column_masks(data[self.cnae_column], [sector.cnaes for sector in self.sectors])
+        cbo_masks = _column_masks(data[self.cbo_column], [sector.cbos for sector in self.sectors])
+        return cnae_masks & cbo_masks
+
+    def matches(self, data: Data, name: str) -> np.ndarray:
+        '''Array booleano: quais linhas pertencem ao setor name'''
+        bit = np.uint64(1) << np.uint64(self.names.index(name))
+        return (self.masks(data) & bit) != 0
+
+    def label(self, data: Data) -> pd.Categorical:
+        '''Nome do primeiro setor (na ordem de definição) de cada linha, ou nulo (código NO_SECTOR) se nenhum'''
+        masks = self.masks(data)
+        unique_masks, inverse = np.unique(masks, return_inverse=True)
+        first_sectors = np.array([self._first_sector(mask) for mask in unique_masks.tolist()], np.int64)
+        codes = np.where(masks == 0, NO_SECTOR, first_sectors[inverse])
+        return pd.Categorical.from_codes(codes, self.names)
+
+    def _first_sector(self, mask: int) -> int:
+        '''Posição do bit mais baixo ligado em mask (diferente de zero)'''
+        return (mask & -mask).bit_length() - 1
+
+
+def _column_masks(values, code_sets: list[Optional[set[str]]]) -> np.ndarray:
+    '''Máscara de bits por linha para uma coluna: bit i ligado se o valor está em code_sets[i]'''
+    if isinstance(values, pa.ChunkedArray):
+        if values.num_chunks == 0:
+            return np.zeros(0, np.uint64)
+        return np.concatenate([_column_masks(chunk, code_sets) for chunk in values.chunks])
+
+    if isinstance(values, pa.Array):
+        if not pa.types.is_dictionary(values.type):
+            values = pc.dictionary_encode(values)
+        categories = pd.Index(values.dictionary.to_pandas())
+        codes = values.indices.fill_null(-1).to_numpy()
+    elif isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        values = pd.Categorical(values)  # Series ou Categorical
+        categories, codes = values.categories, values.codes
+    else:
+        codes, categories = pd.factorize(values if hasattr(values, 'dtype') else np.asarray(values, dtype=object))
+
+    categories = pd.Index(categories).astype(str)
+    category_masks = np.zeros(len(categories) + 1, np.uint64)  # a última posição é a dos nulos (código -1)
+    for i, code_set in enumerate(code_sets):
+        bit = np.uint64(1) << np.uint64(i)
+        if code_set is None:
+            category_masks |= bit
+        else:
+            category_masks[:-1][categories.isin(code_set)] |= bit
+
+    return category_masks[codes]
@@ -0,0 +1,200 @@
+import io
+import os
+import re
+import time
+from typing import BinaryIO, Union
+
+HEAD_LINES = 2  # cabeçalho + uma linha de dados (usada para detectar o formato de IsHomem)
+BUFFER_SIZE = 1 << 20
+
+Source = Union[str, os.PathLike, BinaryIO]
+
+
+class PrefixedStream(io.RawIOBase):
+    '''Lê primeiro os bytes de prefix e depois o restante de stream. Com owns_stream, close() fecha o stream.'''
+
+    def __init__(self, stream: BinaryIO, prefix: bytes = b'', owns_stream: bool = False):
+        self._stream = stream
+        self._pending = memoryview(prefix)
+        self._owns_stream = owns_stream
+        self.name = getattr(stream, 'name', '')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._pending:
+            n = min(len(buffer), len(self._pending))
+            buffer[:n] = self._pending[:n]
+            self._pending = self._pending[n:]
+            return n
+
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if self._owns_stream:
+            self._stream.close()
+        super().close()
+
+
+class PeekableStream(PrefixedStream):
+    '''
+    Envolve um stream que não pode ser relido (ex.: saída do 7z) guardando as primeiras linhas,
+    para que o cabeçalho possa ser inspecionado antes da leitura completa sem consumir os dados.
+    '''
+
+    def __init__(self, stream: BinaryIO, head_lines: int = HEAD_LINES):
+        head = b''
+        while head.count(b'\n') < head_lines:
+            data = stream.read(BUFFER_SIZE)
+            if not data:
+                break
+            head += data
+
+        super().__init__(stream, head)
+        self.head = head
+
+
+class CountingStream(PrefixedStream):
+    '''
+    Conta os bytes lidos e o tempo gasto esperando a origem (leitura do disco ou descompressão do .7z).
+    Caminhos são abertos (e fechados em close()); streams não são fechados.
+    '''
+
+    def __init__(self, source: Source):
+        owns_stream = not is_stream(source)
+        super().__init__(open(source, 'rb') if owns_stream else source, owns_stream=owns_stream)
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+    def readinto(self, buffer) -> int:
+        start = time.perf_counter()
+        n = super().readinto(buffer)
+        self.read_seconds += time.perf_counter() - start
+        self.bytes_read += n
+        return n
+
+
+def is_stream(source: Source) -> bool:
+    return hasattr(source, 'read')
+
+
+def peekable(source: Source) -> Source:
+    '''Caminhos são retornados como estão; streams são envolvidos em um PeekableStream'''
+    if not is_stream(source) or isinstance(source, PeekableStream):
+        return source
+    return PeekableStream(source)
+
+
+def head(source: Source) -> Source:
+    '''Algo que o pd.read_csv consegue ler para inspecionar o início do arquivo sem consumir o stream'''
+    if isinstance(source, PeekableStream):
+        return io.BytesIO(source.head)
+    return source
+
+
+def reader(source: Source) -> Source:
+    '''Algo que os parsers de CSV conseguem ler do início ao fim'''
+    if isinstance(source, io.RawIOBase):
+        return io.BufferedReader(source, BUFFER_SIZE)
+    return source
+
+
+def skip_lines(source: Source, n_lines: int) -> PrefixedStream:
+    '''
+    Pula as primeiras n_lines linhas não vazias sem interpretá-las como CSV e retorna o restante. Usado para
+    retomar uma leitura interrompida a partir de uma linha conhecida. Linhas vazias (ou só com espaços) não
+    contam, como no pd.read_csv (skip_blank_lines), para que n_lines possa ser o cabeçalho mais as linhas já salvas.
+    '''
+    owns_stream = not is_stream(source)
+    stream = open(source, 'rb') if owns_stream else source
+    remaining = n_lines
+    partial = b''  # linha incompleta do fim do bloco anterior
+
+    while remaining > 0:
+        data = stream.read(BUFFER_SIZE)
+        if not data:
+            return PrefixedStream(stream, owns_stream=owns_stream)
+
+        data = partial + data
+        end = data.rfind(b'\n') + 1
+        lines, partial = data[:end], data[end:]
+
+        count = _count_lines(lines)
+        if count < remaining:
+            remaining -= count
+            continue
+
+        position = 0
+        while remaining > 0:
+            line_end = lines.index(b'\n', position) + 1
+            if lines[position:line_end].strip():
+                remaining -= 1
+            position = line_end
+        return PrefixedStream(stream, lines[position:] + partial, owns_stream)
+
+    return PrefixedStream(stream, partial, owns_stream)
+
+
+def count_lines(file_path: str, start: int, end: int) -> int:
+    '''Linhas não vazias entre os bytes start e end do arquivo, contadas como em skip_lines'''
+    count = 0
+    partial = b''
+    with RangeFile(file_path, start, end) as range_file:
+        while data := range_file.read(BUFFER_SIZE):
+            data = partial + data
+            end_of_lines = data.rfind(b'\n') + 1
+            count += _count_lines(data[:end_of_lines])
+            partial = data[end_of_lines:]
+    return count + bool(partial.strip())
+
+
+def _count_lines(lines: bytes) -> int:
+    '''Linhas não vazias em lines, que termina em uma quebra de linha'''
+    return lines.count(b'\n') - len(_BLANK_LINE.findall(b'\n' + lines))
+
+
+_BLANK_LINE = re.compile(rb'\n(?=[ \t\r\f\v]*\n)')  # quebras de linha seguidas de uma linha vazia
+
+
+class RangeFile(io.RawIOBase):
+    '''Lê apenas os bytes [start, end) de um arquivo'''
+
+    def __init__(self, file_path: str, start: int, end: int):
+        self.name = file_path
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._file.readinto(memoryview(buffer)[:min(len(buffer), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def split_byte_ranges(file_path: str, range_size: int) -> list[tuple[int, int]]:
+    '''Divide o arquivo (sem o cabeçalho) em faixas de aproximadamente range_size bytes terminadas em quebra de linha'''
+    size = os.path.getsize(file_path)
+    ranges = []
+
+    with open(file_path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+
+        while start < size:
+            f.seek(min(start + range_size, size))
+            f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+
+    return ranges
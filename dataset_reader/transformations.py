@@ -0,0 +1,213 @@
+'''
+Transformações vetorizadas aplicadas a colunas inteiras (lidas como texto cru) em vez de
+converters do pd.read_csv, que chamam uma função Python por célula.
+'''
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Callable, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DATE_FORMAT = '%d%m%Y'
+
+MONEY_COLUMNS = ['SalarioContratual', 'RemuneracaoMediaR$', 'RemuneracaoMedia',
+                 'RemuneracaoDezembroR$', 'RemuneracaoDezembro']
+
+INVALID_MONEY = -1  # valor de parse_money para vazios e inválidos
+INVALID_CENTS = INVALID_MONEY * 100  # o mesmo em centavos (parse_money_cents): dividido por 100 continua -1
+
+
+def parse_money_value(x: str):
+    '''Versão escalar de parse_money. Usada apenas para os valores que o caminho vetorizado não converte.'''
+    x = x.replace(',', '.', 1)
+    try:
+        x = np.float32(x)
+    except (ValueError, OverflowError):
+        x = INVALID_MONEY
+
+    if x == np.inf:
+        x = INVALID_MONEY
+
+    return x
+
+
+def parse_money(values: pd.Series) -> pd.Series:
+    '''Converte valores como "1234,56" para float (com precisão de float32). Valores inválidos ou infinitos viram -1.'''
+    values = values.str.replace(',', '.', n=1, regex=False)
+    parsed = pd.to_numeric(values, errors='coerce').astype(np.float64)
+
+    empty = values == ''
+    parsed[empty] = INVALID_MONEY
+
+    # valores que o to_numeric não entende (ex.: 'nan', '1_0', lixo) passam pela versão escalar
+    failed = parsed.isna() & ~empty
+    if failed.any():
+        with np.errstate(over='ignore'):
+            parsed[failed] = values[failed].map(parse_money_value).astype(np.float64)
+
+    with np.errstate(over='ignore'):
+        parsed = parsed.astype(np.float32)
+    parsed[parsed == np.inf] = INVALID_MONEY
+
+    return parsed.astype(np.float64)
+
+
+def parse_money_cents_value(x: str) -> int:
+    '''Versão escalar de parse_money_cents, exata (Decimal), para os valores fora do formato comum'''
+    try:
+        value = Decimal(x.strip().replace(',', '.', 1))
+    except InvalidOperation:
+        return INVALID_CENTS
+    if not value.is_finite():
+        return INVALID_CENTS
+
+    cents = int(value.scaleb(2).to_integral_value(ROUND_HALF_UP))
+    return cents if abs(cents) < _MAX_CENTS else INVALID_CENTS
+
+
+_MAX_CENTS = 10 ** 18  # cabe em int64
+_MAX_DIGITS = 18
+_SCALES = pa.array([100, 10, 1], pa.int64())  # centavos por unidade do número sem a vírgula, por casas decimais
+
+
+def parse_money_cents(values: Union[pd.Series, pa.Array, pa.ChunkedArray]):
+    '''
+    Converte valores como "1234,56" ou "0000001234,5" para centavos em int64, sem passar por float: os
+    dígitos sem a vírgula viram um inteiro (cast do Arrow) multiplicado por 100, 10 ou 1 conforme as casas
+    decimais. O resto (sinal, ponto, espaços, mais de 2 casas, expoente...) é raro e passa por
+    parse_money_cents_value. Vazios e inválidos viram INVALID_CENTS. Aceita uma Series (retorna Series)
+    ou um array Arrow.
+    '''
+    if isinstance(values, pd.Series):
+        cents = parse_money_cents(pa.array(values.to_numpy(), pa.string(), from_pandas=True))
+        return pd.Series(cents.to_numpy(), index=values.index, name=values.name)
+
+    length = pc.binary_length(values)
+    separator = pc.find_substring(values, ',')
+    decimals = pc.if_else(pc.less(separator, 0), 0, pc.subtract(pc.subtract(length, separator), 1))
+    digits = pc.replace_substring(values, ',', '', max_replacements=1)
+    simple = pc.fill_null(pc.and_(pc.ascii_is_decimal(digits),
+                                  pc.and_(pc.less_equal(decimals, 2),
+                                          pc.less_equal(pc.binary_length(digits), _MAX_DIGITS))), False)
+
+    scale = pc.take(_SCALES, pc.if_else(simple, decimals, 2))
+    cents = pc.multiply(pc.cast(pc.if_else(simple, digits, '0'), pa.int64()), scale)
+    cents = pc.if_else(simple, cents, INVALID_CENTS)
+
+    other = pc.fill_null(pc.and_(pc.invert(simple), pc.greater(length, 0)), False)
+    if pc.any(other).as_py():
+        if isinstance(cents, pa.ChunkedArray):
+            cents = cents.combine_chunks()
+        cents = cents.to_numpy(zero_copy_only=False).copy()
+        positions = np.flatnonzero(np.array(other))
+        cents[positions] = [parse_money_cents_value(text) for text in pc.take(values, positions).to_pylist()]
+        return pa.array(cents, pa.int64())
+
+    return cents
+
+
+def money_to_reais(values: pd.Series) -> pd.Series:
+    '''Centavos (parse_money_cents) para reais em float64, com INVALID_CENTS virando INVALID_MONEY'''
+    return (values / 100).where(values != INVALID_CENTS, INVALID_MONEY)
+
+
+def is_invalid_money(values):
+    '''Máscara dos valores inválidos de parse_money (float) ou parse_money_cents (int64), em pandas ou Arrow'''
+    if isinstance(values, pd.Series):
+        integer = pd.api.types.is_integer_dtype(values.dtype)
+        return values == (INVALID_CENTS if integer else INVALID_MONEY)
+    return pc.equal(values, INVALID_CENTS if pa.types.is_integer(values.type) else INVALID_MONEY)
+
+
+def map_unique(values: pd.Series, function: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    '''
+    Aplica function apenas aos valores distintos e distribui o resultado para as linhas (nulos continuam nulos).
+    Datas de nascimento e de admissão têm poucas dezenas de milhares de valores distintos em milhões de linhas.
+    '''
+    codes, uniques = pd.factorize(values)
+    result = function(pd.Series(uniques)).to_numpy()
+    return pd.Series(pd.api.extensions.take(result, codes, allow_fill=True), index=values.index)
+
+
+def parse_date(values: pd.Series) -> pd.Series:
+    '''Datas DDMMAAAA (com o zero à esquerda do dia omitido ou não). Datas inválidas viram NaT.'''
+    return map_unique(values, lambda dates: pd.to_datetime(dates.str.zfill(8), errors='coerce', format=DATE_FORMAT))
+
+
+def calculate_age(birthdate: pd.Series, relative_to: pd.Timestamp) -> pd.Series:
+    '''
+    Idade em relative_to a partir de datas DDMMAAAA. Datas com dia inválido (ex.: 31/02) usam o último dia do mês.
+    Calculada uma vez por data distinta.
+    '''
+    def age(dates: pd.Series) -> pd.Series:
+        dates = dates.str.zfill(8)
+        birth = pd.to_datetime(dates, errors='coerce', format=DATE_FORMAT)
+        birth = birth.fillna(
+            pd.to_datetime('01' + dates.str[2:], format=DATE_FORMAT, errors='coerce') + pd.offsets.MonthEnd(0)
+        )
+
+        has_had_birthday = (relative_to.month > birth.dt.month) | ((relative_to.month == birth.dt.month) & (relative_to.day >= birth.dt.day))
+        return relative_to.year - birth.dt.year - (~has_had_birthday)
+
+    return map_unique(birthdate, age)
+
+
+def only_digits(values: pd.Series) -> pd.Series:
+    return values.str.replace(r'\D', '', regex=True)
+
+
+def parse_cpf(values: pd.Series) -> pd.Series:
+    '''Remove caracteres não numéricos e recoloca os zeros à esquerda omitidos'''
+    return only_digits(values).str.zfill(11)
+
+
+INVALID_ID = -1  # Cpf/CNPJ vazio ou com mais dígitos do que o permitido, no modo inteiro
+CPF_DIGITS = 11
+CNPJ_DIGITS = 14
+
+
+def _parse_id(values: pd.Series, max_digits: int) -> pd.Series:
+    digits = only_digits(values.fillna(''))
+    valid = digits.str.len().between(1, max_digits)
+    return pd.to_numeric(digits.where(valid, str(INVALID_ID))).astype(np.int64)
+
+
+def parse_cpf_int(values: pd.Series) -> pd.Series:
+    '''Cpf como int64 (11 dígitos cabem em 64 bits). Valores inválidos viram INVALID_ID.'''
+    return _parse_id(values, CPF_DIGITS)
+
+
+def parse_cnpj_int(values: pd.Series) -> pd.Series:
+    '''CNPJ (ou CEI/raiz do CNPJ) como int64. Valores inválidos viram INVALID_ID.'''
+    return _parse_id(values, CNPJ_DIGITS)
+
+
+def _format_id(values: pd.Series, digits: int) -> pd.Series:
+    values = pd.Series(values)
+    formatted = values.astype(np.int64).astype(str).str.zfill(digits)
+    return formatted.where(values != INVALID_ID, None)
+
+
+def format_cpf(values: pd.Series) -> pd.Series:
+    '''Converte Cpfs salvos como inteiros de volta para texto com zeros à esquerda'''
+    return _format_id(values, CPF_DIGITS)
+
+
+def format_cnpj(values: pd.Series) -> pd.Series:
+    '''Converte CNPJs salvos como inteiros de volta para texto com zeros à esquerda'''
+    return _format_id(values, CNPJ_DIGITS)
+
+
+def parse_is_homem_numeric(values: pd.Series) -> pd.Series:
+    '''Formato numérico: 1 para masculino, 2 para feminino, -1 para não identificado'''
+    values = pd.to_numeric(values.str.strip(), errors='raise').astype(np.int64)
+    return values.where(values != 2, 0)
+
+
+def parse_is_homem_text(values: pd.Series) -> pd.Series:
+    '''Formato textual: "M"/"Masculino" -> 1, "F"/"Feminino" -> 0, qualquer outro valor -> -1'''
+    first_letter = values.str.strip().str[0].str.upper()
+    return first_letter.map({'M': 1, 'F': 0}).fillna(-1).astype(np.int64)
@@ -0,0 +1,33 @@
+import os
+import logging
+import argparse
+from pathlib import Path
+
+from dataset_reader import panel
+
+
+GB = 1 << 30
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Constrói o painel longitudinal por Cpf (todos os anos, agrupado por trabalhador)')
+    parser.add_argument('--input-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/filtrados'),
+                        help='árvore de filtrados (<ano>/<UF>) ou compactada (year=<ano>/uf=<UF>)')
+    parser.add_argument('--output-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/painel'))
+    parser.add_argument('--years', type=int, nargs='+', default=None, help='padrão: todos os anos')
+    parser.add_argument('--columns', nargs='+', default=None, help='colunas do painel (padrão: todas; Cpf sempre é incluído)')
+    parser.add_argument('--memory-budget', type=float, default=16, help='memória total para os workers, em GB')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--fixed-categories', action='store_true',
+                        help='os filtrados usam categorias fixas (--categories do orchestrator.py): mantém os dicionários')
+    args = parser.parse_args()
+
+    num_buckets = panel.build_panel(str(args.input_dir), str(args.output_dir), int(args.memory_budget * GB),
+                                    years=args.years, columns=args.columns, workers=args.workers,
+                                    fixed_categories=args.fixed_categories)
+    logging.info(f'Painel com {num_buckets} buckets em {args.output_dir}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
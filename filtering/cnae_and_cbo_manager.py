@@ -1,6 +1,99 @@
 import os
+import pickle
+import hashlib
+import tempfile
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from dataset_reader.sectors import Sector, SectorClassifier
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rais_limpeza')
+
+
+class _LazyTable:
+    """
+    Tabela lida de uma planilha só no primeiro acesso (CnaeAndCboManager.cbo_codes etc.) e guardada em
+    CACHE_DIR em pickle. O cache vale enquanto a data de modificação ou o hash da planilha não mudarem;
+    um cache que não pode ser lido (ex.: corrompido ou de outra versão do pandas) é refeito.
+    """
+
+    def __init__(self, file_path: str, **read_args):
+        self.file_path = file_path
+        self.read_args = read_args
+        self._table = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if self._table is None:
+            self._table = self._load(owner)
+        return self._table
+
+    def _load(self, owner):
+        mtime = os.path.getmtime(self.file_path)
+        cache_path = os.path.join(CACHE_DIR, f'{self.name}.pkl')
+
+        cached = None
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached = pickle.load(f)
+            except Exception:
+                cached = None  # o unpickle de um arquivo inválido pode falhar com quase qualquer exceção
+        if not isinstance(cached, dict) or not {'source', 'read_args', 'mtime', 'sha256', 'table'} <= cached.keys():
+            cached = None
+
+        if cached and cached['source'] == self.file_path and cached['read_args'] == self.read_args:
+            if cached['mtime'] == mtime:
+                return cached['table']
+            if cached['sha256'] == _file_hash(self.file_path):
+                self._save(cache_path, {**cached, 'mtime': mtime})
+                return cached['table']
+
+        table = owner.generate_dict_from_spreadsheet(self.file_path, **self.read_args)
+        self._save(cache_path, {
+            'source': self.file_path, 'read_args': self.read_args,
+            'mtime': mtime, 'sha256': _file_hash(self.file_path), 'table': table,
+        })
+        return table
+
+    @staticmethod
+    def _save(cache_path, entry):
+        # temporário com nome único: vários processos (ver orchestrator.py) podem refazer o cache ao mesmo tempo
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=os.path.basename(cache_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class _DerivedTable:
+    """Tabela calculada a partir de outra tabela do manager no primeiro acesso"""
+
+    def __init__(self, derive):
+        self.derive = derive
+        self._table = None
+
+    def __get__(self, instance, owner):
+        if self._table is None:
+            self._table = self.derive(owner)
+        return self._table
+
+
+def _file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while data := f.read(1 << 20):
+            digest.update(data)
+    return digest.hexdigest()
 
 
 class CnaeAndCboManager:
@@ -41,24 +134,31 @@ class CnaeAndCboManager:
     }
     cbo_codes_cana_np = np.array(list(cbo_codes_cana.keys()))
 
-    cnae_subclass_codes = {}
-    cbo_codes = {}
-    grau_instrucao = {}
-    raca_cor = {}
+    # setores usados por sector_classifier (nome, CNAEs, CBOs; None aceita qualquer código)
+    sectors = [
+        Sector('cana', cnae_subclass_codes_cana, cbo_codes_cana),
+    ]
+    _sectors_classifier = SectorClassifier(sectors)  # reutilizado por is_cana_manual_np
 
     _rais_vinculos_sheet = os.path.join(_DATASET_PATH, 'dados', 'brutos', 'RAIS_vinculos_layout.xls')
     _cbo_sheet = os.path.join(_DATASET_PATH, 'dados', 'brutos', 'estrutura_CBO', 'CBO2002 - Ocupacao.csv')
 
-    cnae_subclass_codes = generate_dict_from_spreadsheet(
+    # lidas só no primeiro acesso (ver _LazyTable)
+    cnae_subclass_codes = _LazyTable(
         _rais_vinculos_sheet, sheet_name='subclasse 2.0', one_column=True
     )
-    city_codes = generate_dict_from_spreadsheet(
+    city_codes = _LazyTable(
         _rais_vinculos_sheet, sheet_name='municipio', one_column=True
     )
-    cbo_codes = generate_dict_from_spreadsheet(
+    cbo_codes = _LazyTable(
         _cbo_sheet, sep=';', encoding='latin-1', dtype='str'
     )
 
+    # código do município -> UF (ex.: '110001' -> 'RO'), a partir de nomes como 'RO-Alta Floresta D'Oeste'
+    city_to_state = _DerivedTable(
+        lambda manager: {key: val.split('-')[0].upper() for key, val in manager.city_codes.items()}
+    )
+
     grau_instrucao = {
         1: 'ANAFALBETO',
         2: 'ATE 5.A INC',
@@ -182,6 +282,47 @@ class CnaeAndCboManager:
     def get_city(code: int):
         return CnaeAndCboManager.city_codes.get(code)
 
+    @staticmethod
+    def map_codes(values, table: dict):
+        """
+        Mapeia uma coluna inteira (pd.Series ou array/ChunkedArray do pyarrow) com table, consultando
+        cada valor distinto uma única vez e distribuindo o resultado pelos códigos (um gather).
+        Categóricas (e colunas de dicionário do Arrow) usam os códigos já existentes. Valores fora de table viram nulos.
+        """
+        if isinstance(values, (pa.Array, pa.ChunkedArray)):
+            return _map_arrow(values, table)
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values)
+
+        label_codes, labels = pd.factorize(pd.Index(uniques).map(table.get))
+        label_codes = np.append(label_codes, -1)  # código -1 (nulo) continua nulo
+        return pd.Series(pd.Categorical.from_codes(label_codes[codes], labels), index=values.index, name=values.name)
+
+    @staticmethod
+    def map_cnae(values):
+        return CnaeAndCboManager.map_codes(values, CnaeAndCboManager.cnae_subclass_codes)
+
+    @staticmethod
+    def map_cbo(values):
+        return CnaeAndCboManager.map_codes(values, CnaeAndCboManager.cbo_codes)
+
+    @staticmethod
+    def map_city(values):
+        return CnaeAndCboManager.map_codes(values, CnaeAndCboManager.city_codes)
+
+    @staticmethod
+    def map_state(values):
+        """Código do município -> sigla da UF"""
+        return CnaeAndCboManager.map_codes(values, CnaeAndCboManager.city_to_state)
+
+    @staticmethod
+    def map_uf_code(values):
+        """Código do município -> código IBGE da UF (os dois primeiros dígitos, ex.: '355030' -> 35)"""
+        return CnaeAndCboManager.map_codes(values, _UfCodes())
+
     @staticmethod
     def is_cana_manual(cnae, cbo):
         return cnae in CnaeAndCboManager.cnae_subclass_codes_cana and \
@@ -189,5 +330,32 @@ class CnaeAndCboManager:
     
     @staticmethod
     def is_cana_manual_np(cnaes, cbos):
-        return np.isin(cnaes, CnaeAndCboManager.cnae_subclass_codes_cana_np) & \
-            np.isin(cbos, CnaeAndCboManager.cbo_codes_cana_np)
\ No newline at end of file
+        # o classificador só lê as duas colunas, então não é preciso montar um DataFrame
+        columns = {'CnaeSubclasse20': cnaes, 'CboOcupacao2002': cbos}
+        return CnaeAndCboManager._sectors_classifier.matches(columns, 'cana')
+
+    @staticmethod
+    def sector_classifier(extra_sectors=()):
+        """
+        Classificador dos setores de CnaeAndCboManager.sectors (mais extra_sectors) para DataFrames ou tabelas
+        Arrow já lidos. Ex.: df['Setor'] = CnaeAndCboManager.sector_classifier().label(df)
+        """
+        return SectorClassifier([*CnaeAndCboManager.sectors, *extra_sectors])
+
+
+class _UfCodes:
+    """Tabela "infinita" para map_codes: qualquer código de município vira o código da UF"""
+
+    def get(self, code):
+        code = str(code)
+        return int(code[:2]) if code[:2].isdigit() else None
+
+
+def _map_arrow(values, table):
+    if isinstance(values, pa.ChunkedArray):
+        return pa.chunked_array([_map_arrow(chunk, table) for chunk in values.chunks])
+
+    if not pa.types.is_dictionary(values.type):
+        values = pc.dictionary_encode(values)
+    labels = pa.array([table.get(value) for value in values.dictionary.to_pylist()])
+    return pc.take(labels, values.indices)
@@ -0,0 +1,25 @@
+import logging
+import argparse
+from pathlib import Path
+
+from dataset_reader import compaction
+
+
+MB = 1 << 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compacta os filtrados em um dataset particionado (year=AAAA/uf=XX)')
+    parser.add_argument('--input-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/filtrados'))
+    parser.add_argument('--output-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/compactados'))
+    parser.add_argument('--file-size', type=int, default=compaction.TARGET_FILE_SIZE // MB, help='tamanho alvo dos arquivos, em MB')
+    parser.add_argument('--row-group-size', type=int, default=compaction.TARGET_ROW_GROUP_SIZE // MB, help='tamanho alvo dos row groups, em MB')
+    args = parser.parse_args()
+
+    partitions = compaction.compact(str(args.input_dir), str(args.output_dir), args.file_size * MB, args.row_group_size * MB)
+    logging.info(f'{len(partitions)} partições escritas em {args.output_dir}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
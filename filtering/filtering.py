@@ -1,11 +1,10 @@
 import os
-import shutil
 import logging
 import signal
 from pathlib import Path
 
 from helpers import *
-from dataset_reader import DatasetReader
+from dataset_reader import DatasetReader, Instrumentation, manifest
 
 
 def main():
@@ -15,15 +14,11 @@ def main():
     data_dir = Path('/mnt/ssd/RAIS/dados/brutos')
     filtered_data_dir = Path('/mnt/ssd/RAIS/dados/filtrados')
 
-    for root, _, files in os.walk(data_dir):
-        if dir_should_be_ignored(root):
-            continue
-
-        for compressed_file in get_compressed_files(files):
-            if file_should_be_ignored(compressed_file):
-                continue
+    inner_files = list(find_inner_files(data_dir, filtered_data_dir))
 
-            handle_compressed_file(root, compressed_file, filtered_data_dir)
+    for i, (root, compressed_file_path, inner_file, chunks_dir, size) in enumerate(inner_files):
+        next_inner_file = inner_files[i + 1] if i + 1 < len(inner_files) else None
+        handle_inner_file(root, compressed_file_path, inner_file, chunks_dir, size, next_inner_file)
 
 
 def dir_should_be_ignored(directory):
@@ -31,79 +26,132 @@ def dir_should_be_ignored(directory):
     return any(i in directory.lower() for i in ignore)
 
 
-def handle_compressed_file(root, compressed_file, filtered_data_dir):
-    global current_chunks_dir, current_extracted_file, reader
-    
-    if 'RJ2008ID.7z' == compressed_file: # idk why this errors out. file is not used anyways.
-        logging.info(f'ignoring {compressed_file}')
-        return
+def archive_should_be_ignored(compressed_file):
+    return 'RJ2008ID.7z' == compressed_file # idk why this errors out. file is not used anyways.
 
-    compressed_file_path = Path(root) / compressed_file
-    inner_files = get_inner_files(str(compressed_file_path))
 
-    # Inner file: e.g. RJ2008ID.TXT
-    for inner_file in inner_files:
-        if unwanted_file(inner_file):
+def find_inner_files(data_dir, filtered_data_dir):
+    """Arquivos ainda não processados: (root, .7z, arquivo interno, diretório dos chunks, tamanho descompactado)"""
+    for root, _, files in os.walk(data_dir):
+        if dir_should_be_ignored(root):
             continue
 
-        year = extract_number_from_filename(inner_file)
-        state = extract_state_from_filename(inner_file)
-        
-        chunks_dir = Path(filtered_data_dir) / year / state
-        chunks_dir.mkdir(parents=True, exist_ok=True)
-
-        if has_been_processed(chunks_dir):
-            logging.info(f'Skipping {inner_file} - state directory already processed')
-            continue
-        
-        separator()
-        logging.info(f'Extraindo: {inner_file}...')
+        for compressed_file in get_compressed_files(files):
+            if file_should_be_ignored(compressed_file):
+                continue
 
-        try:
-            # Extract the file to the original location
-            inner_file_path = extract_inner_file(root, str(compressed_file_path), inner_file)
-            current_extracted_file = inner_file_path
+            if archive_should_be_ignored(compressed_file):
+                logging.info(f'ignoring {compressed_file}')
+                continue
 
-            current_chunks_dir = chunks_dir
+            compressed_file_path = Path(root) / compressed_file
+            inner_file_sizes = get_inner_file_sizes(str(compressed_file_path))
+
+            # Inner file: e.g. RJ2008ID.TXT
+            for inner_file in get_inner_files(str(compressed_file_path)):
+                if unwanted_file(inner_file):
+                    continue
+
+                year = extract_number_from_filename(inner_file)
+                state = extract_state_from_filename(inner_file)
+
+                chunks_dir = Path(filtered_data_dir) / year / state
+                chunks_dir.mkdir(parents=True, exist_ok=True)
+
+                if has_been_processed(chunks_dir, reader.output_options):
+                    logging.info(f'Skipping {inner_file} - state directory already processed')
+                    continue
+
+                yield root, compressed_file_path, inner_file, chunks_dir, inner_file_sizes.get(inner_file)
+
+
+def handle_inner_file(root, compressed_file_path, inner_file, chunks_dir, size, next_inner_file=None):
+    global current_extracted_file, reader
+
+    year = extract_number_from_filename(inner_file)
+    scratch_dir = str(SCRATCH_DIR or root)
+
+    stream = STREAM_FROM_ARCHIVE
+    if not stream and not prefetcher.is_pending(scratch_dir, inner_file) and not fits_on_disk(scratch_dir, size):
+        logging.info(f'Sem espaço em {scratch_dir} para extrair {inner_file} ({size / (1 << 30):.1f} GB): '
+                     f'lendo direto do .7z')
+        stream = True
+
+    separator()
+    logging.info(f'{"Lendo" if stream else "Extraindo"}: {inner_file}...')
+
+    # identifica a origem pelo .7z: o .txt extraído ganha uma data nova a cada extração
+    source_info = manifest.describe_source(inner_file, archive=compressed_file_path)
+    instrumentation = Instrumentation(PROGRESS_LOG, inner_file, size)
+
+    try:
+        if stream:
+            # Read the CSV straight from the archive, without extracting it to disk
+            # (o 7z descompacta enquanto o arquivo é lido, ver helpers.open_inner_file)
+            with open_inner_file(compressed_file_path, inner_file) as inner_file_stream:
+                reader.read_and_save_chunks(
+                    inner_file_stream,
+                    str(chunks_dir),
+                    chunk_size=500000,
+                    year=year,
+                    source_info=source_info,
+                    instrumentation=instrumentation,
+                    memory_budget=MEMORY_BUDGET,
+                    pipelined=PIPELINED,
+                    cubes=CUBES,
+                    profile=PROFILE
+                )
+        else:
+            # Extract the file to the scratch directory (by default, next to the archive)
+            current_extracted_file = os.path.join(scratch_dir, inner_file)
+            inner_file_path = prefetcher.extract(scratch_dir, str(compressed_file_path), inner_file, instrumentation)
+
+            # o próximo arquivo é extraído enquanto este é processado, se couber junto com ele
+            if next_inner_file:
+                next_root, next_compressed_file_path, next_inner, _, next_size = next_inner_file
+                next_scratch_dir = str(SCRATCH_DIR or next_root)
+                if fits_on_disk(next_scratch_dir, next_size):
+                    prefetcher.prefetch(next_scratch_dir, str(next_compressed_file_path), next_inner)
 
             reader.read_and_save_chunks(
                 inner_file_path,
                 str(chunks_dir),
                 chunk_size=500000,
-                year=year
+                year=year,
+                source_info=source_info,
+                instrumentation=instrumentation,
+                memory_budget=MEMORY_BUDGET,
+                pipelined=PIPELINED,
+                cubes=CUBES,
+                profile=PROFILE
             )
 
             os.remove(inner_file_path)
-            current_extracted_file = None
-            current_chunks_dir = None
-
-        except Exception as e:
-            logging.exception(f'Erro ao processar {inner_file}: {e}')
-            error_handler(should_exit=False)
-            current_extracted_file = None
-            current_chunks_dir = None
-            continue
 
+        current_extracted_file = None
 
-def has_been_processed(state_dir: Path) -> bool:
-    """Check if a state directory has been processed by looking for chunk files"""
-    if not state_dir.exists():
-        return False
-    
-    # Check if there are any chunk files in the directory
-    chunk_files = list(state_dir.glob('chunk_*.parquet.zstd'))
-    return len(chunk_files) > 0
+    except Exception as e:
+        logging.exception(f'Erro ao processar {inner_file}: {e}')
+        error_handler(should_exit=False)
+        current_extracted_file = None
+
+
+def has_been_processed(state_dir: Path, options: dict = None) -> bool:
+    """
+    Check if a state directory has a complete manifest whose chunks are all present (see dataset_reader/manifest.py)
+    and, given the reader's output_options, that it was saved with them
+    """
+    return manifest.is_complete(str(state_dir), options=options)
 
 
 def error_handler(signum=None, frame=None, should_exit=True):
-    if current_chunks_dir and current_chunks_dir.exists():
-        logging.info(f'\nCleaning up chunks directory: {current_chunks_dir}')
-        shutil.rmtree(current_chunks_dir)
+    # Chunks already written are kept: the next run resumes from the last one in the manifest
     if current_extracted_file and os.path.exists(current_extracted_file):
         logging.info(f'Cleaning up extracted file: {current_extracted_file}')
         os.remove(current_extracted_file)
     
     if should_exit:
+        prefetcher.discard()
         exit(0)
 
 
@@ -125,9 +173,41 @@ def separator():
     print('-' * 60)
 
 
-current_chunks_dir = None
+# Lê os .txt direto de dentro dos .7z em vez de extraí-los para o disco
+STREAM_FROM_ARCHIVE = True
+
+# Onde extrair os .txt quando STREAM_FROM_ARCHIVE = False. None: ao lado do .7z.
+# Um arquivo que não cabe (deixando helpers.SCRATCH_RESERVE livre) é lido direto do .7z.
+SCRATCH_DIR = None  # ex.: Path('/mnt/hd/rais_scratch')
+
+# Memória para ler e processar um arquivo. As linhas lidas por vez se ajustam a ela (ver dataset_reader/chunk_sizing.py);
+# os chunks salvos continuam com 500000 linhas.
+MEMORY_BUDGET = 2 << 30
+
+# JSON lines com o tempo de cada etapa por chunk e o progresso/ETA (ver dataset_reader/instrumentation.py). None desliga.
+PROGRESS_LOG = None  # ex.: 'progresso.jsonl'
+
+# Parse, transformação e escrita dos chunks em threads separadas (ver dataset_reader/pipeline.py).
+# Só pode compensar com núcleos livres para as threads; desligado até benchmarks/end_to_end.py --pipelined
+# mostrar ganho em uma máquina com vários núcleos (com um núcleo, não há: ver o README).
+PIPELINED = False
+
+# Agrega contagens e somas de salários de cada estado em _cube.parquet durante a leitura (ver dataset_reader/cubes.py).
+# Os cubos de cada ano são juntados com filtering/merge_cubes.py. Opcional, desligado por padrão.
+CUBES = False
+
+# Perfil de qualidade de cada estado (nulos, distintos, CPFs sem zeros, salários e datas inválidos...) em _profile.json,
+# calculado durante a leitura (ver dataset_reader/quality.py). Os perfis são juntados com filtering/merge_profiles.py.
+# Custa ~10% a mais de tempo de leitura (~13% com engine='pyarrow'), por isso fica desligado.
+PROFILE = False
+
+# Salários e remunerações como centavos em int64, exatos, em vez de float (ver transformations.parse_money_cents).
+# A opção fica no manifesto: ao mudá-la, os estados já completos com a outra opção são refeitos.
+MONEY_CENTS = False
+
 current_extracted_file = None
-reader = DatasetReader()
+reader = DatasetReader(money_cents=MONEY_CENTS)
+prefetcher = ExtractionPrefetcher()
 
 
 if __name__ == '__main__':
@@ -2,18 +2,43 @@ import os
 import logging
 from pathlib import Path
 
-import pandas as pd
-import numpy as np
-
 from helpers import (
-    get_compressed_files, get_inner_files, extract_inner_file
+    get_compressed_files, get_inner_files, get_inner_file_sizes, extract_inner_file, open_inner_file
 )
-from dataset_reader import DatasetReader
+from dataset_reader import DatasetReader, Instrumentation, manifest
 from cnae_and_cbo_manager import CnaeAndCboManager
 
 
 NUM_BRAZIL_STATES = 27
 
+# Lê os .txt direto de dentro dos .7z em vez de extraí-los para o disco
+STREAM_FROM_ARCHIVE = True
+
+# Memória para ler e processar um arquivo. As linhas lidas por vez se ajustam a ela (ver dataset_reader/chunk_sizing.py);
+# os chunks salvos continuam com 500000 linhas.
+MEMORY_BUDGET = 2 << 30
+
+# JSON lines com o tempo de cada etapa por chunk e o progresso/ETA (ver dataset_reader/instrumentation.py). None desliga.
+PROGRESS_LOG = None  # ex.: 'progresso.jsonl'
+
+# Parse, transformação e escrita dos chunks em threads separadas (ver dataset_reader/pipeline.py).
+# Só pode compensar com núcleos livres para as threads; desligado até benchmarks/end_to_end.py --pipelined
+# mostrar ganho em uma máquina com vários núcleos (com um núcleo, não há: ver o README).
+PIPELINED = False
+
+# Agrega contagens e somas de salários de cada estado em _cube.parquet durante a leitura (ver dataset_reader/cubes.py).
+# Os cubos de cada ano são juntados com filtering/merge_cubes.py. Opcional, desligado por padrão.
+CUBES = False
+
+# Perfil de qualidade de cada estado (nulos, distintos, CPFs sem zeros, salários e datas inválidos...) em _profile.json,
+# calculado durante a leitura (ver dataset_reader/quality.py). Os perfis são juntados com filtering/merge_profiles.py.
+# Custa ~10% a mais de tempo de leitura (~13% com engine='pyarrow'), por isso fica desligado.
+PROFILE = False
+
+# Salários e remunerações como centavos em int64, exatos, em vez de float (ver transformations.parse_money_cents).
+# A opção fica no manifesto: ao mudá-la, os estados já completos com a outra opção são refeitos.
+MONEY_CENTS = False
+
 
 def dir_should_be_ignored(directory):
     ignore = ['legado'] + [str(i) for i in range(2008, 2018)]
@@ -24,12 +49,9 @@ def main():
     data_dir = Path('/mnt/ssd/RAIS/dados/brutos')
     filtered_data_dir = Path('/mnt/ssd/RAIS/dados/filtrados')
 
-    city_to_state = {
-        key: val.split('-')[0].upper()
-        for key, val in CnaeAndCboManager.city_codes.items()
-    }
+    city_to_state = get_city_to_state()
 
-    reader = DatasetReader()
+    reader = DatasetReader(money_cents=MONEY_CENTS)
 
     for root, _, files in os.walk(data_dir):
         if dir_should_be_ignored(root):
@@ -42,56 +64,76 @@ def main():
             year_dir = filtered_data_dir / year
             year_dir.mkdir(exist_ok=True)
 
-            if len(list(year_dir.iterdir())) == NUM_BRAZIL_STATES:
+            if len(filtered_states(year_dir, reader.output_options)) == NUM_BRAZIL_STATES:
                 print(f'{year} already filtered')
                 break
 
             compressed_file_path = root / compressed_file
             inner_file = get_inner_files(compressed_file_path)[0]
             inner_file_path = root / inner_file
+            inner_file_size = get_inner_file_sizes(compressed_file_path)[inner_file] if PROGRESS_LOG else None
+            instrumentation = Instrumentation(PROGRESS_LOG, inner_file, inner_file_size)
 
-            if not inner_file_path.exists():
+            if not STREAM_FROM_ARCHIVE and not inner_file_path.exists():
                 print(f'extracting {compressed_file_path}...')
-                inner_file_path = extract_inner_file(root, compressed_file_path, inner_file)
-
-            print(f'reading states from {inner_file_path}...')
-            municipio_series = pd.read_csv(
-                inner_file_path,
-                sep=';',
-                encoding='latin1',
-                usecols=['Município'],
-                dtype=str
-            ).squeeze()
-
-            estados = municipio_series.map(city_to_state).rename('Estado')
-
-            for estado in estados.unique():
-                estado_output_dir = year_dir / estado
-
-                if estado_output_dir.exists():
-                    print(f'{estado} ({year}) already filtered')
-                    continue
-
-                skip = np.concatenate([[False], estados != estado])  # keep header
-
-                print(f'\nprocessing {estado} ({year}) from {inner_file_path}...')
-                try:
-                    reader.read_and_save_chunks(
-                        file_path=inner_file_path,
-                        output_dir=str(estado_output_dir),
-                        chunk_size=500000,
-                        year=year,
-                        skiprows=lambda x: skip[x]
-                    )
-                except Exception as e:
-                    logging.exception(f'Erro ao processar {estado} ({year}): {e}')
-                    continue
-
-            print(f'removing {inner_file_path}...')
-            os.remove(inner_file_path)
+                inner_file_path = Path(extract_inner_file(root, compressed_file_path, inner_file, instrumentation))
+
+            already_filtered = filtered_states(year_dir, reader.output_options)
+            source_info = manifest.describe_source(inner_file, archive=compressed_file_path)
+
+            print(f'\nprocessing {inner_file}...')
+            try:
+                if STREAM_FROM_ARCHIVE and not inner_file_path.exists():
+                    with open_inner_file(compressed_file_path, inner_file) as inner_file_stream:
+                        estados = split_states(reader, inner_file_stream, year_dir, year, city_to_state, already_filtered,
+                                               source_info=source_info, instrumentation=instrumentation)
+                else:
+                    estados = split_states(reader, inner_file_path, year_dir, year, city_to_state, already_filtered,
+                                           source_info=source_info, instrumentation=instrumentation)
+                print(f'filtered {", ".join(sorted(estados))} ({year})')
+            except Exception as e:
+                logging.exception(f'Erro ao processar {inner_file} ({year}): {e}')
+
+            if inner_file_path.exists():
+                print(f'removing {inner_file_path}...')
+                os.remove(inner_file_path)
             print('-' * 40)
 
 
+def get_city_to_state():
+    return CnaeAndCboManager.city_to_state
+
+
+def filtered_states(year_dir, options=None):
+    '''
+    Estados com todos os chunks salvos (e, com options, salvos com essas DatasetReader.output_options).
+    Diretórios incompletos (execução interrompida) ou com outras opções são refeitos.
+    '''
+    if not Path(year_dir).exists():
+        return set()
+    return {p.name for p in Path(year_dir).iterdir() if p.is_dir() and manifest.is_complete(str(p), options=options)}
+
+
+def split_states(reader, source, year_dir, year, city_to_state, already_filtered, writer=None, source_info=None,
+                 instrumentation=None, memory_budget=MEMORY_BUDGET, pipelined=PIPELINED,
+                 cubes=CUBES, profile=PROFILE):
+    return reader.read_and_save_split_chunks(
+        file_path=source,
+        output_dir=str(year_dir),
+        split_by=lambda df: CnaeAndCboManager.map_codes(df['Municipio'], city_to_state),
+        chunk_size=writer.chunk_size if writer else 500000,
+        year=year,
+        skip_keys=already_filtered,
+        writer=writer,
+        source_info=source_info,
+        instrumentation=instrumentation,
+        memory_budget=memory_budget,
+        pipelined=pipelined,
+        cubes=cubes,
+        profile=profile
+    )
+
+
 def extract_year_from_path(path):
     for part in Path(path).parts:
         if part.isdigit() and len(part) == 4:
@@ -1,11 +1,21 @@
+import io
 import os
 import re
 import sys
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
 
 import py7zr
+from py7zr.io import Py7zIO, WriterFactory
 
 sys.path.append('../')
-from processing.dataset_reader import DatasetReader
+from dataset_reader import DatasetReader, Instrumentation
+
+# Espaço deixado livre ao extrair: os chunks de saída também crescem durante a filtragem
+SCRATCH_RESERVE = 10 << 30
 
 
 def change_root_directory(path, new_root):
@@ -36,6 +46,20 @@ def get_inner_files(compressed_file):
     with py7zr.SevenZipFile(compressed_file, mode='r') as z:
         return z.getnames() or []
 
+def get_inner_file_sizes(compressed_file):
+    """Tamanho descompactado de cada arquivo do .7z, lido dos cabeçalhos (sem descompactar)"""
+    with py7zr.SevenZipFile(compressed_file, mode='r') as z:
+        return {info.filename: info.uncompressed for info in z.list()}
+
+def get_free_space(directory):
+    """Espaço livre (bytes) no disco de directory, que é criado se não existir"""
+    os.makedirs(directory, exist_ok=True)
+    return shutil.disk_usage(directory).free
+
+def fits_on_disk(directory, size, reserve=SCRATCH_RESERVE):
+    """Se um arquivo de size bytes (tamanho descompactado, ver get_inner_file_sizes) cabe em directory"""
+    return size is not None and get_free_space(directory) - reserve >= size
+
 def get_new_year_path_from_filename(filename, filtered_data_dir):
     path = os.path.join(filtered_data_dir, extract_number_from_filename(filename))
     os.makedirs(path, exist_ok=True)
@@ -59,10 +83,197 @@ def get_equivalent_parquet_file(file_path):
 def unwanted_file(file):
     return file.startswith('sp08')
 
-def extract_inner_file(root, compressed_file_path, inner_file):
+def extract_inner_file(root, compressed_file_path, inner_file, instrumentation=None):
+    instrumentation = instrumentation or Instrumentation()
+    with instrumentation.stage('extract') as fields:
+        _extract(root, compressed_file_path, inner_file)
+        fields['bytes'] = os.path.getsize(os.path.join(root, inner_file))
+    return os.path.join(root, inner_file)
+
+def _extract(root, compressed_file_path, inner_file):
     with py7zr.SevenZipFile(compressed_file_path, mode='r') as z:
         z.extract(path=root, targets=[inner_file])
-    return os.path.join(root, inner_file)
+
+class ExtractionPrefetcher:
+    """
+    Extrai o próximo arquivo em uma thread enquanto o atual é processado. extract() espera a extração
+    já pedida com prefetch() (medindo só a espera como a etapa extract) ou extrai na hora.
+    Ocupa no disco o espaço dos dois arquivos ao mesmo tempo.
+    """
+
+    def __init__(self):
+        self._pending = {}  # caminho extraído -> (thread, erros)
+
+    def prefetch(self, root, compressed_file_path, inner_file):
+        path = os.path.join(root, inner_file)
+        if path in self._pending:
+            return
+        errors = []
+
+        def extract():
+            try:
+                _extract(root, compressed_file_path, inner_file)
+            except Exception as e:
+                errors.append(e)
+
+        # daemon: um Ctrl+C não espera a extração terminar
+        thread = threading.Thread(target=extract, daemon=True)
+        thread.start()
+        self._pending[path] = (thread, errors)
+
+    def is_pending(self, root, inner_file):
+        return os.path.join(root, inner_file) in self._pending
+
+    def extract(self, root, compressed_file_path, inner_file, instrumentation=None):
+        path = os.path.join(root, inner_file)
+        if path not in self._pending:
+            return extract_inner_file(root, compressed_file_path, inner_file, instrumentation)
+
+        thread, errors = self._pending.pop(path)
+        instrumentation = instrumentation or Instrumentation()
+        with instrumentation.stage('extract') as fields:
+            thread.join()
+            if errors:
+                raise errors[0]
+            fields['bytes'] = os.path.getsize(path)
+        return path
+
+    def discard(self):
+        """Remove os arquivos extraídos (ou ainda sendo extraídos) que não foram usados"""
+        for path in self._pending:
+            if os.path.exists(path):
+                os.remove(path)
+        self._pending.clear()
+
+@contextmanager
+def open_inner_file(compressed_file_path, inner_file):
+    """
+    Abre o arquivo de dentro do .7z como um stream binário, descompactando sob demanda
+    (sem extrair para o disco). Usa o 7z do sistema se disponível; senão, o py7zr em uma thread.
+    Uma falha na descompressão é lançada pela leitura que chega ao fim do stream, antes de o chamador
+    terminar (e, no DatasetReader, antes de o manifesto ser marcado como completo).
+    """
+    seven_zip = shutil.which('7z') or shutil.which('7za')
+    opener = _open_with_7z_binary if seven_zip else _open_with_py7zr
+    with opener(seven_zip, str(compressed_file_path), inner_file) as stream:
+        yield stream
+
+class _CheckedStream(io.RawIOBase):
+    """
+    Repassa a leitura de stream e, ao chegar ao fim, chama check, que lança o erro da descompressão, se houver.
+    Assim o erro aparece na leitura, antes de o ChunkWriter marcar o manifesto como completo.
+    """
+
+    def __init__(self, stream, check):
+        self._stream = stream
+        self._check = check
+        self.name = getattr(stream, 'name', '')
+        self.at_eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._stream.readinto(buffer)
+        if n == 0 and len(buffer) > 0 and not self.at_eof:
+            self.at_eof = True
+            self._check()
+        return n
+
+@contextmanager
+def _open_with_7z_binary(seven_zip, compressed_file_path, inner_file):
+    """
+    O código de saída do 7z é conferido quando o stream chega ao fim: quem para antes (ex.: lendo só
+    o cabeçalho) fecha o pipe e o 7z morre com SIGPIPE, o que não é um erro. Se o leitor falhar, o 7z é
+    encerrado e o erro do leitor é relançado. O stderr vai para um temporário, para que um 7z que escreve
+    muito nele não trave esperando que alguém o leia.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [seven_zip, 'e', '-so', '-bd', compressed_file_path, inner_file],
+            stdout=subprocess.PIPE, stderr=stderr
+        )
+
+        def check():
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f'7z failed on {inner_file} ({compressed_file_path}): '
+                                   f'{stderr.read().decode(errors="replace")}')
+
+        try:
+            yield _CheckedStream(process.stdout, check)
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+
+class _PipeIO(Py7zIO):
+    """Destino do py7zr que escreve os dados descompactados em um pipe"""
+
+    def __init__(self, pipe):
+        self._pipe = pipe
+        self._size = 0
+
+    def write(self, s):
+        self._pipe.write(s)
+        self._size += len(s)
+        return len(s)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self._size
+
+    def flush(self):
+        self._pipe.flush()
+
+    def size(self):
+        return self._size
+
+class _PipeFactory(WriterFactory):
+    def __init__(self, pipe):
+        self._pipe = pipe
+
+    def create(self, filename):
+        return _PipeIO(self._pipe)
+
+@contextmanager
+def _open_with_py7zr(_, compressed_file_path, inner_file):
+    read_fd, write_fd = os.pipe()
+    pipe = os.fdopen(write_fd, 'wb')
+    errors = []
+
+    def extract():
+        try:
+            with py7zr.SevenZipFile(compressed_file_path, mode='r') as z:
+                z.extract(targets=[inner_file], factory=_PipeFactory(pipe))
+        except BrokenPipeError:
+            pass  # o leitor parou antes do fim
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+
+    thread = threading.Thread(target=extract, daemon=True)
+    thread.start()
+
+    def check():
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    stream = os.fdopen(read_fd, 'rb')
+    try:
+        yield _CheckedStream(stream, check)
+    finally:
+        stream.close()
+        thread.join()
 
 def read_and_process_csv(path, inner_file, logger):
     try:
@@ -0,0 +1,21 @@
+import logging
+import argparse
+from pathlib import Path
+
+from dataset_reader import cubes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Junta os cubos de agregados dos estados em um cubo por ano (cube_AAAA.parquet)')
+    parser.add_argument('--input-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/filtrados'))
+    parser.add_argument('--output-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/cubos'))
+    parser.add_argument('--years', type=int, nargs='+', default=None, help='padrão: todos os anos')
+    args = parser.parse_args()
+
+    written = cubes.merge_cubes(str(args.input_dir), str(args.output_dir), args.years)
+    logging.info(f'{len(written)} cubos escritos em {args.output_dir}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
@@ -0,0 +1,26 @@
+import logging
+import argparse
+from pathlib import Path
+
+from dataset_reader import quality
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Junta os perfis de qualidade dos estados em um perfil por ano e um geral')
+    parser.add_argument('--input-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/filtrados'))
+    parser.add_argument('--output-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/perfis'))
+    parser.add_argument('--years', type=int, nargs='+', default=None, help='padrão: todos os anos')
+    args = parser.parse_args()
+
+    written = quality.merge_profiles(str(args.input_dir), str(args.output_dir), args.years)
+    logging.info(f'{len(written)} perfis escritos em {args.output_dir}')
+
+    if written:
+        profile = quality.Profile.load(written[-1])
+        logging.info(f'{profile.rows} linhas')
+        logging.info(profile.summary().fillna('').to_string())
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
@@ -0,0 +1,377 @@
+import os
+import time
+import shutil
+import logging
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from helpers import (
+    get_compressed_files, get_inner_file_sizes, file_should_be_ignored, unwanted_file,
+    extract_number_from_filename, extract_state_from_filename, open_inner_file, extract_inner_file,
+    get_free_space, fits_on_disk, SCRATCH_RESERVE
+)
+from dataset_reader import DatasetReader, Instrumentation, SplitChunkWriter, categories, cpf_index, manifest, pipeline
+from cnae_and_cbo_manager import CnaeAndCboManager
+import filtering
+import filtering_2018up
+
+
+GB = 1 << 30
+
+# Estimativa de memória de um job: uma base fixa (interpretador, tabelas de códigos, buffer do ChunkWriter)
+# mais a memória de leitura (chunk_memory), que limita o pico independentemente do tamanho do arquivo.
+# Com pipelined, cada chunk a mais nas filas (pipeline.in_flight) soma uma fração de chunk_memory: o ChunkSizer
+# já o inclui no orçamento, mas as linhas lidas por vez têm um mínimo. Em SP2010 sintético (311 MB), o pico
+# ficou 4% a 13% acima do sequencial com orçamentos de 256 MB a 1 GB.
+BASE_JOB_MEMORY = 1 * GB
+PIPELINE_MEMORY_PER_CHUNK = 0.1
+
+# Sem chunk_memory, as linhas lidas por vez são fixas e a memória cresce com o arquivo: uma fração do tamanho
+# descompactado. Arquivos grandes (SP) acumulam mais categorias, buffers de chunks e fragmentação de memória.
+MEMORY_PER_INPUT_BYTE = 0.5
+
+
+class Job:
+    '''
+    Um arquivo de dentro de um .7z a ser filtrado. Antes de 2018 cada arquivo é um estado
+    (state preenchido); de 2018 em diante cada arquivo é uma região que é dividida por estado.
+    Com scratch_dir, o arquivo é extraído nele antes de ser lido (ver run_jobs); senão, é lido direto do .7z.
+    chunk_memory e pipelined (também preenchidos por run_jobs) definem a memória estimada do job.
+    '''
+
+    def __init__(self, archive: Path, inner_file: str, year: str, output_dir: Path,
+                 uncompressed_size: int, state: str = None):
+        self.archive = archive
+        self.inner_file = inner_file
+        self.year = year
+        self.output_dir = output_dir
+        self.uncompressed_size = uncompressed_size
+        self.state = state
+        self.scratch_dir: Path = None
+        self.chunk_memory: int = None
+        self.pipelined = False
+
+    @property
+    def is_region(self) -> bool:
+        return self.state is None
+
+    @property
+    def memory(self) -> int:
+        if self.chunk_memory is None:
+            return int(BASE_JOB_MEMORY + self.uncompressed_size * MEMORY_PER_INPUT_BYTE)
+        in_flight = pipeline.in_flight(self.pipelined)
+        return int(BASE_JOB_MEMORY + self.chunk_memory * (1 + in_flight * PIPELINE_MEMORY_PER_CHUNK))
+
+    @property
+    def scratch(self) -> int:
+        '''Espaço em disco usado pela extração'''
+        return self.uncompressed_size if self.scratch_dir else 0
+
+    def __repr__(self):
+        return f'{self.inner_file} ({self.year}, {self.state or "região"})'
+
+
+def discover_jobs(data_dir: Path, filtered_data_dir: Path, options: dict = None) -> list[Job]:
+    '''
+    Jobs dos arquivos ainda não filtrados. Com options (DatasetReader.output_options), os estados salvos
+    com outras opções também são refeitos.
+    '''
+    jobs = []
+
+    for root, _, files in os.walk(data_dir):
+        root = Path(root)
+        state_files = not filtering.dir_should_be_ignored(str(root))
+        region_files = not filtering_2018up.dir_should_be_ignored(str(root))
+
+        for compressed_file in get_compressed_files(files):
+            if file_should_be_ignored(compressed_file) or filtering.archive_should_be_ignored(compressed_file):
+                continue
+
+            compressed_file_path = root / compressed_file
+            if state_files:
+                jobs.extend(_state_jobs(compressed_file_path, filtered_data_dir, options))
+            elif region_files:
+                jobs.extend(_region_jobs(compressed_file_path, filtered_data_dir, options))
+
+    return jobs
+
+
+def _state_jobs(compressed_file_path: Path, filtered_data_dir: Path, options: dict = None) -> list[Job]:
+    jobs = []
+
+    for inner_file, size in get_inner_file_sizes(compressed_file_path).items():
+        if unwanted_file(inner_file):
+            continue
+
+        year = extract_number_from_filename(inner_file)
+        state = extract_state_from_filename(inner_file)
+        chunks_dir = filtered_data_dir / year / state
+
+        if filtering.has_been_processed(chunks_dir, options):
+            logging.info(f'Skipping {inner_file} - state directory already processed')
+            continue
+
+        jobs.append(Job(compressed_file_path, inner_file, year, chunks_dir, size, state))
+
+    return jobs
+
+
+def _region_jobs(compressed_file_path: Path, filtered_data_dir: Path, options: dict = None) -> list[Job]:
+    year = filtering_2018up.extract_year_from_path(compressed_file_path.parent)
+    year_dir = filtered_data_dir / year
+
+    if len(filtering_2018up.filtered_states(year_dir, options)) == filtering_2018up.NUM_BRAZIL_STATES:
+        logging.info(f'{year} already filtered')
+        return []
+
+    return [
+        Job(compressed_file_path, inner_file, year, year_dir, size)
+        for inner_file, size in get_inner_file_sizes(compressed_file_path).items()
+    ]
+
+
+def load_or_build_categories(path: Path, jobs: list[Job]) -> categories.Categories:
+    '''
+    Carrega as categorias fixas de path. Se o arquivo não existir, ele é criado com as tabelas de códigos
+    e uma varredura dos arquivos dos jobs. Deve ser o mesmo arquivo para toda a árvore de filtrados.
+    '''
+    if path.exists():
+        return categories.load(path)
+
+    logging.info(f'Criando {path}: varrendo as colunas categóricas de {len(jobs)} arquivos')
+    code_tables = categories.from_code_tables(
+        CnaeAndCboManager.cnae_subclass_codes, CnaeAndCboManager.cbo_codes, CnaeAndCboManager.city_codes
+    )
+    found = categories.scan(DatasetReader(), _job_streams(jobs))
+    result = categories.merge(code_tables, found)
+    categories.save(result, path)
+    return result
+
+
+def _job_streams(jobs: list[Job]):
+    for job in jobs:
+        with open_inner_file(job.archive, job.inner_file) as inner_file_stream:
+            yield inner_file_stream
+
+
+def run_jobs(jobs: list[Job], workers: int, memory_budget: int, chunk_size: int,
+             fixed_categories: categories.Categories = None, sort_by_cpf: bool = False,
+             progress_log: str = None, chunk_memory: int = None, pipelined: bool = False,
+             scratch_dir: Path = None, scratch_budget: int = None, cubes: bool = False,
+             profile: bool = False, money_cents: bool = False) -> None:
+    '''
+    Executa os jobs em um pool de processos. Um job só começa se a soma da memória estimada
+    dos jobs em execução couber em memory_budget (ver Job.memory): com chunk_memory, ela não depende
+    do tamanho do arquivo; sem ela, estados grandes não rodam juntos.
+    Com scratch_dir, os arquivos são extraídos nele (em <ano>/) e um job só começa se a soma dos tamanhos
+    descompactados (lidos dos cabeçalhos do .7z) dos jobs em execução couber em scratch_budget, por padrão
+    o espaço livre em scratch_dir menos SCRATCH_RESERVE. Arquivos maiores que o orçamento são lidos do .7z.
+    Os maiores jobs (na fração do orçamento de memória ou de disco, a que for maior) são agendados primeiro
+    e os pequenos preenchem o que sobra.
+    Com progress_log, todos os workers registram as etapas e o progresso no mesmo arquivo JSON lines.
+    chunk_memory é a memória de leitura de cada job (ver dataset_reader/chunk_sizing.py). Com pipelined,
+    cada job usa mais threads (ver dataset_reader/pipeline.py); só compensa com menos workers que núcleos.
+    Com cubes, cada estado ganha um _cube.parquet com contagens e somas de salários (ver dataset_reader/cubes.py).
+    Com profile, um _profile.json com o perfil de qualidade dos dados (ver dataset_reader/quality.py).
+    Com money_cents, os salários são salvos em centavos int64 (ver DatasetReader).
+    '''
+    if scratch_dir:
+        scratch_budget = scratch_budget if scratch_budget is not None else get_free_space(scratch_dir) - SCRATCH_RESERVE
+        _assign_scratch(jobs, scratch_dir, scratch_budget)
+    scratch_budget = max(scratch_budget or 0, 0)
+    for job in jobs:
+        job.chunk_memory = chunk_memory
+        job.pipelined = pipelined
+
+    def share(job: Job) -> float:
+        return max(job.memory / memory_budget, job.scratch / scratch_budget if scratch_budget else 0)
+
+    def fits(job: Job) -> bool:
+        return memory_in_use + job.memory <= memory_budget and scratch_in_use + job.scratch <= scratch_budget
+
+    pending = sorted(jobs, key=share, reverse=True)
+    running = {}
+    memory_in_use = 0
+    scratch_in_use = 0
+
+    # max_tasks_per_child=1: cada job roda em um processo novo, que devolve a memória ao terminar
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1, initializer=_init_worker) as executor:
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    job = next((j for j in pending if fits(j)), None)
+                    if job is None:
+                        if running:
+                            break
+                        job = pending[0]  # maior que o orçamento de memória: roda sozinho
+
+                    pending.remove(job)
+                    memory_in_use += job.memory
+                    scratch_in_use += job.scratch
+                    running[executor.submit(run_job, job, chunk_size, fixed_categories, sort_by_cpf, progress_log,
+                                            chunk_memory, pipelined, cubes, profile,
+                                            money_cents)] = job
+                    logging.info(f'Iniciando {job} (~{job.memory / GB:.1f} GB'
+                                 f'{f", {job.scratch / GB:.1f} GB extraídos" if job.scratch else ""})')
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    memory_in_use -= job.memory
+                    scratch_in_use -= job.scratch
+                    try:
+                        logging.info(f'Concluído {job} em {future.result():.0f}s')
+                    except Exception as e:
+                        logging.error(f'Erro ao processar {job}: {e}')
+
+        except KeyboardInterrupt:
+            logging.info('Interrompido. Aguardando os workers limparem seus arquivos...')
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def _assign_scratch(jobs: list[Job], scratch_dir: Path, scratch_budget: int) -> None:
+    for job in jobs:
+        if job.uncompressed_size <= scratch_budget:
+            job.scratch_dir = scratch_dir / job.year
+        else:
+            logging.info(f'{job} ({job.uncompressed_size / GB:.1f} GB) não cabe em {scratch_dir} '
+                         f'({scratch_budget / GB:.1f} GB): lido direto do .7z')
+
+
+_reader = None
+
+
+def run_job(job: Job, chunk_size: int, fixed_categories: categories.Categories = None,
+            sort_by_cpf: bool = False, progress_log: str = None, chunk_memory: int = None,
+            pipelined: bool = False, cubes: bool = False, profile: bool = False,
+            money_cents: bool = False) -> float:
+    '''
+    Executado no worker. Em caso de erro (ou Ctrl+C), os chunks de um estado ficam para serem retomados
+    na próxima execução; os diretórios parciais de uma região (que não são retomados) são removidos.
+    Com sort_by_cpf, cada estado salvo é reordenado por Cpf (ver dataset_reader/cpf_index.py).
+    '''
+    global _reader
+    if _reader is None:
+        _reader = DatasetReader(categories=fixed_categories, money_cents=money_cents)
+
+    start = time.time()
+    # estados já filtrados (de 2018 em diante, outras regiões do mesmo ano podem estar rodando em paralelo)
+    already_filtered = (filtering_2018up.filtered_states(job.output_dir, _reader.output_options)
+                        if job.is_region else set())
+    source_info = manifest.describe_source(job.inner_file, archive=job.archive)
+    writer = SplitChunkWriter(str(job.output_dir), chunk_size, bool(fixed_categories)) if job.is_region else None
+    instrumentation = Instrumentation(progress_log, job.inner_file, job.uncompressed_size)
+
+    try:
+        with _open_job_file(job, instrumentation) as source:
+            if job.is_region:
+                filtering_2018up.split_states(
+                    _reader, source, job.output_dir, job.year,
+                    filtering_2018up.get_city_to_state(), already_filtered, writer, source_info, instrumentation,
+                    chunk_memory, pipelined, cubes, profile
+                )
+            else:
+                _reader.read_and_save_chunks(source, str(job.output_dir), chunk_size=chunk_size,
+                                             year=job.year, source_info=source_info, instrumentation=instrumentation,
+                                             memory_budget=chunk_memory, pipelined=pipelined, cubes=cubes,
+                                             profile=profile)
+
+        if sort_by_cpf:
+            state_dirs = [job.output_dir / key for key in writer.keys()] if job.is_region else [job.output_dir]
+            for state_dir in state_dirs:
+                cpf_index.sort_by_cpf(str(state_dir), fixed_categories=bool(fixed_categories))
+
+    except BaseException:
+        if job.is_region:
+            _cleanup([job.output_dir / key for key in writer.keys()])
+        raise
+
+    return time.time() - start
+
+
+@contextmanager
+def _open_job_file(job: Job, instrumentation: Instrumentation):
+    '''O arquivo do job extraído em job.scratch_dir (e removido ao final) ou, sem scratch_dir, lido do .7z'''
+    # o orçamento é calculado no início: outro processo pode ter ocupado o disco desde então
+    if job.scratch_dir and not fits_on_disk(job.scratch_dir, job.uncompressed_size, reserve=0):
+        logging.info(f'Sem espaço em {job.scratch_dir} para extrair {job.inner_file}: lendo direto do .7z')
+        job.scratch_dir = None
+
+    if job.scratch_dir is None:
+        with open_inner_file(job.archive, job.inner_file) as inner_file_stream:
+            yield inner_file_stream
+        return
+
+    inner_file_path = job.scratch_dir / job.inner_file
+    try:
+        extract_inner_file(str(job.scratch_dir), str(job.archive), job.inner_file, instrumentation)
+        yield str(inner_file_path)
+    finally:
+        if inner_file_path.exists():
+            logging.info(f'Cleaning up extracted file: {inner_file_path}')
+            os.remove(inner_file_path)
+
+
+def _cleanup(partial_dirs: list[Path]) -> None:
+    for directory in partial_dirs:
+        if directory.exists():
+            logging.info(f'Cleaning up chunks directory: {directory}')
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _init_worker():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filtra os arquivos da RAIS em paralelo')
+    parser.add_argument('--data-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/brutos'))
+    parser.add_argument('--output-dir', type=Path, default=Path('/mnt/ssd/RAIS/dados/filtrados'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--memory-budget', type=float, default=64, help='memória total para os workers, em GB')
+    parser.add_argument('--chunk-size', type=int, default=500000, help='linhas por chunk salvo')
+    parser.add_argument('--chunk-memory', type=float, default=2,
+                        help='memória para ler e processar cada arquivo, em GB; as linhas lidas por vez se ajustam a ela')
+    parser.add_argument('--sort-by-cpf', action='store_true',
+                        help='ordena cada estado por Cpf e cria o índice de CPFs (_cpf_index.parquet) ao final')
+    parser.add_argument('--categories', type=Path, default=None,
+                        help='JSON com categorias fixas para Municipio, CNAE e CBO (criado se não existir)')
+    parser.add_argument('--progress-log', default=None,
+                        help='JSON lines com o tempo de cada etapa por chunk, memória e progresso/ETA de cada arquivo')
+    parser.add_argument('--scratch-dir', type=Path, default=None,
+                        help='extrai os arquivos neste diretório antes de lê-los (padrão: lê direto do .7z)')
+    parser.add_argument('--scratch-budget', type=float, default=None,
+                        help='espaço para os arquivos extraídos ao mesmo tempo, em GB '
+                             '(padrão: o espaço livre em --scratch-dir menos 10 GB)')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='parse, transformação e escrita de cada arquivo em threads separadas')
+    parser.add_argument('--cubes', action='store_true',
+                        help='agrega contagens e somas de salários de cada estado em _cube.parquet (ver merge_cubes.py)')
+    parser.add_argument('--profile', action='store_true',
+                        help='perfil de qualidade dos dados de cada estado em _profile.json (ver merge_profiles.py)')
+    parser.add_argument('--money-cents', action='store_true',
+                        help='salva salários e remunerações como centavos em int64, exatos, em vez de float')
+    args = parser.parse_args()
+
+    jobs = discover_jobs(args.data_dir, args.output_dir, DatasetReader(money_cents=args.money_cents).output_options)
+    logging.info(f'{len(jobs)} arquivos para processar')
+
+    fixed_categories = load_or_build_categories(args.categories, jobs) if args.categories else None
+
+    try:
+        run_jobs(jobs, args.workers, int(args.memory_budget * GB), args.chunk_size, fixed_categories, args.sort_by_cpf,
+                 args.progress_log, int(args.chunk_memory * GB), args.pipelined, args.scratch_dir,
+                 int(args.scratch_budget * GB) if args.scratch_budget is not None else None, args.cubes,
+                 args.profile, args.money_cents)
+        if args.sort_by_cpf:
+            cpf_index.build_cpf_index(str(args.output_dir))
+    except KeyboardInterrupt:
+        exit(0)
+
+
+if __name__ == '__main__':
+    filtering.setup_logging('erros.txt')
+    main()
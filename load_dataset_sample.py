@@ -1,30 +1,174 @@
+import re
+from pathlib import Path
+from typing import Iterable, Union
+
 import pandas as pd
 import pyarrow as pa
 import pyarrow.dataset as ds
 import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
+from dataset_reader import compaction, cpf_index, manifest
 
-def load_dataset(year: int = None, state: str = None, cpfs: list[str] = None,
-                 head=None, path=None) -> pd.DataFrame:
+# filtrados/<ano>/<UF>/chunk_N.parquet.zstd: ano e UF viram as colunas year e uf, como na árvore compactada
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('uf', pa.string())]))
 
-    if path is None:
-        if state is None or year is None:
-            raise ValueError('State must be provided if path is not specified.')
-        path = FILTERED_DATA_DIR / f'{year}' / f'{state}'
+Years = Union[int, Iterable[int]]
+States = Union[str, Iterable[str]]
 
-    dataset = ds.dataset(path, format='parquet')
 
-    if head:
-        return dataset.head(head).to_pandas()
+def load_dataset(year: Years = None, state: States = None, cpfs: list[str | int] = None,
+                 head=None, path=None, columns: list[str] = None, filters: Union[dict, pc.Expression] = None) -> pd.DataFrame:
+    '''
+    Carrega os dados filtrados em uma única varredura do pyarrow.dataset, lendo só as colunas em columns
+    e só as linhas que passam pelos filtros (aplicados durante a leitura, com poda de arquivos e row groups).
+
+    year e state aceitam um valor, uma lista ou um range (ex.: year=range(2010, 2015), state=['SP', 'RJ']);
+    sem eles, todos os anos/estados são lidos. Com mais de um ano/estado, as colunas year e uf são incluídas.
+    FILTERED_DATA_DIR pode ser a árvore original ou a compactada (year=<ano>/uf=<UF>, ver dataset_reader/compaction.py).
+    filters é uma pc.Expression ou um dicionário {coluna: condição} (ver build_filter), por exemplo:
+        {'CnaeSubclasse20': ['0113000', '1071600'], 'VinculoAtivo31/12': True,
+         'DataAdmissao': ('2015-01-01', '2015-12-31'), 'Idade': (18, None)}
+    '''
+    years = _as_list(year)
+    states = _as_list(state)
+    single = years is not None and len(years) == 1 and states is not None and len(states) == 1
+
+    if cpfs and path is None and cpf_index.has_cpf_index(FILTERED_DATA_DIR):
+        # Com o índice de CPFs (ver dataset_reader/cpf_index.py) só os row groups que podem conter os CPFs são lidos;
+        # os diretórios que ele não cobre (não ordenados ou reescritos depois dele) são varridos
+        cpf_type = pq.read_schema(FILTERED_DATA_DIR / cpf_index.INDEX_FILE).field('min').type
+        table = cpf_index.read_cpfs(FILTERED_DATA_DIR, cpfs_array(cpfs, cpf_type).to_pylist(),
+                                    years=years, states=states, columns=columns)
+        if filters is not None and table.num_rows:
+            table = table.filter(build_filter(table.schema, filters))
+        if columns is None and single:
+            table = table.drop_columns([name for name in ('year', 'uf') if name in table.schema.names])
+        return (table.slice(0, head) if head else table).to_pandas()
 
-    myfilter = None
+    if path is not None:
+        dataset = ds.dataset(path, format='parquet')
+        dataset = ds.dataset(path, format='parquet', schema=compaction.unified_schema([dataset.schema]))
+        partition_filter = None
+    else:
+        if compaction.is_compacted(FILTERED_DATA_DIR):
+            dataset = compaction.open_dataset(FILTERED_DATA_DIR)
+        else:
+            dataset = _open_filtered(years, states)
+        partition_filter = _partition_filter(years, states)
+        if columns is None:
+            columns = [name for name in dataset.schema.names if not (single and name in ('year', 'uf'))]
 
+    myfilter = partition_filter
+    if filters is not None:
+        myfilter = _and(myfilter, build_filter(dataset.schema, filters))
     if cpfs:
-        array = pa.array(cpfs)
-        myfilter = pc.is_in(pc.field('Cpf'), array)
-        dataset = dataset.filter(myfilter)
-    
-    return dataset.to_table(filter=myfilter).to_pandas()
+        myfilter = _and(myfilter, pc.field('Cpf').isin(cpfs_array(cpfs, dataset.schema.field('Cpf').type)))
+
+    if head:
+        return dataset.head(head, columns=columns, filter=myfilter).to_pandas()
+
+    return dataset.to_table(columns=columns, filter=myfilter).to_pandas()
+
+
+def build_filter(schema: pa.Schema, filters: Union[dict, pc.Expression]) -> pc.Expression:
+    '''
+    Converte {coluna: condição} em uma pc.Expression. Condições:
+        valor              -> coluna == valor
+        lista/set/range    -> coluna em valores
+        tupla (início, fim) -> início <= coluna <= fim (None deixa o lado aberto)
+    Os valores são convertidos para o tipo da coluna (ex.: '2015-01-01' para timestamp).
+    '''
+    if isinstance(filters, pc.Expression):
+        return filters
+
+    expression = None
+    for column, condition in filters.items():
+        field = pc.field(column)
+        value_type = schema.field(column).type
+        if pa.types.is_dictionary(value_type):
+            value_type = value_type.value_type
+
+        if isinstance(condition, tuple):
+            start, end = condition
+            if start is not None:
+                expression = _and(expression, field >= _scalar(start, value_type))
+            if end is not None:
+                expression = _and(expression, field <= _scalar(end, value_type))
+        elif isinstance(condition, (list, set, frozenset, range)):
+            values = [_scalar(v, value_type) for v in condition]
+            expression = _and(expression, field.isin(pa.array([v.as_py() for v in values], values[0].type if values else value_type)))
+        else:
+            expression = _and(expression, field == _scalar(condition, value_type))
+
+    return expression
+
+
+def cpfs_array(cpfs: list, cpf_type: pa.DataType) -> pa.Array:
+    '''Aceita Cpfs como texto ou inteiros e converte para o tipo da coluna salva (ver DatasetReader(integer_ids=True))'''
+    if pa.types.is_integer(cpf_type):
+        return pa.array([int(re.sub(r'\D', '', str(cpf))) for cpf in cpfs], type=cpf_type)
+    return pa.array([re.sub(r'\D', '', str(cpf)).zfill(11) for cpf in cpfs], type=cpf_type)
+
+
+def _open_filtered(years, states) -> ds.Dataset:
+    '''
+    Abre só os diretórios <ano>/<UF> pedidos, sem listar a árvore inteira. A largura dos índices dos
+    dicionários muda entre chunks, então o schema é o comum aos diretórios (ver compaction.unified_schema).
+    '''
+    files, schemas = [], []
+    for year_dir in _subdirs(FILTERED_DATA_DIR, years):
+        if not year_dir.name.isdigit():
+            continue
+        for state_dir in _subdirs(year_dir, None if states is None else [str(s).upper() for s in states]):
+            state_files = manifest.chunk_files(str(state_dir))
+            if state_files:
+                files += state_files
+                schemas.append(pq.read_schema(state_files[0]))
+
+    if not files:
+        raise Exception(f'No filtered data in {FILTERED_DATA_DIR} for years {years} and states {states}')
+
+    schema = compaction.unified_schema([*schemas, PARTITIONING.schema])
+    return ds.dataset(files, schema=schema, format='parquet', partitioning=PARTITIONING,
+                      partition_base_dir=str(FILTERED_DATA_DIR))
+
+
+def _subdirs(path: Path, names) -> list[Path]:
+    if names is not None:
+        return [path / str(name) for name in names if (path / str(name)).is_dir()]
+    return sorted(child for child in path.iterdir() if child.is_dir() and not child.name.startswith(('_', '.')))
+
+
+def _partition_filter(years, states):
+    expression = None
+    if years is not None:
+        expression = _and(expression, pc.field('year').isin(pa.array([int(y) for y in years], pa.int16())))
+    if states is not None:
+        expression = _and(expression, pc.field('uf').isin(pa.array([str(s).upper() for s in states], pa.string())))
+    return expression
+
+
+def _scalar(value, value_type: pa.DataType) -> pa.Scalar:
+    if pa.types.is_timestamp(value_type) or pa.types.is_date(value_type):
+        value = pd.Timestamp(value).to_pydatetime()
+    elif pa.types.is_string(value_type):
+        value = str(value)
+    elif pa.types.is_integer(value_type):
+        return pa.scalar(int(value))  # o valor pode não caber no tipo da coluna (ex.: Idade <= 200 em int8)
+    return pa.scalar(value, value_type)
+
+
+def _and(left, right):
+    return right if left is None else left & right
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, int)):
+        return [value]
+    return list(value)
 
 
-FILTERED_DATA_DIR = 'caminho/para/os/dados/filtrados'
+FILTERED_DATA_DIR = Path('caminho/para/os/dados/filtrados')
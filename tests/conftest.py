@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader
+
+
+@pytest.fixture
+def make_state(tmp_path):
+    '''Gera um arquivo sintético (ver benchmarks/synthetic.py) e salva em <root>/<ano>/<UF>. Retorna o diretório.'''
+    def make(root, year: int, state: str, rows: int = 3000, chunk_size: int = 1000, seed: int = 0,
+             reader: DatasetReader = None, **kwargs) -> str:
+        source = synthetic.generate(str(tmp_path / f'{state}{year}ID.txt'), rows, year, [state], seed=seed)
+        output_dir = os.path.join(root, str(year), state)
+        (reader or DatasetReader()).read_and_save_chunks(source, output_dir, chunk_size=chunk_size, **kwargs)
+        return output_dir
+
+    return make
@@ -0,0 +1,54 @@
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, chunk_sizing
+from dataset_reader.chunk_sizing import ChunkSizer, bytes_per_row
+
+BUDGET = 40 << 20
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    return synthetic.generate(str(tmp_path_factory.mktemp('csv') / 'BA2019ID.txt'), 60000, 2019, ['BA'])
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_chunks_read_stay_within_budget(tmp_path, source, monkeypatch, pipelined):
+    peaks = []
+    observe = ChunkSizer.observe
+
+    def recording_observe(self, raw, processed):
+        # pico do chunk que acabou de ser lido, com os bytes por linha medidos nele
+        per_row = bytes_per_row(raw) * (chunk_sizing.PARSER_OVERHEAD + self.in_flight) + bytes_per_row(processed)
+        writer = self.chunk_size * bytes_per_row(processed) * (chunk_sizing.WRITER_COPIES + self.in_flight)
+        peaks.append((len(raw), len(raw) * per_row + writer))
+        observe(self, raw, processed)
+        assert self.estimated_peak <= self.memory_budget
+
+    monkeypatch.setattr(ChunkSizer, 'observe', recording_observe)
+    reader = DatasetReader()
+    reader.read_and_save_chunks(source, str(tmp_path / 'orcamento'), chunk_size=1000, memory_budget=BUDGET,
+                                pipelined=pipelined)
+
+    rows = [n for n, _ in peaks]
+    assert rows[0] == chunk_sizing.PROBE_ROWS and max(rows) > chunk_sizing.PROBE_ROWS
+    assert all(peak <= BUDGET for _, peak in peaks)
+
+    reader.read_and_save_chunks(source, str(tmp_path / 'fixo'), chunk_size=1000)
+    assert pq.read_table(tmp_path / 'orcamento').equals(pq.read_table(tmp_path / 'fixo'))
+
+
+def test_more_buffers_and_queues_mean_smaller_reads(source):
+    reader = DatasetReader()
+    plan = reader.get_read_plan(source)
+    raw = reader._read_csv(source, plan)
+    processed = reader._post_process_dataframe(raw.copy(), plan, 2019)
+
+    rows = []
+    for buffers, in_flight in ((1, 0), (1, 2), (4, 2)):
+        sizer = ChunkSizer(BUDGET, 1000, buffers=buffers, in_flight=in_flight)
+        sizer.observe(raw, processed)
+        assert sizer.estimated_peak <= BUDGET
+        rows.append(sizer.rows)
+    assert rows == sorted(rows, reverse=True) and rows[0] > rows[-1]
@@ -0,0 +1,54 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from filtering import cnae_and_cbo_manager
+from filtering.cnae_and_cbo_manager import CnaeAndCboManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(cnae_and_cbo_manager, 'CACHE_DIR', str(tmp_path / 'cache'))
+    sheet = tmp_path / 'cbo.csv'
+    sheet.write_text('codigo;titulo\n622110;Trabalhador da cultura de cana\n', encoding='latin-1')
+
+    def make():
+        class Manager(CnaeAndCboManager):
+            table = cnae_and_cbo_manager._LazyTable(str(sheet), sep=';', encoding='latin-1', dtype='str')
+        return Manager
+
+    return make
+
+
+def test_table_is_cached(manager, tmp_path, monkeypatch):
+    assert manager().table == {'622110': 'Trabalhador da cultura de cana'}
+    assert os.listdir(tmp_path / 'cache') == ['table.pkl']
+
+    monkeypatch.setattr(CnaeAndCboManager, 'generate_dict_from_spreadsheet', None)  # não lê a planilha de novo
+    assert manager().table == {'622110': 'Trabalhador da cultura de cana'}
+
+
+@pytest.mark.parametrize('content', [b'', b'lixo', pickle.dumps({'table': {}})[:-5], pickle.dumps(['outro'])])
+def test_unreadable_cache_is_rebuilt(manager, tmp_path, content):
+    os.makedirs(tmp_path / 'cache')
+    (tmp_path / 'cache' / 'table.pkl').write_bytes(content)
+
+    assert manager().table == {'622110': 'Trabalhador da cultura de cana'}
+    assert os.listdir(tmp_path / 'cache') == ['table.pkl']
+    with open(tmp_path / 'cache' / 'table.pkl', 'rb') as f:
+        assert pickle.load(f)['table'] == {'622110': 'Trabalhador da cultura de cana'}
+
+
+def test_is_cana_manual_np_reuses_the_classifier(monkeypatch):
+    cnaes = ['0113000', '0113000', '4711302', None]
+    cbos = ['622110', '411005', '622110', '622110']
+    expected = [CnaeAndCboManager.is_cana_manual(cnae, cbo) for cnae, cbo in zip(cnaes, cbos)]
+    assert expected == [True, False, False, False]
+
+    monkeypatch.setattr(cnae_and_cbo_manager, 'SectorClassifier', None)  # não é construído a cada chamada
+    for convert in (list, lambda values: np.array(values, dtype=object), pd.Categorical, pa.array):
+        assert CnaeAndCboManager.is_cana_manual_np(convert(cnaes), convert(cbos)).tolist() == expected
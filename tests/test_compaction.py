@@ -0,0 +1,22 @@
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from dataset_reader import compaction
+
+
+def test_compacted_tree_reads_states_with_different_dictionary_widths(tmp_path, make_state):
+    source = tmp_path / 'filtrados'
+    for state in ('AC', 'BA'):
+        make_state(source, 2010, state)
+    target = tmp_path / 'compactados'
+
+    assert len(compaction.compact(str(source), str(target))) == 2
+    table = compaction.open_dataset(str(target)).to_table()
+
+    assert table.num_rows == 6000
+    assert table.schema.field('Municipio').type.index_type == compaction.DICTIONARY_INDEX_TYPE
+    ba = table.filter(pc.equal(table.column('uf'), 'BA'))
+    assert ba.column('Municipio').to_pylist() == pq.read_table(source / '2010' / 'BA').column('Municipio').to_pylist()
+
+    # partições já compactadas a partir dos mesmos chunks são puladas
+    assert compaction.compact(str(source), str(target)) == []
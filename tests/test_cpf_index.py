@@ -0,0 +1,102 @@
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pytest
+
+import load_dataset_sample
+from dataset_reader import cpf_index
+
+
+@pytest.fixture
+def sorted_tree(tmp_path, make_state, monkeypatch):
+    root = tmp_path / 'filtrados'
+    # mesma semente: os mesmos trabalhadores aparecem nos dois anos
+    for year, state in ((2010, 'AC'), (2011, 'AC'), (2011, 'BA')):
+        cpf_index.sort_by_cpf(make_state(root, year, state, seed=0), row_group_size=200)
+    cpf_index.build_cpf_index(str(root))
+    monkeypatch.setattr(load_dataset_sample, 'FILTERED_DATA_DIR', root)
+    return root
+
+
+def test_sorted_chunks_are_ordered_and_indexed(sorted_tree):
+    table = pq.read_table(sorted_tree / '2010' / 'AC')
+    cpfs = table.column('Cpf').to_pylist()
+    assert cpfs == sorted(cpfs) and len(cpfs) == 3000
+
+    index = pq.read_table(sorted_tree / cpf_index.INDEX_FILE)
+    assert set(zip(index.column('year').to_pylist(), index.column('state').to_pylist())) == {
+        (2010, 'AC'), (2011, 'AC'), (2011, 'BA')}
+
+
+def test_read_cpfs_matches_full_scan_with_year_and_state(sorted_tree):
+    full = load_dataset_sample._open_filtered(None, None).to_table()
+    cpfs = full.column('Cpf').unique().to_pylist()[:20]
+    expected = full.filter(pc.is_in(full.column('Cpf'), pa.array(cpfs)))
+
+    table = cpf_index.read_cpfs(str(sorted_tree), cpfs)
+    assert table.column_names[-2:] == [cpf_index.YEAR_COLUMN, cpf_index.STATE_COLUMN]
+    assert {'year', 'uf'} <= set(table.column_names)
+
+    def key(t):
+        return sorted(zip(t.column('Cpf').to_pylist(), t.column('year').to_pylist(), t.column('uf').to_pylist(),
+                          t.column('DataAdmissao').to_pylist()))
+    assert key(table) == key(expected)
+    assert set(table.column('year').to_pylist()) == {2010, 2011}
+
+    only = cpf_index.read_cpfs(str(sorted_tree), cpfs, years=[2011], columns=['Cpf', 'uf'])
+    assert only.column_names == ['Cpf', 'uf']
+    assert len(only) == sum(1 for row in key(expected) if row[1] == 2011)
+
+
+def test_load_dataset_by_cpf_uses_index_and_keeps_origin(sorted_tree):
+    cpfs = pq.read_table(sorted_tree / '2011' / 'BA', columns=['Cpf']).column('Cpf').to_pylist()[:5]
+    df = load_dataset_sample.load_dataset(cpfs=cpfs)
+    assert set(df['Cpf']) == set(cpfs)
+    assert set(df['uf']) >= {'BA'}
+
+
+def _by_cpf(df):
+    return df.sort_values(['year', 'Cpf', 'DataAdmissao']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('case', ['unsorted', 'rewritten'])
+def test_directories_outside_the_index_are_scanned(tmp_path, make_state, monkeypatch, case):
+    root = tmp_path / 'filtrados'
+    cpf_index.sort_by_cpf(make_state(root, 2010, 'AC', seed=0), row_group_size=200)
+    if case == 'unsorted':
+        make_state(root, 2011, 'AC', seed=0)  # nunca ordenado nem indexado
+        cpf_index.build_cpf_index(str(root))
+    else:
+        cpf_index.build_cpf_index(str(root))
+        # 2010/AC é refeito depois do índice: as faixas de row groups do índice não valem mais
+        shutil.rmtree(root / '2010')
+        cpf_index.sort_by_cpf(make_state(root, 2010, 'AC', rows=2000, chunk_size=500, seed=0), row_group_size=100)
+        make_state(root, 2011, 'AC', seed=0)
+    monkeypatch.setattr(load_dataset_sample, 'FILTERED_DATA_DIR', root)
+
+    cpfs = pq.read_table(root / '2010' / 'AC', columns=['Cpf']).column('Cpf').to_pylist()[:30]
+    with_index = load_dataset_sample.load_dataset(cpfs=cpfs)
+    (root / cpf_index.INDEX_FILE).unlink()
+    without_index = load_dataset_sample.load_dataset(cpfs=cpfs)
+
+    assert set(without_index['year']) == {2010, 2011}
+    pd.testing.assert_frame_equal(_by_cpf(with_index), _by_cpf(without_index[with_index.columns]),
+                                  check_categorical=False)
+
+
+def test_load_dataset_by_cpf_respects_head(sorted_tree):
+    cpfs = pq.read_table(sorted_tree / '2011' / 'BA', columns=['Cpf']).column('Cpf').to_pylist()[:20]
+    assert len(load_dataset_sample.load_dataset(cpfs=cpfs)) > 5
+    assert len(load_dataset_sample.load_dataset(cpfs=cpfs, head=5)) == 5
+
+
+def test_no_sorted_directories_means_no_index(tmp_path, make_state):
+    root = tmp_path / 'filtrados'
+    make_state(root, 2010, 'AC')
+    (root / cpf_index.INDEX_FILE).write_bytes(b'antigo')
+
+    assert cpf_index.build_cpf_index(str(root)) is None
+    assert not cpf_index.has_cpf_index(str(root))
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, cubes
+from dataset_reader.transformations import INVALID_CENTS, INVALID_MONEY
+
+
+def _frame(salaries):
+    n = len(salaries)
+    return pd.DataFrame({
+        'Municipio': pd.Categorical(['120040'] * n),
+        'IsHomem': np.ones(n, np.int8),
+        'VinculoAtivo31/12': [True] * n,
+        'RemuneracaoMedia': salaries,
+    })
+
+
+@pytest.mark.parametrize('salaries, invalid', [
+    (np.array([1000.5, 2000.25, 0.0], np.float64), INVALID_MONEY),
+    (np.array([100050, 200025, 0], np.int64), INVALID_CENTS),
+])
+def test_invalid_salaries_are_not_summed(salaries, invalid):
+    cube = cubes.aggregate(_frame(np.append(salaries, [invalid, invalid])))
+    summary = cubes.summarize(cube, ['Municipio'])
+
+    assert summary['rows'].tolist() == [5]
+    assert summary['RemuneracaoMedia_count'].tolist() == [3]
+    assert summary['RemuneracaoMedia_sum'].tolist() == [3000.75]
+    assert summary['RemuneracaoMedia_mean'].iloc[0] == pytest.approx(1000.25)
+    # colunas ausentes no layout ficam sem valores
+    assert summary['SalarioContratual_count'].tolist() == [0]
+
+
+def test_directory_cube_equals_cube_of_saved_chunks(tmp_path):
+    source = synthetic.generate(str(tmp_path / 'BA2010ID.txt'), 4500, 2010, ['BA'])
+    output_dir = tmp_path / 'BA'
+    DatasetReader().read_and_save_chunks(source, str(output_dir), chunk_size=1000, cubes=True)
+
+    cube = pq.read_table(output_dir / cubes.CUBE_FILE)
+    expected = cubes.aggregate(pq.read_table(output_dir))
+    by = ['Municipio', 'IsHomem']
+    pd.testing.assert_frame_equal(cubes.summarize(cube, by), cubes.summarize(expected, by))
+    assert not (output_dir / cubes.PARTIALS_DIR).exists()
+    assert cubes.summarize(cube, [])['rows'].item() == 4500
@@ -0,0 +1,22 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader
+
+
+@pytest.mark.parametrize('options', [{}, {'money_cents': True}, {'integer_ids': True}],
+                         ids=['default', 'money_cents', 'integer_ids'])
+@pytest.mark.parametrize('year', [2010, 2019])  # um layout de cada
+def test_engines_save_the_same_chunks(tmp_path, options, year):
+    source = synthetic.generate(str(tmp_path / f'AC{year}ID.txt'), 3000, year, ['AC'])
+    reader = DatasetReader(**options)
+    for engine in ('pandas', 'pyarrow'):
+        reader.read_and_save_chunks(source, str(tmp_path / engine), chunk_size=1000, engine=engine)
+
+    pandas, arrow = pq.read_table(tmp_path / 'pandas'), pq.read_table(tmp_path / 'pyarrow')
+    assert arrow.schema.remove_metadata() == pandas.schema.remove_metadata()
+    pd.testing.assert_frame_equal(arrow.to_pandas(), pandas.to_pandas())
+
+    pd.testing.assert_frame_equal(reader.read(source, engine='pyarrow'), reader.read(source))
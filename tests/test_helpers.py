@@ -0,0 +1,127 @@
+import stat
+import sys
+
+import py7zr
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, manifest
+from filtering import helpers
+
+# 7z falso: "7z e -so -bd <arquivo> <bytes>:<código de saída>[:<bytes no stderr>]" escreve os bytes e sai com o
+# código. Se <arquivo> existir, escreve o conteúdo dele.
+FAKE_7Z = '''#!{python}
+import os, sys
+archive, spec = sys.argv[4], list(map(int, sys.argv[5].split(':')))
+size, code, chatter = (spec + [0])[:3]
+sys.stderr.write('.' * chatter)
+data = open(archive, 'rb').read() if os.path.exists(archive) else None
+try:
+    if data is not None:
+        sys.stdout.buffer.write(data)
+    else:
+        for _ in range(size // 65536 + 1):
+            sys.stdout.buffer.write(b'x' * min(65536, size))
+            size -= 65536
+    sys.stdout.buffer.flush()
+except BrokenPipeError:
+    sys.exit(2)
+sys.stderr.write('falhou')
+sys.exit(code)
+'''
+
+
+@pytest.fixture
+def seven_zip(tmp_path):
+    path = tmp_path / '7z'
+    path.write_text(FAKE_7Z.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_drained_stream_reports_7z_failure(seven_zip):
+    with helpers._open_with_7z_binary(seven_zip, 'RAIS.7z', '1000:0') as stream:
+        assert len(stream.read()) == 1000
+
+    # o erro sai da leitura do fim do stream, ainda dentro do with
+    with helpers._open_with_7z_binary(seven_zip, 'RAIS.7z', '1000:2') as stream:
+        assert len(stream.read(1000)) == 1000
+        with pytest.raises(RuntimeError, match='falhou'):
+            stream.read()
+
+
+def test_chatty_stderr_does_not_block(seven_zip):
+    with helpers._open_with_7z_binary(seven_zip, 'RAIS.7z', f'1000:0:{4 << 20}') as stream:
+        assert len(stream.read()) == 1000
+
+
+def test_stopping_early_is_not_an_error(seven_zip):
+    # o 7z ainda está escrevendo quando o pipe é fechado
+    with helpers._open_with_7z_binary(seven_zip, 'RAIS.7z', f'{10 << 20}:0') as stream:
+        assert stream.read(100) == b'x' * 100
+
+
+def test_reader_error_is_not_masked(seven_zip):
+    with pytest.raises(ValueError, match='leitor'):
+        with helpers._open_with_7z_binary(seven_zip, 'RAIS.7z', f'{10 << 20}:0') as stream:
+            stream.read(100)
+            raise ValueError('leitor')
+
+
+@pytest.fixture
+def archive(tmp_path):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 20000, 2010, ['AC'])
+    path = tmp_path / 'AC2010ID.7z'
+    with py7zr.SevenZipFile(path, 'w') as z:
+        z.write(source, 'AC2010ID.txt')
+    return path
+
+
+def _damaged(path, truncate):
+    data = bytearray(path.read_bytes())
+    if truncate:
+        data = data[:len(data) // 2]
+    else:
+        data[len(data) // 3:len(data) // 3 + 2] = bytes(b ^ 0xff for b in data[len(data) // 3:len(data) // 3 + 2])
+    damaged = path.with_name('damaged.7z')
+    damaged.write_bytes(data)
+    return damaged
+
+
+def test_py7zr_stream_is_complete(archive):
+    with helpers._open_with_py7zr(None, str(archive), 'AC2010ID.txt') as stream:
+        assert stream.read() == (archive.parent / 'AC2010ID.txt').read_bytes()
+
+
+@pytest.mark.parametrize('truncate', [True, False])
+def test_damaged_archive_raises_while_reading(archive, truncate):
+    with helpers._open_with_py7zr(None, str(_damaged(archive, truncate)), 'AC2010ID.txt') as stream:
+        with pytest.raises(Exception):
+            stream.read()
+
+
+@pytest.mark.parametrize('truncate', [True, False])
+def test_failing_source_leaves_manifest_incomplete(tmp_path, archive, truncate):
+    output_dir = str(tmp_path / 'AC')
+    with pytest.raises(Exception):
+        with helpers._open_with_py7zr(None, str(_damaged(archive, truncate)), 'AC2010ID.txt') as stream:
+            DatasetReader().read_and_save_chunks(stream, output_dir, chunk_size=5000, year=2010)
+
+    assert not manifest.is_complete(output_dir)
+
+
+def test_failing_7z_leaves_manifest_incomplete(tmp_path, seven_zip):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 20000, 2010, ['AC'])
+    output_dir = str(tmp_path / 'AC')
+    with pytest.raises(RuntimeError, match='falhou'):
+        with helpers._open_with_7z_binary(seven_zip, source, '0:2') as stream:
+            DatasetReader().read_and_save_chunks(stream, output_dir, chunk_size=5000, year=2010)
+
+    assert not manifest.is_complete(output_dir)
+    # os chunks completos ficam salvos para a retomada; o último, que só seria salvo no close(), não
+    assert manifest.Manifest.load(output_dir).rows == 15000
+
+    # sem a falha, a retomada completa o diretório
+    with helpers._open_with_7z_binary(seven_zip, source, '0:0') as stream:
+        DatasetReader().read_and_save_chunks(stream, output_dir, chunk_size=5000, year=2010)
+    assert manifest.is_complete(output_dir)
@@ -0,0 +1,62 @@
+import json
+import threading
+
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader
+from dataset_reader.instrumentation import Instrumentation
+
+
+def _events(log_path):
+    with open(log_path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_log_is_json_lines_with_stage_totals(tmp_path, pipelined):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 5500, 2010, ['AC'])
+    log_path = str(tmp_path / 'progresso.jsonl')
+    DatasetReader().read_and_save_chunks(source, str(tmp_path / 'AC'), chunk_size=1000, pipelined=pipelined,
+                                         instrumentation=Instrumentation(log_path))
+
+    events = _events(log_path)
+    assert events[0]['event'] == 'start' and events[-1]['event'] == 'end'
+    assert all(event['source'] == 'AC2010ID.txt' and {'time', 'pid'} <= set(event) for event in events)
+    assert events[0]['total_bytes'] == events[-1]['bytes'] > 0
+
+    stages = [event for event in events if event['event'] == 'stage']
+    writes = [event for event in stages if event['stage'] == 'write']
+    assert [event['chunk'] for event in writes] == list(range(6))
+    assert sum(event['rows'] for event in writes) == 5500
+
+    progress = [event for event in events if event['event'] == 'progress']
+    assert progress[-1]['rows'] == events[-1]['rows'] == 5500
+
+    totals = events[-1]['stages']
+    assert set(totals) == {'parse', 'post_process', 'write'}
+    for name, total in totals.items():
+        assert total == pytest.approx(sum(event['seconds'] for event in stages if event['stage'] == name))
+
+
+def test_stages_from_several_threads(tmp_path):
+    log_path = str(tmp_path / 'progresso.jsonl')
+    instrumentation = Instrumentation(log_path, 'teste')
+
+    def measure(name):
+        for _ in range(200):
+            with instrumentation.stage(name, rows=1):
+                pass
+
+    threads = [threading.Thread(target=measure, args=(f'etapa{i % 2}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    instrumentation.finish()
+
+    events = _events(log_path)
+    stages = [event for event in events if event['event'] == 'stage']
+    assert len(stages) == 1600 and events[-1]['event'] == 'end'
+    for name, total in events[-1]['stages'].items():
+        assert total == pytest.approx(sum(event['seconds'] for event in stages if event['stage'] == name))
@@ -0,0 +1,38 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import load_dataset_sample
+
+
+@pytest.fixture
+def filtered(tmp_path, make_state, monkeypatch):
+    root = tmp_path / 'filtrados'
+    for state in ('AC', 'BA'):
+        make_state(root, 2010, state)
+    monkeypatch.setattr(load_dataset_sample, 'FILTERED_DATA_DIR', root)
+    return root
+
+
+def _index_type(path, column='Municipio'):
+    return pq.read_schema(path).field(column).type.index_type
+
+
+def test_loads_state_with_wider_dictionary_than_first_file(filtered):
+    # o AC (primeiro arquivo da árvore) tem menos de 128 municípios e a BA, mais
+    assert _index_type(filtered / '2010' / 'AC' / 'chunk_0.parquet.zstd') == pa.int8()
+    assert _index_type(filtered / '2010' / 'BA' / 'chunk_0.parquet.zstd') == pa.int16()
+
+    df = load_dataset_sample.load_dataset(year=2010, state='BA')
+    expected = pq.read_table(filtered / '2010' / 'BA').column('Municipio').to_pylist()
+    assert df['Municipio'].astype(str).tolist() == expected
+    assert 'uf' not in df.columns
+
+
+def test_loads_whole_tree_and_filters(filtered):
+    df = load_dataset_sample.load_dataset()
+    assert df.groupby('uf').size().to_dict() == {'AC': 3000, 'BA': 3000}
+    assert df['Municipio'].str[:2].groupby(df['uf']).unique().to_dict() == {'AC': ['12'], 'BA': ['29']}
+
+    adults = load_dataset_sample.load_dataset(filters={'Idade': (18, None)}, columns=['Idade', 'uf'])
+    assert len(adults) == (df['Idade'] >= 18).sum()
@@ -0,0 +1,115 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader
+from dataset_reader.chunk_writer import ChunkWriter
+from dataset_reader.manifest import Manifest, is_complete
+
+
+@pytest.fixture
+def source(tmp_path):
+    return synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 5500, 2010, ['AC'])
+
+
+def _chunks(output_dir):
+    return sorted(name for name in os.listdir(output_dir) if name.startswith('chunk_'))
+
+
+def test_interrupted_run_resumes_from_last_valid_chunk(tmp_path, source, monkeypatch):
+    reader = DatasetReader()
+    reader.read_and_save_chunks(source, str(tmp_path / 'inteiro'), chunk_size=1000)
+    expected = pq.read_table(tmp_path / 'inteiro')
+
+    saved = []
+    save = ChunkWriter._save
+
+    def failing_save(self, chunk, path):
+        if len(saved) == 3:
+            raise KeyboardInterrupt
+        saved.append(path)
+        save(self, chunk, path)
+
+    output_dir = str(tmp_path / 'retomado')
+    monkeypatch.setattr(ChunkWriter, '_save', failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+
+    manifest = Manifest.load(output_dir)
+    assert len(manifest.chunks) == 3 and not manifest.complete
+    assert not is_complete(output_dir)
+
+    # o chunk 2 foi corrompido depois de registrado: a retomada começa nele
+    with open(os.path.join(output_dir, 'chunk_2.parquet.zstd'), 'r+b') as f:
+        f.seek(100)
+        f.write(b'\0' * 8)
+
+    saved.clear()
+    monkeypatch.setattr(ChunkWriter, '_save', lambda self, chunk, path: (saved.append(path), save(self, chunk, path)))
+    assert reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+
+    assert len(saved) == 4  # chunks 2 a 5
+    assert is_complete(output_dir, checksums=True)
+    assert _chunks(output_dir) == _chunks(tmp_path / 'inteiro')
+    assert pq.read_table(output_dir).equals(expected)
+
+    # completo: nada a fazer
+    assert not reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+
+
+def test_resume_skips_blank_lines_like_the_parser(tmp_path, source, monkeypatch):
+    # linhas vazias (e só com espaços) não viram linhas do DataFrame, então não contam na retomada
+    lines = open(source, 'rb').read().splitlines(keepends=True)
+    for i in range(len(lines) - 1, 0, -700):
+        lines[i:i] = [b'\n', b'  \r\n']
+    with open(source, 'wb') as f:
+        f.write(b''.join(lines))
+
+    reader = DatasetReader()
+    reader.read_and_save_chunks(source, str(tmp_path / 'inteiro'), chunk_size=1000)
+    expected = pq.read_table(tmp_path / 'inteiro')
+    assert len(expected) == 5500
+
+    save = ChunkWriter._save
+    saved = []
+
+    def failing_save(self, chunk, path):
+        if len(saved) == 3:
+            raise KeyboardInterrupt
+        saved.append(path)
+        save(self, chunk, path)
+
+    output_dir = str(tmp_path / 'retomado')
+    monkeypatch.setattr(ChunkWriter, '_save', failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+
+    monkeypatch.setattr(ChunkWriter, '_save', save)
+    assert reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+    assert pq.read_table(output_dir).equals(expected)
+
+
+def test_changed_chunk_size_rewrites_directory(tmp_path, source):
+    reader = DatasetReader()
+    output_dir = str(tmp_path / 'AC')
+    reader.read_and_save_chunks(source, output_dir, chunk_size=1000)
+    assert reader.read_and_save_chunks(source, output_dir, chunk_size=2000)
+
+    assert _chunks(output_dir) == ['chunk_0.parquet.zstd', 'chunk_1.parquet.zstd', 'chunk_2.parquet.zstd']
+    assert Manifest.load(output_dir).rows == 5500
+
+
+def test_changed_money_mode_rebuilds_complete_directory(tmp_path, source):
+    output_dir = str(tmp_path / 'AC')
+    DatasetReader().read_and_save_chunks(source, output_dir, chunk_size=1000)
+
+    cents = DatasetReader(money_cents=True)
+    assert is_complete(output_dir, options=DatasetReader().output_options)
+    assert not is_complete(output_dir, options=cents.output_options)
+
+    assert cents.read_and_save_chunks(source, output_dir, chunk_size=1000)
+    assert is_complete(output_dir, options=cents.output_options)
+    assert str(pq.read_schema(os.path.join(output_dir, 'chunk_0.parquet.zstd')).field('SalarioContratual').type) == 'int64'
+    assert str(pq.read_table(output_dir).schema.field('SalarioContratual').type) == 'int64'
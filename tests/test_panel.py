@@ -0,0 +1,47 @@
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from dataset_reader import panel
+from dataset_reader.manifest import Manifest
+
+
+def _rows(table):
+    return sorted(zip(table.column('Cpf').to_pylist(), table.column('year').to_pylist(),
+                      table.column('uf').to_pylist(), table.column('DataAdmissao').to_pylist()))
+
+
+def test_panel_groups_each_cpf_across_years(tmp_path, make_state):
+    root = tmp_path / 'filtrados'
+    tables = []
+    for year, state in ((2010, 'AC'), (2011, 'AC'), (2011, 'BA')):
+        table = pq.read_table(make_state(root, year, state, seed=0))
+        tables.append(panel._normalize(table, {'year': year, 'state': state}))
+    everything = pa.concat_tables(tables)
+    valid = everything.filter(pa.array(panel.cpf_keys(everything.column('Cpf')) != panel.INVALID_ID))
+
+    panel_root = str(tmp_path / 'painel')
+    num_buckets = panel.build_panel(str(root), panel_root, memory_budget=2 << 20, workers=1)
+    assert num_buckets > 1
+
+    seen = set()
+    total = 0
+    for bucket in range(num_buckets):
+        bucket_dir = os.path.join(panel_root, f'bucket={bucket}')
+        manifest = Manifest.load(bucket_dir)
+        if manifest is None or not manifest.chunks:
+            continue
+        table = pq.read_table(bucket_dir)
+        keys = list(zip(table.column('Cpf').to_pylist(), table.column('year').to_pylist()))
+        assert keys == sorted(keys)
+        cpfs = set(table.column('Cpf').to_pylist())
+        assert not cpfs & seen  # cada Cpf em um só bucket
+        seen |= cpfs
+        total += len(table)
+    assert total == len(valid)
+
+    cpfs = valid.column('Cpf').unique().to_pylist()[:10]
+    result = panel.read_panel(panel_root, cpfs)
+    assert _rows(result) == _rows(valid.filter(pc.is_in(valid.column('Cpf'), pa.array(cpfs))))
@@ -0,0 +1,29 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader
+from dataset_reader.manifest import Manifest, is_complete
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'pyarrow'])
+@pytest.mark.parametrize('range_size', [20_000, 400_000])  # faixas menores e maiores que um chunk
+def test_parallel_chunks_match_sequential(tmp_path, engine, range_size):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 5500, 2010, ['AC'])
+    reader = DatasetReader()
+    sequential, parallel = str(tmp_path / 'sequencial'), str(tmp_path / 'paralelo')
+    reader.read_and_save_chunks(source, sequential, chunk_size=1000, engine=engine)
+    reader.read_and_save_chunks_parallel(source, parallel, chunk_size=1000, workers=2, range_size=range_size,
+                                         engine=engine)
+
+    assert is_complete(parallel, checksums=True)
+    assert not any(name.startswith('_range_') for name in os.listdir(parallel))
+    expected = [chunk['rows'] for chunk in Manifest.load(sequential).chunks]
+    assert [chunk['rows'] for chunk in Manifest.load(parallel).chunks] == expected == [1000] * 5 + [500]
+
+    for chunk in Manifest.load(sequential).chunks:
+        table = pq.read_table(os.path.join(parallel, chunk['file']))
+        assert table.num_rows == pq.ParquetFile(os.path.join(parallel, chunk['file'])).metadata.row_group(0).num_rows
+        assert table.equals(pq.read_table(os.path.join(sequential, chunk['file'])))
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from dataset_reader import pipeline
+from dataset_reader.chunk_writer import ChunkWriter
+from dataset_reader.manifest import Manifest, is_complete
+
+
+def _frame(start, rows):
+    return pd.DataFrame({'linha': np.arange(start, start + rows), 'texto': [f'valor {i}' for i in range(rows)]})
+
+
+def _writer(output_dir, executor):
+    manifest = Manifest({'path': 'teste'}, 'plano', 1000)
+    return ChunkWriter(str(output_dir), 1000, manifest=manifest, executor=executor)
+
+
+def test_executor_saves_chunks_in_order(tmp_path, monkeypatch):
+    save = ChunkWriter._save
+    threads = set()
+
+    def slow_save(self, chunk, path):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.05 if chunk['linha'].iloc[0] == 0 else 0)  # o primeiro chunk termina por último, se puder
+        save(self, chunk, path)
+
+    monkeypatch.setattr(ChunkWriter, '_save', slow_save)
+    with pipeline.writer_executor() as executor:
+        writer = _writer(tmp_path, executor)
+        for start in range(0, 5500, 700):
+            writer.write(_frame(start, min(700, 5500 - start)))
+        writer.close()
+
+    assert threads and all(name.startswith('chunk_writer') for name in threads)
+    manifest = Manifest.load(str(tmp_path))
+    assert manifest.complete and is_complete(str(tmp_path), checksums=True)
+    assert [c['file'] for c in manifest.chunks] == [f'chunk_{i}.parquet.zstd' for i in range(6)]
+    assert [c['row_offset'] for c in manifest.chunks] == list(range(0, 6000, 1000))
+    for chunk in manifest.chunks:
+        lines = pq.read_table(tmp_path / chunk['file']).column('linha').to_pylist()
+        assert lines == list(range(chunk['row_offset'], chunk['row_offset'] + chunk['rows']))
+
+
+def test_failed_chunk_leaves_no_gap_and_close_raises(tmp_path, monkeypatch):
+    save = ChunkWriter._save
+
+    def failing_save(self, chunk, path):
+        if chunk['linha'].iloc[0] == 1000:
+            raise OSError('disco cheio')
+        save(self, chunk, path)
+
+    monkeypatch.setattr(ChunkWriter, '_save', failing_save)
+    with pipeline.writer_executor() as executor:
+        writer = _writer(tmp_path, executor)
+        # três chunks: o erro do segundo ainda está na fila e só aparece em close()
+        for start in range(0, 3000, 1000):
+            writer.write(_frame(start, 1000))
+        with pytest.raises(OSError, match='disco cheio'):
+            writer.close()
+
+    manifest = Manifest.load(str(tmp_path))
+    assert [c['file'] for c in manifest.chunks] == ['chunk_0.parquet.zstd'] and not manifest.complete
+    # o chunk seguinte ao que falhou não é salvo
+    assert not os.path.exists(tmp_path / 'chunk_2.parquet.zstd')
+
+
+def test_prefetch_reraises_producer_errors():
+    def items():
+        yield 1
+        yield 2
+        raise ValueError('produtor')
+
+    received = []
+    with pytest.raises(ValueError, match='produtor'):
+        for item in pipeline.prefetch(items()):
+            received.append(item)
+    assert received == [1, 2]
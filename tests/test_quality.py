@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, quality
+from dataset_reader.chunk_writer import ChunkWriter
+
+
+def test_merged_sketches_equal_sketch_of_all_rows():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Cpf': pd.Series(rng.integers(0, 10**11, 200_000)).astype(str).str.zfill(11),
+        'HorasContrato': rng.integers(0, 45, 200_000).astype(np.int16),
+    })
+    parts = [df[i:i + 30_000] for i in range(0, len(df), 30_000)]
+
+    whole = quality.Profile.of(df)
+    merged = quality.Profile()
+    for part in reversed(parts):  # em qualquer ordem
+        merged.merge(quality.Profile.of(part))
+
+    assert merged.rows == whole.rows == len(df)
+    for column in df.columns:
+        assert merged.columns[column]['sketch'] == whole.columns[column]['sketch']
+        true_distinct = df[column].nunique()
+        assert merged.distinct(column) == pytest.approx(true_distinct, rel=0.05)
+
+    # juntar o mesmo perfil de novo não muda os distintos (máximo dos registradores)
+    assert merged.merge(quality.Profile.of(parts[0])).distinct('Cpf') == whole.distinct('Cpf')
+
+
+def test_resumed_profile_equals_uninterrupted(tmp_path, monkeypatch):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 4500, 2010, ['AC'])
+    reader = DatasetReader()
+    reader.read_and_save_chunks(source, str(tmp_path / 'inteiro'), chunk_size=1000, profile=True)
+    expected = quality.Profile.load(str(tmp_path / 'inteiro' / quality.PROFILE_FILE))
+
+    save = ChunkWriter._save
+    calls = []
+
+    def failing_save(self, chunk, path):
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(path)
+        save(self, chunk, path)
+
+    output_dir = str(tmp_path / 'retomado')
+    monkeypatch.setattr(ChunkWriter, '_save', failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        reader.read_and_save_chunks(source, output_dir, chunk_size=1000, profile=True)
+    monkeypatch.setattr(ChunkWriter, '_save', save)
+    reader.read_and_save_chunks(source, output_dir, chunk_size=1000, profile=True)
+
+    profile = quality.Profile.load(os.path.join(output_dir, quality.PROFILE_FILE))
+    assert profile.__dict__ == expected.__dict__
+    assert profile.rows == 4500
+    # o gerador omite zeros à esquerda de parte dos CPFs
+    assert profile.columns['Cpf']['padded'] > 0
@@ -0,0 +1,46 @@
+import pickle
+
+import pandas as pd
+import pytest
+from pandas._libs.parsers import STR_NA_VALUES
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, transformations
+from dataset_reader.read_plan import NA_VALUES
+
+
+def test_na_values_are_the_pandas_defaults():
+    assert NA_VALUES == STR_NA_VALUES
+
+
+def test_plans_are_cached_by_header_and_is_homem_format(tmp_path):
+    text = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 100, 2010, ['AC'])
+    # mesmo cabeçalho, mas GENERO em números
+    df = pd.read_csv(text, sep=';', encoding='latin-1', dtype=str, keep_default_na=False)
+    df['GENERO'] = df['GENERO'].map({'MASCULINO': '1', 'FEMININO': '2'})
+    numeric = str(tmp_path / 'AC2011ID.txt')
+    df.to_csv(numeric, sep=';', encoding='latin-1', index=False)
+
+    reader = DatasetReader()
+    text_plan, numeric_plan = reader.get_read_plan(text), reader.get_read_plan(numeric)
+    assert text_plan.transformations['IsHomem'] is transformations.parse_is_homem_text
+    assert numeric_plan.transformations['IsHomem'] is transformations.parse_is_homem_numeric
+    assert reader.get_read_plan(text) is text_plan
+
+    expected = (df['GENERO'] == '1').tolist()
+    assert (reader.read(text)['IsHomem'] == 1).tolist() == expected
+    assert (reader.read(numeric)['IsHomem'] == 1).tolist() == expected
+
+
+def test_plan_is_read_only_and_picklable(tmp_path):
+    source = synthetic.generate(str(tmp_path / 'AC2010ID.txt'), 10, 2010, ['AC'])
+    plan = DatasetReader().get_read_plan(source)
+    with pytest.raises(TypeError):
+        plan.rename_map['CPF'] = 'Outro'
+    with pytest.raises(TypeError):
+        plan.transformations['Cpf'] = str
+
+    copy = pickle.loads(pickle.dumps(plan))
+    assert copy.fingerprint == plan.fingerprint
+    with pytest.raises(TypeError):
+        copy.dtypes['CPF'] = str
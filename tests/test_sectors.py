@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dataset_reader.sectors import NO_SECTOR, Sector, SectorClassifier
+
+CLASSIFIER = SectorClassifier([
+    Sector('saude', cnaes=['8610101', '8610102']),
+    Sector('medicos', cnaes=['8610101'], cbos=['225125']),
+    Sector('ti', cbos=['212405']),
+])
+
+DATA = pd.DataFrame({
+    'CnaeSubclasse20': pd.Categorical(['8610101', '8610101', '4711302', '4711302', None, '8610102']),
+    'CboOcupacao2002': pd.Categorical(['225125', '212405', '212405', '411005', '411005', None]),
+})
+
+
+def test_label_first_sector_and_no_sector():
+    labels = CLASSIFIER.label(DATA)
+
+    assert list(labels.categories) == ['saude', 'medicos', 'ti']
+    assert labels.codes.tolist() == [0, 0, 2, NO_SECTOR, NO_SECTOR, 0]
+    assert labels.isna().tolist() == [False, False, False, True, True, False]
+
+
+def test_label_arrow_matches_pandas():
+    table = pa.Table.from_pandas(DATA, preserve_index=False)
+    assert CLASSIFIER.label(table).codes.tolist() == CLASSIFIER.label(DATA).codes.tolist()
+
+
+def test_label_without_any_sector():
+    labels = CLASSIFIER.label(DATA.iloc[3:5])
+    assert (labels.codes == NO_SECTOR).all()
+    assert len(CLASSIFIER.label(DATA.iloc[:0])) == 0
+
+
+def test_matches():
+    assert CLASSIFIER.matches(DATA, 'medicos').tolist() == [True, False, False, False, False, False]
+    assert np.array_equal(CLASSIFIER.matches(DATA, 'ti'), [False, True, True, False, False, False])
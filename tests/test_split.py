@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from benchmarks import synthetic
+from dataset_reader import DatasetReader, SplitChunkWriter
+from dataset_reader.manifest import Manifest, is_complete
+
+STATES = ['BA', 'PE', 'SE']
+
+
+def test_region_file_is_split_into_states_in_one_pass(tmp_path):
+    source = synthetic.generate(str(tmp_path / 'NORDESTE2019ID.txt'), 5000, 2019, STATES)
+    city_to_state = synthetic.city_codes(STATES)
+    reader = DatasetReader()
+
+    writer = SplitChunkWriter(str(tmp_path), 700)
+    keys = reader.read_and_save_split_chunks(
+        source, str(tmp_path), split_by=lambda df: df['Municipio'].astype(str).map(city_to_state),
+        chunk_size=700, skip_keys={'SE'}, writer=writer)
+
+    assert sorted(keys) == ['BA', 'PE']
+    assert not os.path.exists(tmp_path / 'SE')
+
+    expected = reader.read(source)
+    expected_state = expected['Municipio'].astype(str).map(city_to_state)
+    for state in keys:
+        state_dir = str(tmp_path / state)
+        assert is_complete(state_dir, checksums=True)
+        manifest = Manifest.load(state_dir)
+        assert all(chunk['rows'] == 700 for chunk in manifest.chunks[:-1])
+
+        saved = pq.read_table(state_dir).to_pandas()
+        rows = expected[expected_state == state].reset_index(drop=True)
+        assert len(saved) == manifest.rows == len(rows)
+        # mesma ordem de linhas do arquivo original
+        assert saved['Cpf'].tolist() == rows['Cpf'].tolist()
+        pd.testing.assert_series_equal(saved['DataAdmissao'], rows['DataAdmissao'], check_dtype=False)
@@ -0,0 +1,116 @@
+'''
+Equivalência entre os converters por célula do pd.read_csv (versão anterior do DatasetReader, copiados
+abaixo) e as transformações vetorizadas de dataset_reader/transformations.py, nos mesmos valores crus.
+'''
+
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_reader import transformations
+from dataset_reader.transformations import DATE_FORMAT
+
+
+def old_parse_money(x):
+    x = x.replace(',', '.', 1)
+    try:
+        x = np.float32(x)
+    except (ValueError, OverflowError):
+        x = -1
+
+    if x == np.inf:
+        x = -1
+
+    return x
+
+
+def old_cpf(x):
+    return re.sub(r'\D', '', str(x)).zfill(11)
+
+
+def old_digits(x):
+    return re.sub(r'\D', '', str(x))
+
+
+def old_is_homem_numeric(x):
+    return 0 if int(x) == 2 else int(x)
+
+
+def old_is_homem_text(val):
+    val = val.strip()[0].upper()
+    if val == 'M':
+        return 1
+    if val == 'F':
+        return 0
+    return -1
+
+
+def old_calculate_age(birthdate: pd.Series, relative_to: pd.Timestamp):
+    birth = pd.to_datetime(birthdate, errors='coerce', format=DATE_FORMAT)
+    birth = birth.fillna(
+        pd.to_datetime('01' + birthdate.str[2:], format=DATE_FORMAT, errors='coerce') + pd.offsets.MonthEnd(0)
+    )
+    has_had_birthday = (relative_to.month > birth.dt.month) | ((relative_to.month == birth.dt.month) & (relative_to.day >= birth.dt.day))
+    return relative_to.year - birth.dt.year - (~has_had_birthday)
+
+
+MONEY = ['1234,56', '0000001234,50', '0,99', ',5', '7,', '0', '', '-1', '-1,00', ' 12,3 ', '+7,25', '1.5',
+         '1,2,3', 'abc', 'nan', 'NaN', 'inf', '-inf', '1e40', '3,4e38', '1_0', '99999999999,99', '12,345']
+CPFS = ['12345678909', '2345678909', '123.456.789-09', '', '00012345678', 'abc', ' 1 ']
+CODES = ['0113000', '01.13-0/00', '6201-5', '', 'x']
+DATES = ['01012015', '1012015', '31122015', '31022015', '29022016', '', '00000000', 'abc', '1312015']
+BIRTHDATES = ['01011990', '1011990', '31121990', '31021990', '29022000', '15071980', '30062001']
+
+
+def _series(values):
+    return pd.Series(values, dtype=object)
+
+
+def test_money_matches_old_converter():
+    with np.errstate(over='ignore'):
+        expected = np.array([old_parse_money(x) for x in MONEY], np.float32).astype(np.float64)
+    result = transformations.parse_money(_series(MONEY)).to_numpy()
+    np.testing.assert_array_equal(result, expected)
+    # o sentinela é o mesmo do converter antigo
+    assert result[MONEY.index('')] == transformations.INVALID_MONEY
+    assert result[MONEY.index('1e40')] == transformations.INVALID_MONEY
+
+
+def test_money_cents_matches_scalar_and_float_values():
+    result = transformations.parse_money_cents(_series(MONEY)).to_numpy()
+    expected = np.array([transformations.parse_money_cents_value(x) for x in MONEY], np.int64)
+    np.testing.assert_array_equal(result, expected)
+
+    # onde o valor em float é exato, os centavos são o mesmo valor
+    for text, cents, value in zip(MONEY, result, transformations.parse_money(_series(MONEY))):
+        if cents != transformations.INVALID_CENTS and np.isfinite(value) and abs(value) < 1e6:
+            assert cents == pytest.approx(value * 100, abs=1)
+    assert result[MONEY.index('')] == transformations.INVALID_CENTS
+    assert result[MONEY.index('1234,56')] == 123456
+    assert result[MONEY.index('12,345')] == 1235
+
+
+@pytest.mark.parametrize('old, new, values', [
+    (old_cpf, transformations.parse_cpf, CPFS),
+    (old_digits, transformations.only_digits, CODES),
+    (old_is_homem_numeric, transformations.parse_is_homem_numeric, ['1', '2', '-1', ' 2 ']),
+    (old_is_homem_text, transformations.parse_is_homem_text, ['M', 'F', 'Masculino', ' feminino', 'X', 'I']),
+])
+def test_vectorized_matches_old_converter(old, new, values):
+    assert new(_series(values)).tolist() == [old(x) for x in values]
+
+
+def test_dates_match_old_parse():
+    values = _series(DATES)
+    expected = pd.to_datetime(values.str.zfill(8), errors='coerce', format=DATE_FORMAT)
+    pd.testing.assert_series_equal(transformations.parse_date(values), expected, check_names=False)
+
+
+def test_age_matches_old_calculation():
+    relative_to = pd.Timestamp(year=2015, month=12, day=31, hour=23, minute=59, second=59)
+    values = _series(BIRTHDATES * 3)
+    expected = old_calculate_age(values.str.zfill(8), relative_to).astype(np.int8)
+    result = transformations.calculate_age(values, relative_to).astype(np.int8)
+    assert result.tolist() == expected.tolist()